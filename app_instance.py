@@ -1,3 +1,10 @@
 from fastapi import FastAPI
+from utils.metrics import MetricsMiddleware
+from utils.query_stats import QueryStatsMiddleware
+from utils.serialization import MongoJSONResponse
 
-app = FastAPI()
+app = FastAPI(default_response_class=MongoJSONResponse)
+# Per-route latency, status codes and in-flight requests for /metrics
+app.add_middleware(MetricsMiddleware)
+# MongoDB commands per request, query budget warnings and X-DB-* debug headers
+app.add_middleware(QueryStatsMiddleware)
@@ -0,0 +1,378 @@
+"""Deterministic synthetic Patient360 datasets for load tests and benchmarks.
+
+Documents are generated in the shape patients are registered with:
+an embedded medications map (vitals, Diet/Exercise/Routine plans,
+meeting_details), one meeting history document per patient and the
+doctors they reference. --prepare then runs the readings migration and
+backfills, giving the layout the API serves. History lengths are skewed (log-normal): most
+patients have a few readings, a long tail has hundreds.
+
+Patients are generated one at a time and written in bounded batches, so
+memory use does not grow with --patients. The same --seed and
+--reference-date always produce the same documents.
+
+Usage:
+    python -m benchmarks.dataset --patients 100000 --seed 7                # into the .env database
+    python -m benchmarks.dataset --patients 100000 --prepare --drop        # ... then migrate/backfill like manage.py
+    python -m benchmarks.dataset --patients 10000000 --ndjson data/        # doctors/patients/meeting_history.ndjson
+"""
+import argparse
+import bisect
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+DOCTOR_SPECIALISATIONS = ["Cardiology", "Neurology", "Psychology", "Nutrition", "Physiotherapy", "Endocrinology"]
+DOCTOR_SURNAMES = ["Rao", "Shah", "Iyer", "Das", "Menon", "Khan", "Gupta", "Nair", "Reddy", "Bose"]
+THERAPIES = ["Psychology", "Speech & Language Therapy", "Occupational Therapy", "Music Therapy", "Continuous Education", "Nutrition"]
+PLAN_TYPES = ["Diet", "Exercise", "Routine"]
+PLAN_ITEMS = {
+    "Diet": ["Low salt meals", "Oats breakfast", "No sugar after 6pm", "Two fruits", "Green salad", "Dal and rice"],
+    "Exercise": ["Walk 30 min", "Yoga 20 min", "Stretching", "Cycling 15 min", "Breathing exercises", "Rest day"],
+    "Routine": ["Sleep by 11pm", "Meditate 10 min", "Check BP in the morning", "Drink 3L water", "Screen-free hour"],
+}
+
+# Patients register up to this long before the reference date
+HISTORY_DAYS = 730
+# Spread of the per-patient history lengths (sigma of the log-normal)
+HISTORY_SKEW = 1.2
+# Share of readings that come with a booked meeting
+MEETING_SHARE = 0.3
+# Share of readings after which the care plans are rewritten (otherwise the previous plans carry over)
+PLAN_CHANGE_SHARE = 0.2
+
+# A write batch is flushed at this many documents or embedded entries, whichever comes first
+BATCH_SIZE = 1000
+BATCH_MAX_ENTRIES = 50000
+PROGRESS_EVERY = 100000
+
+
+# ---------------- GENERATION ----------------
+
+def skewed_count(rng, mean: float, maximum: int, minimum: int = 0):
+    """Log-normal count with the given mean, clamped to [minimum, maximum]."""
+    if mean <= 0:
+        return minimum
+    mu = math.log(mean) - HISTORY_SKEW ** 2 / 2
+    return max(minimum, min(maximum, int(round(rng.lognormvariate(mu, HISTORY_SKEW)))))
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, int(round(value))))
+
+
+def _plan(rng, plan_type: str, days: int = 7):
+    return {f"DAY{day}": rng.choice(PLAN_ITEMS[plan_type]) for day in range(1, days + 1)}
+
+
+def doctor_documents(count: int, seed: int = 0):
+    rng = random.Random(f"doctors-{seed}")
+    return [
+        {
+            "doctor_id": f"D{index:05d}",
+            "name": f"Dr. {rng.choice(DOCTOR_SURNAMES)} {index}",
+            "specialisation": rng.choice(DOCTOR_SPECIALISATIONS),
+        }
+        for index in range(1, count + 1)
+    ]
+
+
+def _plans(rng):
+    return {f"{plan_type}_PLAN": _plan(rng, plan_type) for plan_type in PLAN_TYPES}
+
+
+def medication_record(rng, at: datetime, risk: float, age: int, plans: dict, pick_doctor):
+    """One medications entry with vitals formatted as the mobile app sends them.
+
+    Vitals drift with the patient's baseline risk so risk bands and trends look real.
+    """
+    systolic = _clamp(112 + risk * 0.45 + rng.gauss(0, 8), 90, 200)
+    record = {
+        "time": at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "heartrate": f"{_clamp(68 + risk * 0.3 + rng.gauss(0, 8), 45, 160)} bpm",
+        "SpO2": f"{_clamp(98.5 - risk * 0.06 + rng.gauss(0, 1), 80, 100)}%",
+        "bp": f"{systolic}/{_clamp(systolic * 0.63 + rng.gauss(0, 5), 50, 130)}",
+        "Stress": str(_clamp(risk / 12 + rng.gauss(0, 1.5), 0, 10)),
+        "riskrate": _clamp(risk + rng.gauss(0, 8), 0, 100),
+        "Respiratoryrate": str(_clamp(15 + risk * 0.05 + rng.gauss(0, 2), 10, 35)),
+        "age": age,
+        "type": rng.choice(PLAN_TYPES),
+        **plans,
+    }
+    if rng.random() < MEETING_SHARE:
+        meeting_at = (at + timedelta(days=rng.randint(1, 14))).replace(hour=rng.randint(9, 17), minute=0, second=0)
+        record["meeting_details"] = {
+            "doctor_id": pick_doctor(rng),
+            "meeting_datetime": meeting_at.strftime("%Y-%m-%dT%H:%M:%S"),
+            "therapy": rng.choice(THERAPIES),
+            "therapy_mode": rng.choice(["online", "offline"]),
+        }
+    return record
+
+
+def patient_document(patientid: int, rng, now: datetime, readings: int, pick_doctor):
+    registered = now - timedelta(days=rng.randint(1, HISTORY_DAYS), minutes=rng.randint(0, 1439))
+    # Baseline risk: most patients low, a tail of high-risk ones
+    risk = rng.betavariate(2, 5) * 100
+    age = rng.randint(18, 90)
+    span = (now - registered).total_seconds()
+    plans = _plans(rng)
+    medications = {}
+    for at in sorted(registered + timedelta(seconds=rng.uniform(0, span)) for _ in range(readings)):
+        if rng.random() < PLAN_CHANGE_SHARE:
+            plans = _plans(rng)
+        medications[at.strftime("%Y%m%d%H%M%S%f")] = medication_record(rng, at, risk, age, plans, pick_doctor)
+    return {
+        "patientid": patientid,
+        "name": f"Patient {patientid}",
+        "gender": rng.choice(["M", "F"]),
+        "age": age,
+        "mobileno": f"91{7000000000 + patientid * 7919 % 2999999999}",
+        "email": f"patient{patientid}@example.com",
+        "weight": rng.randint(45, 110),
+        "bp": f"{_clamp(110 + risk * 0.4, 90, 190)}/{_clamp(72 + risk * 0.2, 50, 120)}",
+        "heartrate": _clamp(68 + risk * 0.3, 45, 150),
+        "fasting_sugar": _clamp(85 + risk * 0.9 + rng.gauss(0, 10), 60, 300),
+        "registered_at": registered.strftime("%Y-%m-%dT%H:%M:%S"),
+        "medications": medications,
+    }
+
+
+def meeting_history_document(patientid: int, rng, now: datetime, meetings: int, pick_doctor):
+    details = []
+    for _ in range(meetings):
+        at = (now + timedelta(days=rng.randint(-365, 60))).replace(hour=rng.randint(9, 17), minute=0, second=0, microsecond=0)
+        details.append({
+            "meeting_link": f"https://meet.google.com/syn-{patientid}-{len(details)}",
+            "meeting_datetime": at.strftime("%Y-%m-%dT%H:%M:%S"),
+            "scheduled_at": (at - timedelta(days=rng.randint(1, 20))).isoformat(),
+            "therapy": rng.choice(THERAPIES),
+            "therapy_mode": rng.choice(["online", "offline"]),
+            "doctor_id": pick_doctor(rng),
+            "email_sent": True,
+        })
+    return {"patient_id": patientid, "meeting_details": details}
+
+
+def generate(patients: int, doctors: int, readings_per_patient: float, meetings_per_patient: float,
+             seed: int = 0, now: datetime = None, max_readings: int = 2000, max_meetings: int = 200):
+    """Yield (kind, document) pairs: doctors first, then each patient with its meeting history.
+
+    Every patient has its own random stream, so its documents depend only on
+    (seed, patientid, now) and not on how many patients come before it.
+    """
+    now = now or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    doctor_docs = doctor_documents(doctors, seed)
+    doctor_ids = [doctor["doctor_id"] for doctor in doctor_docs]
+    # Zipf-like popularity: a few doctors take most of the bookings
+    cumulative, total = [], 0.0
+    for rank in range(1, len(doctor_ids) + 1):
+        total += 1 / rank
+        cumulative.append(total)
+
+    def pick_doctor(rng):
+        return doctor_ids[min(bisect.bisect(cumulative, rng.random() * total), len(doctor_ids) - 1)]
+
+    for doctor in doctor_docs:
+        yield "doctor", doctor
+    for patientid in range(1, patients + 1):
+        rng = random.Random(f"patient-{seed}-{patientid}")
+        readings = skewed_count(rng, readings_per_patient, max_readings, minimum=1)
+        yield "patient", patient_document(patientid, rng, now, readings, pick_doctor)
+        meetings = skewed_count(rng, meetings_per_patient, max_meetings)
+        yield "meeting_history", meeting_history_document(patientid, rng, now, meetings, pick_doctor)
+
+
+def _entries(kind: str, document: dict):
+    if kind == "patient":
+        return 1 + len(document["medications"])
+    if kind == "meeting_history":
+        return 1 + len(document["meeting_details"])
+    return 1
+
+
+# ---------------- OUTPUT ----------------
+
+class MongoWriter:
+    """Bulk inserts per collection, flushed together so a batch never outgrows BATCH_MAX_ENTRIES."""
+
+    def __init__(self, collections: dict):
+        self.collections = collections
+        self.batches = {kind: [] for kind in collections}
+        self.entries = 0
+
+    def add(self, kind: str, document: dict):
+        self.batches[kind].append(document)
+        self.entries += _entries(kind, document)
+        if len(self.batches[kind]) >= BATCH_SIZE or self.entries >= BATCH_MAX_ENTRIES:
+            self.flush()
+
+    def flush(self):
+        for kind, batch in self.batches.items():
+            if batch:
+                self.collections[kind].insert_many(batch, ordered=False)
+                batch.clear()
+        self.entries = 0
+
+    def close(self):
+        self.flush()
+
+
+class NdjsonWriter:
+    """One <kind>.ndjson file per document kind in a directory."""
+
+    FILES = {"doctor": "doctors.ndjson", "patient": "patients.ndjson", "meeting_history": "meeting_history.ndjson"}
+
+    def __init__(self, directory: str):
+        from utils.serialization import dumps
+
+        self.dumps = dumps
+        os.makedirs(directory, exist_ok=True)
+        self.files = {kind: open(os.path.join(directory, name), "wb") for kind, name in self.FILES.items()}
+
+    def add(self, kind: str, document: dict):
+        self.files[kind].write(self.dumps(document) + b"\n")
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def write(writer, **options):
+    """Stream a generated dataset into writer; returns document counts per kind."""
+    counts = {"doctor": 0, "patient": 0, "meeting_history": 0, "readings": 0}
+    started = time.perf_counter()
+    try:
+        for kind, document in generate(**options):
+            writer.add(kind, document)
+            counts[kind] += 1
+            if kind == "patient":
+                counts["readings"] += len(document["medications"])
+                if counts["patient"] % PROGRESS_EVERY == 0:
+                    rate = counts["patient"] / (time.perf_counter() - started)
+                    print(f"✅ {counts['patient']} patients ({counts['readings']} readings, {rate:.0f} patients/s)")
+    finally:
+        writer.close()
+    return counts
+
+
+def mongo_writer():
+    from utils import db as app_db
+
+    return MongoWriter({
+        "doctor": app_db.doctors_collection,
+        "patient": app_db.collection,
+        "meeting_history": app_db.meeting_history_collection,
+    })
+
+
+def drop_collections():
+    """Drop every collection the API uses, derived ones included, so no stale readings survive."""
+    from utils import db as app_db
+
+    for target in (app_db.collection, app_db.readings_collection, app_db.meeting_history_collection,
+                   app_db.appointments_collection, app_db.doctors_collection, app_db.dashboard_collection,
+                   app_db.stats_collection, app_db.appointment_entries_collection, app_db.outbox_collection,
+                   app_db.booking_locks_collection):
+        target.drop()
+
+
+def prepare_database():
+    """Run the migrations/backfills from manage.py so the API serves the generated data as it would a migrated deployment."""
+    from utils.db import ensure_indexes
+    from utils.appointments import backfill_appointment_entries, backfill_meeting_at
+    from patient.readings import migrate_embedded_medications
+    from patient.records import backfill_patient_summaries, backfill_registered_on
+    from patient.dashboard_store import rebuild_dashboards
+    from patient.stats import rebuild_stats
+
+    ensure_indexes()
+    migrate_embedded_medications(drop_embedded=True)
+    backfill_registered_on()
+    backfill_patient_summaries()
+    backfill_meeting_at()
+    backfill_appointment_entries()
+    rebuild_dashboards()
+    rebuild_stats()
+
+
+def load_dataset(**options):
+    """Insert a generated dataset into the configured database and prepare it for the API."""
+    counts = write(mongo_writer(), **options)
+    prepare_database()
+    return counts
+
+
+# ---------------- CLI ----------------
+
+def add_dataset_arguments(parser):
+    data = parser.add_argument_group("dataset")
+    data.add_argument("--patients", type=int, default=1000)
+    data.add_argument("--doctors", type=int, default=50)
+    data.add_argument("--readings", type=float, default=20, help="Mean readings per patient (log-normal, at least 1)")
+    data.add_argument("--max-readings", type=int, default=2000)
+    data.add_argument("--meetings", type=float, default=5, help="Mean history meetings per patient (log-normal)")
+    data.add_argument("--max-meetings", type=int, default=200)
+    data.add_argument("--seed", type=int, default=0)
+    data.add_argument("--reference-date", type=datetime.fromisoformat,
+                      default=datetime.now().replace(hour=0, minute=0, second=0, microsecond=0),
+                      help="Histories end at this date (default: today; pin it to reproduce a dataset exactly)")
+    return data
+
+
+def dataset_options(args):
+    return {
+        "patients": args.patients,
+        "doctors": args.doctors,
+        "readings_per_patient": args.readings,
+        "meetings_per_patient": args.meetings,
+        "seed": args.seed,
+        "now": args.reference_date,
+        "max_readings": args.max_readings,
+        "max_meetings": args.max_meetings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_dataset_arguments(parser)
+    output = parser.add_argument_group("output")
+    output.add_argument("--ndjson", metavar="DIR", help="Write NDJSON files here instead of inserting into MongoDB")
+    output.add_argument("--mongo-uri", help="Overrides MONGODB_CONNECTION_STRING")
+    output.add_argument("--database", help="Overrides DATABASE_NAME")
+    output.add_argument("--drop", action="store_true", help="Drop the API's collections (patients, readings, history, dashboards, ...) first")
+    output.add_argument("--prepare", action="store_true", help="Migrate readings and rebuild summaries/dashboards/stats afterwards")
+    args = parser.parse_args()
+
+    print(f"✅ Reference date {args.reference_date.isoformat()}, seed {args.seed}")
+    started = time.perf_counter()
+    if args.ndjson:
+        counts = write(NdjsonWriter(args.ndjson), **dataset_options(args))
+        print(f"✅ Dataset written to {args.ndjson} in {time.perf_counter() - started:.1f}s: {counts}")
+        return
+
+    # utils.db reads its configuration at import time
+    if args.mongo_uri:
+        os.environ["MONGODB_CONNECTION_STRING"] = args.mongo_uri
+    if args.database:
+        os.environ["DATABASE_NAME"] = args.database
+    writer = mongo_writer()
+    if args.drop:
+        drop_collections()
+    for target in writer.collections.values():
+        if target.estimated_document_count():
+            raise SystemExit(f"❌ Collection {target.name} is not empty; pass --drop to replace its documents")
+
+    counts = write(writer, **dataset_options(args))
+    print(f"✅ Dataset inserted in {time.perf_counter() - started:.1f}s: {counts}")
+    if args.prepare:
+        prepare_database()
+        print(f"✅ Database prepared for the API in {time.perf_counter() - started:.1f}s")
+    else:
+        print("⚠️ Run with --prepare (or manage.py migrate-readings --drop-embedded and the backfills) before serving it")
+
+
+if __name__ == "__main__":
+    main()
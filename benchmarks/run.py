@@ -0,0 +1,376 @@
+"""API benchmark: latency percentiles, throughput and peak RSS per route.
+
+Starts a throwaway mongod (single-node replica set, so the transactional
+booking paths run as in production), seeds it with a generated dataset,
+then drives the FastAPI app in-process over ASGI and compares the results
+against a stored baseline. MongoDB commands per request are read from the
+X-DB-* debug headers, so a query that moves into a loop (N+1) shows up as
+a regression too.
+
+Usage:
+    python -m benchmarks.run --patients 1000 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --patients 1000 --baseline benchmarks/baseline.json
+
+Use --mongo-uri to benchmark against an existing server instead; the
+benchmark database is only seeded when it is empty (--drop reseeds it).
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.dataset import add_dataset_arguments, dataset_options
+
+BENCH_DATABASE = "p360_bench"
+# Collection names the API reads from the environment (no defaults in utils.db)
+BENCH_COLLECTIONS = {
+    "COLLECTION_NAME": "patients",
+    "HISTORY_COLLECTION": "meeting_history",
+    "APPOINTMENTS_COLLECTION": "appointments",
+    "DOCTORS_COLLECTION": "doctors",
+    "DASHBOARD_COLLECTION": "patient_dashboards",
+}
+# Result fields compared against the baseline; True when higher is worse
+COMPARED_METRICS = {
+    "p50_ms": True, "p95_ms": True, "p99_ms": True, "throughput_rps": False, "peak_rss_mb": True,
+    # A jump here usually means a query moved into a loop (N+1)
+    "db_queries_per_request": True,
+}
+
+
+# ---------------- LOCAL MONGOD ----------------
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalMongod:
+    """A mongod on a temporary dbpath, removed again on exit."""
+
+    def __init__(self, binary: str = "mongod"):
+        self.binary = binary
+        self.port = _free_port()
+        self.dbpath = None
+        self.process = None
+
+    @property
+    def uri(self):
+        return f"mongodb://127.0.0.1:{self.port}/?replicaSet=bench&directConnection=true"
+
+    def __enter__(self):
+        from pymongo import MongoClient
+        from pymongo.errors import PyMongoError
+
+        if shutil.which(self.binary) is None:
+            raise SystemExit(f"❌ {self.binary} not found; install MongoDB or pass --mongo-uri")
+        self.dbpath = tempfile.mkdtemp(prefix="p360-bench-")
+        self.process = subprocess.Popen(
+            [self.binary, "--dbpath", self.dbpath, "--port", str(self.port), "--bind_ip", "127.0.0.1",
+             "--replSet", "bench", "--logpath", os.path.join(self.dbpath, "mongod.log")],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        client = MongoClient(self.uri, serverSelectionTimeoutMS=1000)
+        deadline = time.monotonic() + 60
+        initiated = False
+        while True:
+            try:
+                if not initiated:
+                    client.admin.command("replSetInitiate", {"_id": "bench", "members": [{"_id": 0, "host": f"127.0.0.1:{self.port}"}]})
+                    initiated = True
+                if client.admin.command("hello").get("isWritablePrimary"):
+                    break
+            except PyMongoError:
+                pass
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.__exit__(None, None, None)
+                raise SystemExit("❌ mongod did not start; see its log for details")
+            time.sleep(0.2)
+        client.close()
+        print(f"✅ mongod started on port {self.port}")
+        return self.uri
+
+    def __exit__(self, *exc):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.dbpath:
+            shutil.rmtree(self.dbpath, ignore_errors=True)
+
+
+# ---------------- MEASUREMENT ----------------
+
+def percentile(sorted_values: list, q: float):
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS mark (Linux); returns False where that is unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Process lifetime peak: KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run_scenario(client, item: dict, ctx, requests: int, concurrency: int, warmup: int):
+    """Issue requests with up to concurrency in flight; returns the route's result dict."""
+    def issue():
+        spec = item["build"](ctx)
+        return client.request(item["method"], spec.get("url", item["path"]), params=spec.get("params"), json=spec.get("json"))
+
+    for _ in range(warmup):
+        await issue()
+
+    latencies, statuses = [], {}
+    errors = []
+    queries, documents = [], []
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await issue()
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            # X-DB-* headers are sent in DB_QUERY_DEBUG mode
+            if "x-db-queries" in response.headers:
+                queries.append(int(response.headers["x-db-queries"]))
+                documents.append(int(response.headers["x-db-documents"]))
+            if response.status_code not in item["expect"] and len(errors) < 3:
+                errors.append(f"{response.status_code}: {response.text[:200]}")
+
+    rss_reset = reset_peak_rss()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if status not in item["expect"]),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "max_ms": round(latencies[-1], 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_scope": "route" if rss_reset else "process",
+        "db_queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+        "db_queries_max": max(queries) if queries else None,
+        "db_documents_per_request": round(sum(documents) / len(documents), 2) if documents else None,
+        "sample_errors": errors,
+    }
+
+
+# ---------------- BASELINE ----------------
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Regressions beyond tolerance (a fraction) between two result files, as printable lines."""
+    regressions = []
+    for name, current in results["routes"].items():
+        previous = baseline.get("routes", {}).get(name)
+        if not previous:
+            continue
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+        for metric, higher_is_worse in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change > tolerance) if higher_is_worse else (change < -tolerance):
+                regressions.append(f"{name}: {metric} {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def print_table(results: dict, baseline: dict = None):
+    print(f"\n{'route':<62} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>9} {'rss MB':>8} {'q/req':>7} {'err':>5}")
+    for name, row in results["routes"].items():
+        line = (f"{name:<62} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+                f"{row['throughput_rps']:>9.1f} {row['peak_rss_mb']:>8.1f} {row['db_queries_per_request'] or 0:>7.1f} {row['errors']:>5}")
+        previous = (baseline or {}).get("routes", {}).get(name)
+        if previous and previous.get("p95_ms"):
+            line += f"  p95 {(row['p95_ms'] - previous['p95_ms']) / previous['p95_ms']:+.0%}"
+        print(line)
+    for name, reason in results["skipped"].items():
+        print(f"{name:<62} skipped: {reason}")
+
+
+# ---------------- RUNNER ----------------
+
+def configure_environment(args, mongo_uri: str):
+    """Point the API at the benchmark database; must run before any app module is imported."""
+    os.environ["MONGODB_CONNECTION_STRING"] = mongo_uri
+    os.environ["DATABASE_NAME"] = args.database
+    for name, default in BENCH_COLLECTIONS.items():
+        os.environ.setdefault(name, default)
+    # Outbox jobs (Meet links, emails) stay pending instead of calling Google/SMTP
+    os.environ["OUTBOX_WORKERS"] = "0"
+    # X-DB-* headers give the MongoDB commands per request
+    os.environ.setdefault("DB_QUERY_DEBUG", "1")
+    os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(max(50, args.concurrency * 2)))
+
+
+def seed_database(args):
+    from utils.db import db
+    from benchmarks.dataset import load_dataset
+
+    if db.list_collection_names():
+        if not args.drop:
+            print(f"✅ Database {args.database} already has data; benchmarking it as is (pass --drop to reseed)")
+            return None
+        db.client.drop_database(args.database)
+
+    started = time.perf_counter()
+    counts = load_dataset(**dataset_options(args))
+    print(f"✅ Dataset seeded in {time.perf_counter() - started:.1f}s: {counts}")
+    return counts
+
+
+async def benchmark(args):
+    import httpx
+    from main import app
+    from utils.db import collection, db
+    from benchmarks.scenarios import SCENARIOS, EXTERNAL, WRITE, BenchContext, prepare, uncovered_routes
+
+    for method, path in uncovered_routes(app):
+        print(f"⚠️ No benchmark scenario for {method} {path}")
+
+    # Seeded patient ids are 1..n; earlier runs' registrations continue after them
+    last = collection.find_one({"patientid": {"$ne": None}}, {"_id": 0, "patientid": 1}, sort=[("patientid", -1)])
+    ctx = BenchContext(last["patientid"] if last else 0, args.reference_date, args.seed)
+
+    results = {
+        "meta": {
+            "started_at": datetime.now().isoformat(),
+            "dataset": {key: getattr(args, key) for key in ("patients", "doctors", "readings", "max_readings", "meetings", "max_meetings", "seed")},
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mongodb": db.client.server_info().get("version"),
+        },
+        "routes": {},
+        "skipped": {},
+    }
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            await prepare(client, ctx)
+            for item in SCENARIOS:
+                name = item["name"]
+                if args.routes and not any(pattern in name for pattern in args.routes):
+                    continue
+                if item["kind"] == EXTERNAL and not args.include_external:
+                    results["skipped"][name] = "calls external services (--include-external)"
+                    continue
+                if item["kind"] == WRITE and args.skip_writes:
+                    results["skipped"][name] = "writes (--skip-writes)"
+                    continue
+                try:
+                    results["routes"][name] = await run_scenario(client, item, ctx, args.requests, args.concurrency, args.warmup)
+                except Exception as e:
+                    results["skipped"][name] = f"failed: {str(e)}"
+                    print(f"❌ {name}: {str(e)}")
+                    continue
+                row = results["routes"][name]
+                print(f"{'✅' if not row['errors'] else '⚠️'} {name}: p95 {row['p95_ms']:.2f} ms, {row['throughput_rps']:.1f} req/s")
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_dataset_arguments(parser)
+
+    server = parser.add_argument_group("database")
+    server.add_argument("--mongo-uri", help="Use this server instead of starting a local mongod")
+    server.add_argument("--mongod", default="mongod", help="mongod binary to start")
+    server.add_argument("--database", default=BENCH_DATABASE)
+    server.add_argument("--drop", action="store_true", help="Drop and reseed the benchmark database if it has data")
+
+    load = parser.add_argument_group("load")
+    load.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    load.add_argument("--concurrency", type=int, default=10)
+    load.add_argument("--warmup", type=int, default=10)
+    load.add_argument("--routes", nargs="*", help="Only scenarios whose name contains one of these")
+    load.add_argument("--skip-writes", action="store_true")
+    load.add_argument("--include-external", action="store_true", help="Also run routes that call WhatsApp/SMTP/Google")
+
+    output = parser.add_argument_group("results")
+    output.add_argument("--output", help="Write the results JSON here")
+    output.add_argument("--baseline", help="Compare against this results file")
+    output.add_argument("--save-baseline", help="Also write the results to this baseline file")
+    output.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression as a fraction (default 0.2)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = LocalMongod(args.mongod) if args.mongo_uri is None else contextlib.nullcontext(args.mongo_uri)
+    with server as mongo_uri:
+        configure_environment(args, mongo_uri)
+        seed_database(args)
+        results = asyncio.run(benchmark(args))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"✅ Results written to {path}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Requests issued by the benchmark, one or more scenarios per API route."""
+import random
+from datetime import datetime, timedelta
+
+from fastapi.routing import APIRoute
+
+# Routers whose routes must all have a scenario
+BENCH_MODULES = ("main", "patient.patient", "patient.patient_dashboard", "patient.records")
+
+READ = "read"
+WRITE = "write"
+# Calls WhatsApp/SMTP/Google directly from the request: only run with --include-external
+EXTERNAL = "external"
+
+
+class BenchContext:
+    """Deterministic request parameters drawn from the seeded dataset."""
+
+    def __init__(self, patients: int, reference_date: datetime, seed: int = 0):
+        self.patients = patients
+        self.reference_date = reference_date
+        self.rng = random.Random(f"requests-{seed}")
+        self.job_ids = []
+        self._next_patientid = patients + 1
+        self._next_slot = 0
+        # Far enough ahead to never overlap seeded appointments
+        self._slot_base = (datetime.now() + timedelta(days=400)).replace(minute=0, second=0, microsecond=0)
+
+    def patient(self):
+        return self.rng.randint(1, self.patients)
+
+    def date(self):
+        return (self.reference_date - timedelta(days=self.rng.randint(0, 365))).strftime("%Y-%m-%d")
+
+    def new_patientid(self):
+        self._next_patientid += 1
+        return self._next_patientid
+
+    def slot(self):
+        """A future meeting time no other benchmark request has used (so bookings never conflict)."""
+        self._next_slot += 1
+        return (self._slot_base + timedelta(hours=self._next_slot)).strftime("%Y-%m-%dT%H:%M:%S")
+
+    def job_id(self):
+        if not self.job_ids:
+            raise LookupError("no outbox job was created by prepare()")
+        return self.rng.choice(self.job_ids)
+
+
+def scenario(method: str, path: str, build=None, expect=(200,), kind=READ, variant=None):
+    name = f"{method} {path}" + (f" [{variant}]" if variant else "")
+    return {"name": name, "method": method, "path": path, "build": build or (lambda ctx: {}), "expect": expect, "kind": kind}
+
+
+def _medication(ctx):
+    systolic = ctx.rng.randint(100, 170)
+    return {
+        "heartrate": f"{ctx.rng.randint(55, 120)} bpm",
+        "SpO2": f"{ctx.rng.randint(88, 100)}%",
+        "bp": f"{systolic}/{ctx.rng.randint(60, 90)}",
+        "Stress": str(ctx.rng.randint(0, 10)),
+        "riskrate": ctx.rng.randint(0, 100),
+        "type": "Diet",
+        "Diet_PLAN": {"DAY1": "Low salt meals"},
+    }
+
+
+def _patient_path(template):
+    return lambda ctx: {"url": template.format(patientid=ctx.patient())}
+
+
+def _meeting(ctx):
+    return {"params": {"patientid": ctx.patient(), "meeting_datetime": ctx.slot(), "therapy": "Nutrition", "therapy_mode": "online"}}
+
+
+def _bulk_rows(ctx, count=10):
+    slot = ctx.slot()
+    patients = ctx.rng.sample(range(1, ctx.patients + 1), min(count, ctx.patients))
+    return {"json": {"rows": [
+        {"patientid": patientid, "meeting_datetime": slot, "therapy": "Nutrition", "therapy_mode": "online"}
+        for patientid in patients
+    ]}}
+
+
+SCENARIOS = [
+    # patient.patient
+    scenario("GET", "/api/patient/total_counts"),
+    scenario("GET", "/api/patient/patients_list", lambda ctx: {"params": {"limit": 50}}),
+    scenario("GET", "/api/patient/patients_list", lambda ctx: {"params": {"limit": 50, "risk_band": "high", "sort_by": "risk_score", "order": "desc"}}, variant="high risk"),
+    scenario("GET", "/api/patient/patients_list", lambda ctx: {"params": {"limit": 50, "after": ctx.patient()}}, variant="keyset page"),
+    scenario("GET", "/api/doctors/doctors_list"),
+    scenario("GET", "/api/patient/appointments_by_date", lambda ctx: {"params": {"date": ctx.date()}}),
+    scenario("GET", "/api/patient/monthly_reports"),
+    # patient.patient_dashboard
+    scenario("GET", "/api/patient/dashboard/{patientid}", _patient_path("/api/patient/dashboard/{patientid}")),
+    scenario("GET", "/api/patient/patient_dashboard_risk/{patientid}", _patient_path("/api/patient/patient_dashboard_risk/{patientid}")),
+    scenario("GET", "/api/patient/patient_health_trend/{patientid}", _patient_path("/api/patient/patient_health_trend/{patientid}")),
+    scenario("GET", "/api/patient/average_actual/{patientid}", _patient_path("/api/patient/average_actual/{patientid}")),
+    scenario("GET", "/api/patient/risk_scores_weightage/{patientid}", _patient_path("/api/patient/risk_scores_weightage/{patientid}")),
+    scenario("GET", "/api/patient/recommendations/{patientid}", _patient_path("/api/patient/recommendations/{patientid}")),
+    scenario("GET", "/api/patient/episodes/{patientid}", _patient_path("/api/patient/episodes/{patientid}")),
+    scenario("GET", "/api/patient/{patientid}/prescription_tracking", _patient_path("/api/patient/{patientid}/prescription_tracking")),
+    scenario("GET", "/api/patient/{patientid}/readings", _patient_path("/api/patient/{patientid}/readings")),
+    scenario("GET", "/api/patient/{patientid}/readings/summary", _patient_path("/api/patient/{patientid}/readings/summary")),
+    scenario("GET", "/api/patient/{patientid}/overview", _patient_path("/api/patient/{patientid}/overview")),
+    # main
+    scenario("GET", "/api/health_check"),
+    scenario("GET", "/api/db/pool_stats"),
+    scenario("GET", "/api/whatsapp/stats"),
+    scenario("GET", "/api/email/stats"),
+    scenario("GET", "/metrics"),
+    scenario("GET", "/api/fetch_all_records"),
+    scenario("GET", "/api/fetch_all_records", lambda ctx: {"params": {"limit": 100, "after": ctx.patient()}}, variant="page"),
+    scenario("GET", "/api/fetch_all_records", lambda ctx: {"params": {"stream": "ndjson"}}, variant="ndjson stream"),
+    scenario("GET", "/api/fetch_patient_details", lambda ctx: {"params": {"patientid": ctx.patient()}}),
+    scenario("GET", "/api/patient/meetings", lambda ctx: {"params": {"patient_id": ctx.patient()}}),
+    scenario("GET", "/api/jobs/{job_id}", lambda ctx: {"url": f"/api/jobs/{ctx.job_id()}"}),
+    scenario("GET", "/api/test_email", kind=EXTERNAL),
+    scenario("POST", "/api/send_plan_via_whatsapp", lambda ctx: {"params": {"patientid": ctx.patient(), "type": "Diet"}}, kind=EXTERNAL),
+    scenario("POST", "/api/send_patient_summary", lambda ctx: {"params": {"patientid": ctx.patient(), "type": "Diet"}}, kind=EXTERNAL),
+    scenario("POST", "/api/send_summary_template", lambda ctx: {"params": {"mobile_number": "919999999999"}}, kind=EXTERNAL),
+    # Writes run last so the read scenarios see the seeded dataset unchanged
+    scenario("POST", "/api/doctors/cache/invalidate", kind=WRITE),
+    scenario("POST", "/api/patient/register", lambda ctx: {"json": {
+        "patientid": ctx.new_patientid(), "name": "Bench patient", "email": "bench@example.com",
+        "medications": {"m1": {**_medication(ctx), "time": ctx.reference_date.isoformat()}},
+    }}, kind=WRITE),
+    scenario("POST", "/api/patient/{patientid}/medications", lambda ctx: {
+        "url": f"/api/patient/{ctx.patient()}/medications", "json": _medication(ctx),
+    }, kind=WRITE),
+    scenario("POST", "/api/schedule_meeting", _meeting, expect=(202,), kind=WRITE),
+    scenario("POST", "/api/schedule_meetings/bulk", _bulk_rows, expect=(202,), kind=WRITE),
+    scenario("POST", "/api/patient/schedule_appointments", lambda ctx: {
+        "params": {"patientid": ctx.patient(), "meeting_datetime": ctx.slot()},
+    }, expect=(202,), kind=WRITE),
+]
+
+
+async def prepare(client, ctx: BenchContext):
+    """Create what some scenarios look up (an outbox job for /api/jobs/{job_id})."""
+    response = await client.post("/api/schedule_meeting", params=_meeting(ctx)["params"])
+    if response.status_code == 202:
+        ctx.job_ids.append(response.json()["job_id"])
+    else:
+        print(f"⚠️ Could not create an outbox job for /api/jobs/{{job_id}}: {response.status_code} {response.text[:200]}")
+
+
+def uncovered_routes(app):
+    """(method, path) of API routes in BENCH_MODULES that have no scenario."""
+    covered = {(item["method"], item["path"]) for item in SCENARIOS}
+    missing = []
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or route.endpoint.__module__ not in BENCH_MODULES:
+            continue
+        for method in sorted(route.methods - {"HEAD"}):
+            if (method, route.path) not in covered:
+                missing.append((method, route.path))
+    return missing
@@ -1,25 +1,106 @@
 from dotenv import load_dotenv # type: ignore
-import requests
+import threading
+import time
+import httpx
 import os
 
+from utils.metrics import instrument, LatencyWindow
+
 load_dotenv()
 
 # ADA API endpoint and key
 ADA_API_URL = os.getenv("ADA_API_URL")
-ADA_API_KEY = os.getenv("ADA_API_KEY") 
+ADA_API_KEY = os.getenv("ADA_API_KEY")
 headers = {
         'Authorization': f'Bearer {ADA_API_KEY}',
         'Content-Type': 'application/json'
 }
 
+# Connection pool and timeout settings for the ADA client
+ADA_TIMEOUT = float(os.getenv("ADA_TIMEOUT", "10"))
+ADA_CONNECT_TIMEOUT = float(os.getenv("ADA_CONNECT_TIMEOUT", "5"))
+ADA_MAX_CONNECTIONS = int(os.getenv("ADA_MAX_CONNECTIONS", "20"))
+ADA_MAX_KEEPALIVE = int(os.getenv("ADA_MAX_KEEPALIVE", "10"))
+
+
+class AdaClient:
+    """Async ADA WhatsApp client over one keep-alive connection pool, with call metrics."""
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+        self._latencies = LatencyWindow()
+        self._counts = {"calls": 0, "sent": 0, "rejected": 0, "errors": 0, "timeouts": 0}
+        self._last_error = None
+
+    def _get_client(self):
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=headers,
+                timeout=httpx.Timeout(ADA_TIMEOUT, connect=ADA_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=ADA_MAX_CONNECTIONS,
+                    max_keepalive_connections=ADA_MAX_KEEPALIVE
+                ),
+            )
+        return self._client
+
+    def _record(self, outcome, started, error=None):
+        with self._lock:
+            self._counts["calls"] += 1
+            self._counts[outcome] += 1
+            self._latencies.add((time.perf_counter() - started) * 1000)
+            if error is not None:
+                self._last_error = error
+
+    async def send(self, data: dict):
+        """POST one message payload; returns the httpx response."""
+        started = time.perf_counter()
+        try:
+            response = await self._get_client().post(ADA_API_URL, json=data)
+        except httpx.TimeoutException as e:
+            self._record("timeouts", started, f"timeout: {str(e) or type(e).__name__}")
+            raise
+        except httpx.HTTPError as e:
+            self._record("errors", started, str(e) or type(e).__name__)
+            raise
+        if response.status_code == 200:
+            self._record("sent", started)
+        else:
+            self._record("rejected", started, f"HTTP {response.status_code}")
+        return response
 
-def send_whatsapp_message(template_name: str, number: str, template_data: list = None):
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            last_error = self._last_error
+
+        return {
+            **counts,
+            "latency_ms": self._latencies.summary(),
+            "last_error": last_error,
+            "pool": {"max_connections": ADA_MAX_CONNECTIONS, "max_keepalive": ADA_MAX_KEEPALIVE},
+            "timeout_s": ADA_TIMEOUT,
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+ada_client = AdaClient()
+
+
+@instrument("ada", ok=lambda result: result is not None)
+async def send_whatsapp_message(template_name: str, number: str, template_data: list = None):
     """Send a WhatsApp message using ADA's template system."""
     if template_data is None:
-        template_data = [] 
+        template_data = []
     data = {
         "platform": "WA",
-        "from": "15557091773",  
+        "from": "15557091773",
         "to": number,
         "type": "template",
         "templateName": template_name,
@@ -28,8 +109,8 @@ def send_whatsapp_message(template_name: str, number: str, template_data: list =
         "templateButton": []  # Optional: Add buttons if needed
     }
 
-    # Send the POST request to ADA API
-    response = requests.post(ADA_API_URL, headers=headers, json=data)
+    # Send the POST request to ADA API over the pooled client
+    response = await ada_client.send(data)
 
     # Log and inspect the full response for debugging
     if response.status_code == 200:
@@ -40,9 +121,8 @@ def send_whatsapp_message(template_name: str, number: str, template_data: list =
         print(f"Response Text: {response.text}")  # Log full response text for debugging
         return None
 
-def send_greeting_message(template_name: str, number: str, name: str):
-    return send_whatsapp_message(template_name, number, [name])
-
-def send_template_message(template_name: str, number: str, name: str, plan: str):
-    return send_whatsapp_message(template_name, number, [name, plan])
+async def send_greeting_message(template_name: str, number: str, name: str):
+    return await send_whatsapp_message(template_name, number, [name])
 
+async def send_template_message(template_name: str, number: str, name: str, plan: str):
+    return await send_whatsapp_message(template_name, number, [name, plan])
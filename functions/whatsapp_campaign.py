@@ -0,0 +1,362 @@
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Body
+from pymongo import DESCENDING
+from utils.serialization import MongoJSONResponse
+
+from app_instance import app
+from utils import outbox
+from utils.db import run_db, run_transaction, collection, campaigns_collection
+from functions.send_whatsapp_msg import send_greeting_message, send_template_message
+from templates.ada_templates import get_template_name
+from patient.patient import RISK_BANDS
+from patient.records import bump_version
+
+load_dotenv()
+
+# Concurrent ADA sends per campaign (bounded by the ADA client pool as well)
+CAMPAIGN_CONCURRENCY = int(os.getenv("CAMPAIGN_CONCURRENCY", "10"))
+# Delay before the DAY1 plan and between later days, matching send_plan_via_whatsapp
+CAMPAIGN_FIRST_DELAY = float(os.getenv("CAMPAIGN_FIRST_DELAY", "5"))
+CAMPAIGN_DAY_INTERVAL = float(os.getenv("CAMPAIGN_DAY_INTERVAL", "86400"))
+# Patients loaded and sent per batch; progress is checkpointed after each one
+CAMPAIGN_BATCH_SIZE = int(os.getenv("CAMPAIGN_BATCH_SIZE", "200"))
+# Finished or cancelled campaigns are deleted by a TTL index after this many days
+CAMPAIGN_RETENTION_DAYS = float(os.getenv("CAMPAIGN_RETENTION_DAYS", "30"))
+CAMPAIGN_DAYS = 7
+PLAN_TYPES = ("Diet", "Exercise", "Routine")
+# One outbox job per stage, scheduled when the previous stage finishes
+STAGES = ("greeting",) + tuple(f"DAY{day}" for day in range(1, CAMPAIGN_DAYS + 1))
+
+# Errors kept per campaign for the status endpoint
+MAX_RECENT_ERRORS = 20
+
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_CANCELLED = "cancelled"
+STATUS_FAILED = "failed"
+
+# Returned by the status endpoints (the cohort ids stay in the database)
+STATUS_PROJECTION = {"patientids": 0}
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+# ---------------- CAMPAIGN DOCUMENTS ----------------
+
+def new_campaign(plan_type: str, patientids: list, skipped: list):
+    """Campaign document; only the cohort's ids are stored, plans are read per batch."""
+    now = _now()
+    return {
+        "_id": uuid.uuid4().hex,
+        "type": plan_type,
+        "patientids": sorted(patientids),
+        "patients": len(patientids),
+        "skipped": skipped,
+        "status": STATUS_RUNNING,
+        "created_at": now,
+        "finished_at": None,
+        "next_stage_at": now,
+        "stages": {},
+        "recent_errors": [],
+        "expires_at": None,
+    }
+
+
+def stage_job(campaign_id: str, stage: str, run_at: datetime):
+    # Deterministic id: a retried stage never schedules the next one twice
+    return outbox.new_job(
+        "campaign_stage",
+        {"campaign_id": campaign_id, "stage": stage},
+        job_id=f"campaign:{campaign_id}:{stage}",
+        run_at=run_at
+    )
+
+
+def stage_delay(stage: str):
+    """Seconds between the previous stage finishing and this one starting."""
+    return CAMPAIGN_FIRST_DELAY if stage == "DAY1" else CAMPAIGN_DAY_INTERVAL
+
+
+def _finished(status: str, now: datetime):
+    return {
+        "status": status,
+        "finished_at": now,
+        "next_stage_at": None,
+        "expires_at": now + timedelta(days=CAMPAIGN_RETENTION_DAYS),
+    }
+
+
+def start_stage(campaign_id: str, stage: str, total: int):
+    """Create the stage counters on its first attempt (a retry keeps them)."""
+    campaigns_collection.update_one(
+        {"_id": campaign_id, f"stages.{stage}": {"$exists": False}},
+        {"$set": {
+            f"stages.{stage}": {"total": total, "sent": 0, "failed": 0, "started": time.time(), "finished": None},
+            "next_stage_at": None,
+        }}
+    )
+
+
+def record_batch(campaign_id: str, stage: str, sent: int, errors: list):
+    update = {"$inc": {f"stages.{stage}.sent": sent, f"stages.{stage}.failed": len(errors)}}
+    if errors:
+        update["$push"] = {"recent_errors": {"$each": errors, "$slice": -MAX_RECENT_ERRORS}}
+    campaigns_collection.update_one({"_id": campaign_id}, update)
+
+
+def finish_stage(campaign_id: str, stage: str):
+    """Close a stage and schedule the next one (or complete the campaign)."""
+    now = _now()
+    fields = {f"stages.{stage}.finished": time.time()}
+    index = STAGES.index(stage)
+    if index + 1 < len(STAGES):
+        next_stage = STAGES[index + 1]
+        run_at = now + timedelta(seconds=stage_delay(next_stage))
+        outbox.enqueue_once(stage_job(campaign_id, next_stage, run_at))
+        fields["next_stage_at"] = run_at
+    else:
+        fields.update(_finished(STATUS_COMPLETED, now))
+    # A campaign cancelled meanwhile keeps its status
+    campaigns_collection.update_one({"_id": campaign_id, "status": STATUS_RUNNING}, {"$set": fields})
+
+
+def end_campaign(campaign_id: str, status: str):
+    """Mark a running campaign cancelled/failed; returns False when it was not running."""
+    result = campaigns_collection.update_one(
+        {"_id": campaign_id, "status": STATUS_RUNNING},
+        {"$set": _finished(status, _now())}
+    )
+    return result.modified_count == 1
+
+
+def campaign_status_of(campaign_id: str):
+    campaign = campaigns_collection.find_one({"_id": campaign_id}, {"status": 1})
+    return campaign["status"] if campaign else None
+
+
+def load_batch(patientids: list, plan_type: str):
+    projection = {"_id": 0, "patientid": 1, "name": 1, "mobileno": 1, f"{plan_type}_PLAN": 1}
+    return list(collection.find({"patientid": {"$in": patientids}}, projection))
+
+
+def progress(campaign: dict):
+    """Status payload of a stored campaign."""
+    stages = {}
+    for name, stage in campaign.get("stages", {}).items():
+        done = stage["sent"] + stage["failed"]
+        elapsed = (stage["finished"] or time.time()) - stage["started"]
+        stages[name] = {
+            "total": stage["total"],
+            "sent": stage["sent"],
+            "failed": stage["failed"],
+            "pending": stage["total"] - done,
+            "elapsed_s": round(elapsed, 2),
+            "messages_per_sec": round(done / elapsed, 2) if elapsed > 0 else None,
+            "finished": stage["finished"] is not None,
+        }
+    return {
+        "campaign_id": campaign["_id"],
+        "type": campaign["type"],
+        "status": campaign["status"],
+        "patients": campaign["patients"],
+        "skipped": campaign["skipped"],
+        "concurrency": CAMPAIGN_CONCURRENCY,
+        "created_at": campaign["created_at"],
+        "finished_at": campaign["finished_at"],
+        "next_stage_at": campaign["next_stage_at"],
+        "sent": sum(stage["sent"] for stage in stages.values()),
+        "failed": sum(stage["failed"] for stage in stages.values()),
+        "stages": stages,
+        "recent_errors": list(campaign.get("recent_errors", [])),
+    }
+
+
+# ---------------- STAGE JOBS ----------------
+
+async def fan_out(patients: list, send):
+    """Run send(patient) for every patient with at most CAMPAIGN_CONCURRENCY in flight; returns (sent, errors)."""
+    queue = asyncio.Queue()
+    for patient in patients:
+        queue.put_nowait(patient)
+    sent, errors = 0, []
+
+    async def worker():
+        nonlocal sent
+        while True:
+            try:
+                patient = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                response = await send(patient)
+            except Exception as e:
+                errors.append({"patientid": patient.get("patientid"), "error": str(e)})
+            else:
+                if response is not None:
+                    sent += 1
+                else:
+                    errors.append({"patientid": patient.get("patientid"), "error": "Rejected by ADA"})
+
+    await asyncio.gather(*(worker() for _ in range(CAMPAIGN_CONCURRENCY)))
+    return sent, errors
+
+
+def stage_sender(plan_type: str, stage: str):
+    """send(patient) coroutine function for one stage."""
+    if stage == "greeting":
+        template = get_template_name('Greetings')
+        return lambda p: send_greeting_message(template, p["mobileno"], p["name"])
+    template = get_template_name(plan_type)
+
+    def send_plan(patient):
+        plan = (patient.get(f"{plan_type}_PLAN") or {}).get(stage, f"No {plan_type} plan for {stage}")
+        return send_template_message(template, patient["mobileno"], patient["name"], plan)
+    return send_plan
+
+
+@outbox.register_handler("campaign_stage")
+async def run_campaign_stage(job):
+    """Send one stage to the cohort batch by batch; a retried job resumes after the last saved batch."""
+    campaign_id, stage = job["payload"]["campaign_id"], job["payload"]["stage"]
+    campaign = await run_db(campaigns_collection.find_one, {"_id": campaign_id}, {"type": 1, "status": 1, "patientids": 1})
+    if campaign is None or campaign["status"] != STATUS_RUNNING:
+        return {"stage": stage, "skipped": campaign["status"] if campaign else "deleted"}
+
+    try:
+        patientids = campaign["patientids"]
+        await run_db(start_stage, campaign_id, stage, len(patientids))
+        sent_through = (job.get("steps") or {}).get("sent_through")
+        remaining = [patientid for patientid in patientids if sent_through is None or patientid > sent_through]
+        send = stage_sender(campaign["type"], stage)
+
+        for start in range(0, len(remaining), CAMPAIGN_BATCH_SIZE):
+            batch = remaining[start:start + CAMPAIGN_BATCH_SIZE]
+            # Cancellation is visible to every worker through the stored status
+            status = await run_db(campaign_status_of, campaign_id)
+            if status != STATUS_RUNNING:
+                return {"stage": stage, "stopped": status}
+            patients = await run_db(load_batch, batch, campaign["type"])
+            sent, errors = await fan_out([patient for patient in patients if patient.get("mobileno")], send)
+            await run_db(record_batch, campaign_id, stage, sent, errors)
+            # Checkpoint (and lease renewal): a retry resends nothing up to here
+            await run_db(outbox.save_step, job, "sent_through", batch[-1])
+
+        await run_db(finish_stage, campaign_id, stage)
+    except outbox.LeaseLost:
+        raise
+    except Exception as e:
+        if job["attempts"] >= outbox.OUTBOX_MAX_ATTEMPTS:
+            await run_db(end_campaign, campaign_id, STATUS_FAILED)
+            print(f"❌ Campaign {campaign_id} failed at {stage}: {str(e)}")
+        raise
+
+    print(f"✅ Campaign {campaign_id} {stage} sent")
+    return {"stage": stage}
+
+
+def campaign_query(patientids: Optional[List[int]], gender: Optional[str], risk_band: Optional[str]):
+    """Mongo filter selecting the cohort (explicit ids and/or patient-list filters)."""
+    conditions = []
+    if patientids:
+        conditions.append({"patientid": {"$in": patientids}})
+    if gender:
+        conditions.append({"gender": gender})
+    if risk_band:
+        conditions.append({"latest_riskrate": RISK_BANDS[risk_band]})
+    return {"$and": conditions} if len(conditions) > 1 else conditions[0]
+
+
+def load_cohort(query: dict, plan_type: str):
+    """Mark the plan type on every selected patient and return their ids and numbers."""
+    collection.update_many(query, bump_version({"$set": {"type": plan_type, "time": datetime.now()}}))
+    return list(collection.find(query, {"_id": 0, "patientid": 1, "mobileno": 1}))
+
+
+def create_campaign(campaign: dict):
+    """Store the campaign together with its first stage job."""
+    def write(session):
+        campaigns_collection.insert_one(campaign, session=session)
+        # Written last so a standalone server never holds a job without its campaign
+        outbox.enqueue(stage_job(campaign["_id"], STAGES[0], campaign["created_at"]), session=session)
+
+    run_transaction(write)
+
+
+# ---------------- CAMPAIGN ENDPOINTS ----------------
+
+# API to send a 7-day plan to a whole cohort of patients
+@app.post('/api/whatsapp/campaigns')
+async def start_campaign(
+    type: str = Body(...),
+    patientids: Optional[List[int]] = Body(None),
+    gender: Optional[str] = Body(None),
+    risk_band: Optional[str] = Body(None),
+):
+    if type not in PLAN_TYPES:
+        raise HTTPException(status_code=400, detail=f"type must be one of {', '.join(PLAN_TYPES)}")
+    if not (patientids or gender or risk_band):
+        raise HTTPException(status_code=400, detail="Provide patientids or a filter (gender, risk_band)")
+    if risk_band is not None and risk_band not in RISK_BANDS:
+        raise HTTPException(status_code=400, detail="risk_band must be one of low, mid, high")
+
+    try:
+        patients = await run_db(load_cohort, campaign_query(patientids, gender, risk_band), type, timeout=60)
+        if not patients:
+            raise HTTPException(status_code=404, detail="No patients matched")
+
+        skipped = [patient["patientid"] for patient in patients if not patient.get("mobileno")]
+        campaign = new_campaign(type, [patient["patientid"] for patient in patients if patient.get("mobileno")], skipped)
+        await run_db(create_campaign, campaign, timeout=60)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+    outbox.notify()
+
+    return MongoJSONResponse(status_code=202, content={
+        "message": f"{type} plans for all 7 days will be sent daily to {campaign['patients']} patients!",
+        "campaign_id": campaign["_id"],
+        "status_url": f"/api/whatsapp/campaigns/{campaign['_id']}",
+        "patients": campaign["patients"],
+        "skipped": skipped,
+    })
+
+
+LIST_FIELDS = ("campaign_id", "type", "status", "patients", "sent", "failed", "created_at")
+
+
+@app.get('/api/whatsapp/campaigns')
+async def list_campaigns():
+    campaigns = await run_db(
+        lambda: list(campaigns_collection.find({}, STATUS_PROJECTION).sort("created_at", DESCENDING))
+    )
+    return [
+        {key: value for key, value in progress(campaign).items() if key in LIST_FIELDS}
+        for campaign in campaigns
+    ]
+
+
+@app.get('/api/whatsapp/campaigns/{campaign_id}')
+async def campaign_status(campaign_id: str):
+    campaign = await run_db(campaigns_collection.find_one, {"_id": campaign_id}, STATUS_PROJECTION)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return progress(campaign)
+
+
+@app.delete('/api/whatsapp/campaigns/{campaign_id}')
+async def cancel_campaign(campaign_id: str):
+    # Running stages stop before their next batch; pending stage jobs find it cancelled
+    if not await run_db(end_campaign, campaign_id, STATUS_CANCELLED):
+        if await run_db(campaign_status_of, campaign_id) is None:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+    return {"message": "Campaign cancelled", "campaign_id": campaign_id}
@@ -1,23 +1,40 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Body, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from datetime import datetime, timedelta, timezone
-from functions.send_whatsapp_msg import send_greeting_message, send_template_message, send_whatsapp_message
+from datetime import datetime, timedelta
+from typing import Optional, List
+from functions.send_whatsapp_msg import send_greeting_message, send_template_message, send_whatsapp_message, ada_client
 from templates.ada_templates import get_template_name
 import os
 import asyncio
-import smtplib
-from calendar import month_name as calendar_month_name
+from dateutil import rrule
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from utils.google_calendar import create_google_meet_event
+from utils.google_calendar import create_google_meet_event, create_google_meet_events, CALENDAR_BATCH_SIZE
 from app_instance import app
+from utils.serialization import MongoJSONResponse, dumps
+from utils.db import (
+    run_db, run_transaction, pool_stats, close_db, ensure_indexes,
+    collection, meeting_history_collection, appointment_entries_collection,
+)
+from utils import outbox
+from utils.mailer import mailer, SMTP_SERVER, EMAIL_ADDRESS
+from pymongo import UpdateOne, ReplaceOne
+from utils.appointments import (
+    appointment_entry, book_meetings, check_bookings, history_push, patient_meetings, AppointmentConflict,
+    HISTORY_COLLECTIONS, SOURCE_MEETING_HISTORY, SOURCE_APPOINTMENTS,
+)
+from utils.doctor_directory import doctor_directory
+from utils.metrics import instrument, registry, CONTENT_TYPE
+from patient.records import bump_version, conditional_get
+from patient.readings import attach_medications, medications_by_patient
 
 
 import patient.patient
 import patient.patient_dashboard
+import patient.records
+import functions.whatsapp_campaign
 
 
 
@@ -29,37 +46,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After", "ETag", "Last-Modified", "X-DB-Queries", "X-DB-Documents", "X-DB-Bytes", "X-DB-Time-Ms"],
 )
+
+
+@app.on_event("startup")
+async def startup():
+    try:
+        await run_db(ensure_indexes, timeout=60)
+    except Exception as e:
+        print(f"❌ Failed to create indexes: {str(e)}")
+    outbox.start_workers()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await outbox.stop_workers()
+    await ada_client.aclose()
+    mailer.close()
+    close_db()
  
 load_dotenv()
- 
-MONGODB_CONNECTION_STRING = os.getenv("MONGODB_CONNECTION_STRING")
-DATABASE_NAME = os.getenv("DATABASE_NAME")
-COLLECTION_NAME = os.getenv("COLLECTION_NAME")
-HISTORY_COLLECTION = os.getenv("HISTORY_COLLECTION")
-APPOINTMENTS_COLLECTION = os.getenv("APPOINTMENTS_COLLECTION")
-DOCTORS_COLLECTION = os.getenv("DOCTORS_COLLECTION")
-DASHBOARD_COLLECTION = os.getenv("DASHBOARD_COLLECTION")
-
-# Email configuration
-SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
-EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
- 
-# Initialize MongoDB client
-client = MongoClient(MONGODB_CONNECTION_STRING)
-db = client[DATABASE_NAME]
-collection = db[COLLECTION_NAME]
-meeting_history_collection = db[HISTORY_COLLECTION]
-appointments_collection = db[APPOINTMENTS_COLLECTION]  
-doctors_collection = db[DOCTORS_COLLECTION]
-dashboard_collection = db[DASHBOARD_COLLECTION]
 
+# Therapies and appointment modes accepted by the scheduling endpoints
+THERAPIES = ["Psychology", "Speech & Language Therapy", "Occupational Therapy", "Music Therapy", "Continuous Education", "Nutrition"]
+THERAPY_MODES = ['online', 'offline']
+
+# Upper bound on meetings created by one bulk scheduling request
+BULK_SCHEDULE_MAX_MEETINGS = int(os.getenv("BULK_SCHEDULE_MAX_MEETINGS", "500"))
 
+# Batch size used when streaming /api/fetch_all_records
+FETCH_BATCH_SIZE = int(os.getenv("FETCH_BATCH_SIZE", "500"))
 
 
 
+
+
+@instrument("smtp", ok=bool)
 def send_meeting_email(patient_name, patient_email, meeting_datetime, meet_link):
     """Send email with meeting details to patient"""
     try:
@@ -118,13 +141,8 @@ If you need immediate assistance, contact our support team.
         
         msg.attach(MIMEText(body, 'plain'))
         
-        # Send email
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(EMAIL_ADDRESS, patient_email, text)
-        server.quit()
+        # Send email over a pooled SMTP session (this runs on an outbox worker thread)
+        mailer.submit(msg).result()
         
         print(f"✅ Meeting email sent successfully to {patient_email}")
         return True
@@ -133,12 +151,181 @@ If you need immediate assistance, contact our support team.
         print(f"❌ Failed to send email: {str(e)}")
         return False
 
+
+@instrument("smtp", ok=bool)
+def send_meetings_summary_email(patient_name, patient_email, meetings):
+    """Send one email listing every meeting booked for a patient in a bulk request"""
+    try:
+        msg = MIMEMultipart()
+        msg['From'] = EMAIL_ADDRESS
+        msg['To'] = patient_email
+        msg['Subject'] = f"Health Consultation Meetings Scheduled - {patient_name}"
+
+        lines = []
+        for meeting in sorted(meetings, key=lambda m: m['meeting_datetime']):
+            formatted_datetime = datetime.fromisoformat(meeting['meeting_datetime']).strftime('%B %d, %Y at %I:%M %p')
+            therapy = f" - {meeting['therapy']} ({meeting['therapy_mode']})" if meeting.get('therapy') else ""
+            lines.append(f"📅 {formatted_datetime} (IST){therapy}\n   🔗 {meeting['meeting_link']}")
+        schedule = "\n\n".join(lines)
+
+        body = f"""Dear {patient_name},
+
+Your health consultation meetings have been scheduled successfully!
+
+Each meeting lasts 1 hour. Join using the link next to it:
+
+{schedule}
+
+How to Join:
+• Click the meeting link for your session
+• Join 5 minutes before the scheduled time
+
+If you need to reschedule or have any questions, please contact us at {EMAIL_ADDRESS}
+
+Best regards,
+Health Care Team
+Patient360
+
+---
+This is an automated message. Please do not reply to this email.
+If you need immediate assistance, contact our support team.
+"""
+
+        msg.attach(MIMEText(body, 'plain'))
+
+        # Send email over a pooled SMTP session (this runs on an outbox worker thread)
+        mailer.submit(msg).result()
+
+        print(f"✅ Meetings summary email sent successfully to {patient_email}")
+        return True
+
+    except Exception as e:
+        print(f"❌ Failed to send email: {str(e)}")
+        return False
+
+
+# ---------------- MEETING OUTBOX ----------------
+
+def store_meeting_with_job(source, patient, meeting_details, job):
+    """Write the meeting and its notification job together (one transaction where supported)."""
+    patientid = patient["patientid"]
+
+    def write(session):
+        # Raises AppointmentConflict before anything is written
+        book_meetings(source, patientid, patient["email"], [meeting_details], session=session)
+        if source == SOURCE_MEETING_HISTORY:
+            collection.update_one(
+                {"patientid": patientid},
+                bump_version({"$set": {"meeting_details": meeting_details}}),
+                session=session
+            )
+        # Written last so a standalone server never holds a job without its meeting
+        outbox.enqueue(job, session=session)
+
+    run_transaction(write)
+
+
+def update_scheduled_meeting(job, fields):
+    """Copy a finished step (meeting link, email status) onto the stored meeting."""
+    payload = job["payload"]
+    history_collection = HISTORY_COLLECTIONS[payload["source"]]
+    history_collection.update_one(
+        {"patient_id": payload["patientid"], "meeting_details.job_id": job["_id"]},
+        {"$set": {f"meeting_details.$.{key}": value for key, value in fields.items()}}
+    )
+    if payload["source"] == SOURCE_MEETING_HISTORY:
+        collection.update_one(
+            {"patientid": payload["patientid"], "meeting_details.job_id": job["_id"]},
+            bump_version({"$set": {f"meeting_details.{key}": value for key, value in fields.items()}})
+        )
+    if "meeting_link" in fields:
+        appointment_entries_collection.update_one(
+            {"_id": payload["entry_id"]},
+            {"$set": {"meeting_link": fields["meeting_link"]}}
+        )
+
+
+@outbox.register_handler("meeting_notification")
+def deliver_meeting_notification(job):
+    """Create the Google Meet event, then email the patient; finished steps are skipped on retry."""
+    payload = job["payload"]
+    steps = job.get("steps") or {}
+
+    meet_link = steps.get("meeting_link")
+    if not meet_link:
+        start_dt = datetime.fromisoformat(payload["meeting_datetime"])
+        end_dt = start_dt + timedelta(hours=1)
+        meet_link = create_google_meet_event(
+            summary=f"Consultation with {payload['patient_name']}",
+            description="Health Consultation via Google Meet",
+            start_time=start_dt.isoformat(),
+            end_time=end_dt.isoformat(),
+            event_id=job["_id"]
+        )
+        if not meet_link:
+            raise RuntimeError("Google Calendar returned no Meet link")
+        outbox.save_step(job, "meeting_link", meet_link)
+        update_scheduled_meeting(job, {"meeting_link": meet_link})
+
+    if not steps.get("email_sent"):
+        email_sent = send_meeting_email(
+            payload['patient_name'],
+            payload['patient_email'],
+            payload['meeting_datetime'],
+            meet_link
+        )
+        if not email_sent:
+            raise RuntimeError(f"Failed to send meeting email to {payload['patient_email']}")
+        outbox.save_step(job, "email_sent", True)
+        update_scheduled_meeting(job, {"email_sent": True})
+
+    return {"meeting_link": meet_link, "email_sent": True}
+
+
+async def accept_meeting(source, patient, meeting_datetime, extra_details=None):
+    """Store a meeting plus its outbox job and answer 202 with the job id."""
+    patientid = patient["patientid"]
+
+    # Meeting link and email status are filled in by the outbox worker
+    meeting_details = {
+        "meeting_link": None,
+        "meeting_datetime": meeting_datetime,
+        "scheduled_at": datetime.now().isoformat(),
+        **(extra_details or {}),
+        "email_sent": False,
+    }
+    job = outbox.new_job("meeting_notification", {
+        "source": source,
+        "patientid": patientid,
+        "patient_name": patient['name'],
+        "patient_email": patient['email'],
+        "meeting_datetime": meeting_datetime,
+        "entry_id": appointment_entry(source, patientid, meeting_details)["_id"],
+    })
+    meeting_details["job_id"] = job["_id"]
+    try:
+        await run_db(store_meeting_with_job, source, patient, meeting_details, job)
+    except AppointmentConflict as e:
+        raise HTTPException(status_code=409, detail={"message": "Appointment overlaps an existing booking", "conflicts": e.conflicts})
+    outbox.notify()
+
+    return MongoJSONResponse(status_code=202, content={
+        "message": f"Meeting scheduled for {patient['name']}; invite and email are being processed",
+        "job_id": job["_id"],
+        "status_url": f"/api/jobs/{job['_id']}",
+        "patient_name": patient['name'],
+        "patient_email": patient['email'],
+        "meeting_datetime": meeting_datetime,
+        "status": "accepted"
+    })
+
+
 @app.post('/api/schedule_meeting')
-async def schedule_meeting(patientid: int, meeting_datetime: str, therapy: str, therapy_mode: str):
-    """Schedule a meeting and send email to patient"""
+async def schedule_meeting(patientid: int, meeting_datetime: str, therapy: str, therapy_mode: str, doctor_id: Optional[str] = None):
+    """Schedule a meeting; the Meet link and email are sent by the outbox worker"""
     try:
         # Fetch patient details
-        patient = collection.find_one({"patientid": patientid}, {"_id": 0})
+        patient = await run_db(collection.find_one, {"patientid": patientid}, {"_id": 0})
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         
@@ -147,11 +334,9 @@ async def schedule_meeting(patientid: int, meeting_datetime: str, therapy: str,
             raise HTTPException(status_code=400, detail="Patient email not found in database")
         
         # Validate mode of appointments and therapies selected
-        mode = ['online', 'offline']
-        if therapy_mode.lower() not in mode:
+        if therapy_mode.lower() not in THERAPY_MODES:
             raise HTTPException(status_code=400, detail="Invalid mode of appointment")
-        therapies = ["Psychology", "Speech & Language Therapy", "Occupational Therapy", "Music Therapy", "Continuous Education", "Nutrition"]
-        if therapy not in therapies:
+        if therapy not in THERAPIES:
             raise HTTPException(status_code=400, detail=f"Selected therapy unavailable for {therapy_mode} appointments")
 
         # Validate meeting datetime format
@@ -163,69 +348,291 @@ async def schedule_meeting(patientid: int, meeting_datetime: str, therapy: str,
         # Check if meeting is in the future
         if meeting_dt <= datetime.now():
             raise HTTPException(status_code=400, detail="Meeting datetime must be in the future")
-        
-        start_dt = datetime.fromisoformat(meeting_datetime)
-        end_dt = start_dt + timedelta(hours=1)
 
-        meet_link = create_google_meet_event(
-            summary=f"Consultation with {patient['name']}",
-            description="Health Consultation via Google Meet",
-            start_time=start_dt.isoformat(),
-            end_time=end_dt.isoformat()
-        )
+        details = {"therapy": therapy, "therapy_mode": therapy_mode}
+        if doctor_id is not None:
+            if not await doctor_directory.get(doctor_id):
+                raise HTTPException(status_code=404, detail="Doctor not found")
+            details["doctor_id"] = doctor_id
 
-        # Send email with meeting details
-        email_sent = send_meeting_email(
-            patient['name'], 
-            patient['email'], 
-            meeting_datetime,
-            meet_link
-        )
+        return await accept_meeting(SOURCE_MEETING_HISTORY, patient, meeting_datetime, details)
         
-        # Store meeting details in database
-        meeting_details = {
-            "meeting_link": meet_link,
-            "meeting_datetime": meeting_datetime,
-            "scheduled_at": datetime.now().isoformat(),
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to schedule meeting: {str(e)}")
+
+
+# API to check the progress of an outbox job (e.g. a scheduled meeting's invite and email)
+@app.get('/api/jobs/{job_id}')
+async def get_job_status(job_id: str):
+    try:
+        job = await run_db(outbox.get_job, job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return MongoJSONResponse(status_code=200, content=job)
+
+
+# ---------------- BULK SCHEDULING ----------------
+
+RECURRENCE_FREQUENCIES = {"daily": rrule.DAILY, "weekly": rrule.WEEKLY, "monthly": rrule.MONTHLY}
+
+
+def expand_recurrence(recurrence: dict):
+    """Turn a recurrence rule into one schedule row per occurrence (and patient)."""
+    frequency = RECURRENCE_FREQUENCIES.get(str(recurrence.get("frequency", "weekly")).lower())
+    if frequency is None:
+        raise ValueError("frequency must be one of daily, weekly, monthly")
+    count, until = recurrence.get("count"), recurrence.get("until")
+    if not count and not until:
+        raise ValueError("count or until is required")
+
+    occurrences = rrule.rrule(
+        frequency,
+        dtstart=datetime.fromisoformat(recurrence["meeting_datetime"]),
+        interval=int(recurrence.get("interval", 1)),
+        count=int(count) if count else None,
+        until=datetime.fromisoformat(until) if until else None
+    )
+    patientids = recurrence.get("patientids") or [recurrence.get("patientid")]
+    rows = []
+    # Stop one past the limit so oversized rules are still rejected
+    for occurrence in occurrences:
+        for patientid in patientids:
+            rows.append({
+                "patientid": patientid,
+                "meeting_datetime": occurrence.isoformat(),
+                "therapy": recurrence.get("therapy"),
+                "therapy_mode": recurrence.get("therapy_mode"),
+                "doctor_id": recurrence.get("doctor_id"),
+            })
+        if len(rows) > BULK_SCHEDULE_MAX_MEETINGS:
+            break
+    return rows
+
+
+def validate_schedule_rows(rows: list, patients: dict, doctors: dict):
+    """Check every row with the schedule_meeting rules; returns (meetings, errors)."""
+    meetings, errors, seen = [], [], set()
+    now = datetime.now()
+    for index, row in enumerate(rows):
+        def error(message):
+            errors.append({"row": index, "patientid": row.get("patientid"), "error": message})
+
+        patient = patients.get(row.get("patientid"))
+        if patient is None:
+            error("Patient not found")
+            continue
+        if not patient.get('email'):
+            error("Patient email not found in database")
+            continue
+        therapy, therapy_mode = row.get("therapy"), row.get("therapy_mode")
+        if not isinstance(therapy_mode, str) or therapy_mode.lower() not in THERAPY_MODES:
+            error("Invalid mode of appointment")
+            continue
+        if therapy not in THERAPIES:
+            error(f"Selected therapy unavailable for {therapy_mode} appointments")
+            continue
+        try:
+            meeting_dt = datetime.fromisoformat(str(row.get("meeting_datetime")))
+        except ValueError:
+            error("Invalid datetime format. Use: YYYY-MM-DDTHH:MM:SS")
+            continue
+        if meeting_dt <= now:
+            error("Meeting datetime must be in the future")
+            continue
+        doctor_id = row.get("doctor_id")
+        if doctor_id is not None and not doctors.get(doctor_id):
+            error("Doctor not found")
+            continue
+        key = (patient["patientid"], meeting_dt)
+        if key in seen:
+            error("Duplicate meeting for this patient and time")
+            continue
+        seen.add(key)
+        meetings.append({
+            "patientid": patient["patientid"],
+            "meeting_datetime": row["meeting_datetime"],
             "therapy": therapy,
             "therapy_mode": therapy_mode,
-            "email_sent": email_sent
-        }
+            "doctor_id": doctor_id,
+        })
+    return meetings, errors
 
-        track_meeting = {
-            "patient_id": patientid,
-            "patient_email": patient['email'],
-            "meeting_details": [meeting_details]
-        }
-        past_meetings = meeting_history_collection.find_one({"patient_id": patientid})
-        if past_meetings:
-            update_history = meeting_history_collection.update_one(
-                {"patient_id": patientid},
-                {"$push": {"meeting_details": meeting_details}}
-            )
-        else:
-            history = meeting_history_collection.insert_one(track_meeting)           
-        
-        # Update patient record
-        update_result = collection.update_one(
-            {"patientid": patientid},
-            {"$set": {"meeting_details": meeting_details}}
-        )
-        
-        return JSONResponse(status_code=200, content={
-            "message": f"Meeting scheduled successfully for {patient['name']}",
+
+def store_bulk_meetings(patients: dict, meetings: list):
+    """Write all meetings with one bulk_write per collection plus one outbox job per patient."""
+    scheduled_at = datetime.now().isoformat()
+    by_patient = {}
+    for meeting in meetings:
+        by_patient.setdefault(meeting["patientid"], []).append(meeting)
+
+    history_ops, entries, patient_ops, jobs = [], [], [], []
+    for patientid, patient_rows in by_patient.items():
+        patient = patients[patientid]
+        job = outbox.new_job("bulk_meeting_notification", {
+            "patientid": patientid,
             "patient_name": patient['name'],
             "patient_email": patient['email'],
-            "meeting_link": meet_link,
-            "meeting_datetime": meeting_datetime,
-            "email_sent": email_sent,
-            "status": "success"
+            "meetings": [],
         })
-        
+        details = []
+        for i, meeting in enumerate(sorted(patient_rows, key=lambda m: datetime.fromisoformat(m["meeting_datetime"]))):
+            meeting_details = {
+                "meeting_link": None,
+                "meeting_datetime": meeting["meeting_datetime"],
+                "scheduled_at": scheduled_at,
+                "therapy": meeting["therapy"],
+                "therapy_mode": meeting["therapy_mode"],
+                "email_sent": False,
+                "job_id": job["_id"],
+                # Also the calendar event id, so retried batches never duplicate events
+                "event_id": f"{job['_id']}{i:04d}",
+            }
+            if meeting["doctor_id"] is not None:
+                meeting_details["doctor_id"] = meeting["doctor_id"]
+            entry = appointment_entry(SOURCE_MEETING_HISTORY, patientid, meeting_details)
+            entries.append(entry)
+            job["payload"]["meetings"].append({
+                "event_id": meeting_details["event_id"],
+                "entry_id": entry["_id"],
+                "meeting_datetime": meeting["meeting_datetime"],
+                "therapy": meeting["therapy"],
+                "therapy_mode": meeting["therapy_mode"],
+            })
+            details.append(meeting_details)
+
+        history_ops.append(history_push(patientid, patient['email'], details))
+        # The patient card shows the next meeting of the series
+        patient_ops.append(UpdateOne({"patientid": patientid}, bump_version({"$set": {"meeting_details": details[0]}})))
+        jobs.append(job)
+
+    def write(session):
+        # One overlap query for the whole request; raises AppointmentConflict before any write
+        check_bookings(entries, session)
+        meeting_history_collection.bulk_write(history_ops, ordered=False, session=session)
+        appointment_entries_collection.bulk_write(
+            [ReplaceOne({"_id": entry["_id"]}, entry, upsert=True) for entry in entries],
+            ordered=False,
+            session=session
+        )
+        collection.bulk_write(patient_ops, ordered=False, session=session)
+        outbox.enqueue_many(jobs, session=session)
+
+    run_transaction(write)
+    return [{"patientid": job["payload"]["patientid"], "meetings": len(job["payload"]["meetings"]), "job_id": job["_id"]} for job in jobs]
+
+
+def update_bulk_meetings(payload, updates):
+    """Copy finished steps onto stored meetings; updates maps event_id -> fields."""
+    patientid = payload["patientid"]
+    entry_ids = {meeting["event_id"]: meeting["entry_id"] for meeting in payload["meetings"]}
+    history_ops, patient_ops, entry_ops = [], [], []
+    for event_id, fields in updates.items():
+        history_ops.append(UpdateOne(
+            {"patient_id": patientid, "meeting_details.event_id": event_id},
+            {"$set": {f"meeting_details.$.{key}": value for key, value in fields.items()}}
+        ))
+        patient_ops.append(UpdateOne(
+            {"patientid": patientid, "meeting_details.event_id": event_id},
+            bump_version({"$set": {f"meeting_details.{key}": value for key, value in fields.items()}})
+        ))
+        if "meeting_link" in fields:
+            entry_ops.append(UpdateOne({"_id": entry_ids[event_id]}, {"$set": {"meeting_link": fields["meeting_link"]}}))
+    if history_ops:
+        meeting_history_collection.bulk_write(history_ops, ordered=False)
+        collection.bulk_write(patient_ops, ordered=False)
+    if entry_ops:
+        appointment_entries_collection.bulk_write(entry_ops, ordered=False)
+
+
+@outbox.register_handler("bulk_meeting_notification")
+def deliver_bulk_meeting_notification(job):
+    """Create the patient's Meet events in batch requests, then send one summary email."""
+    payload = job["payload"]
+    steps = job.get("steps") or {}
+    links = dict(steps.get("meeting_links") or {})
+
+    missing = [meeting for meeting in payload["meetings"] if meeting["event_id"] not in links]
+    errors = []
+    # One Google batch request at a time, checkpointing links (and renewing the lease) after each
+    for start in range(0, len(missing), CALENDAR_BATCH_SIZE):
+        chunk = missing[start:start + CALENDAR_BATCH_SIZE]
+        results = create_google_meet_events([
+            {
+                "summary": f"Consultation with {payload['patient_name']}",
+                "description": "Health Consultation via Google Meet",
+                "start_time": datetime.fromisoformat(meeting["meeting_datetime"]).isoformat(),
+                "end_time": (datetime.fromisoformat(meeting["meeting_datetime"]) + timedelta(hours=1)).isoformat(),
+                "event_id": meeting["event_id"],
+            }
+            for meeting in chunk
+        ])
+        created = {meeting["event_id"]: link for meeting, link in zip(chunk, results) if isinstance(link, str) and link}
+        if created:
+            links.update(created)
+            outbox.save_step(job, "meeting_links", links)
+            update_bulk_meetings(payload, {event_id: {"meeting_link": link} for event_id, link in created.items()})
+        else:
+            outbox.renew_lease(job)
+        errors.extend(result for result in results if not (isinstance(result, str) and result))
+    if errors:
+        raise RuntimeError(f"{len(errors)} of {len(missing)} calendar events failed: {errors[0]}")
+
+    if not steps.get("email_sent"):
+        meetings = [{**meeting, "meeting_link": links[meeting["event_id"]]} for meeting in payload["meetings"]]
+        if not send_meetings_summary_email(payload['patient_name'], payload['patient_email'], meetings):
+            raise RuntimeError(f"Failed to send meetings summary email to {payload['patient_email']}")
+        outbox.save_step(job, "email_sent", True)
+        update_bulk_meetings(payload, {meeting["event_id"]: {"email_sent": True} for meeting in payload["meetings"]})
+
+    return {"meetings": len(payload["meetings"]), "email_sent": True}
+
+
+# API to schedule many meetings at once, from explicit rows or a recurrence rule
+@app.post('/api/schedule_meetings/bulk')
+async def schedule_meetings_bulk(rows: Optional[List[dict]] = Body(None), recurrence: Optional[dict] = Body(None)):
+    """Validate all rows together; calendar invites and one email per patient go through the outbox"""
+    if bool(rows) == bool(recurrence):
+        raise HTTPException(status_code=400, detail="Provide either rows or recurrence")
+    if recurrence:
+        try:
+            rows = expand_recurrence(recurrence)
+        except (KeyError, TypeError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid recurrence: {str(e)}")
+    if len(rows) > BULK_SCHEDULE_MAX_MEETINGS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_SCHEDULE_MAX_MEETINGS} meetings per request")
+
+    try:
+        patientids = list({row.get("patientid") for row in rows if isinstance(row.get("patientid"), int)})
+        patients = await run_db(lambda: {
+            patient["patientid"]: patient
+            for patient in collection.find({"patientid": {"$in": patientids}}, {"_id": 0, "patientid": 1, "name": 1, "email": 1})
+        })
+
+        doctors = await doctor_directory.get_many([row["doctor_id"] for row in rows if row.get("doctor_id") is not None])
+
+        meetings, errors = validate_schedule_rows(rows, patients, doctors)
+        if errors:
+            raise HTTPException(status_code=400, detail={"message": "No meetings were scheduled", "errors": errors})
+
+        jobs = await run_db(store_bulk_meetings, patients, meetings, timeout=60)
+        outbox.notify()
+    except AppointmentConflict as e:
+        raise HTTPException(status_code=409, detail={"message": "No meetings were scheduled; some overlap existing bookings", "conflicts": e.conflicts})
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to schedule meeting: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to schedule meetings: {str(e)}")
+
+    return MongoJSONResponse(status_code=202, content={
+        "message": f"{len(meetings)} meetings scheduled for {len(jobs)} patients; invites and emails are being processed",
+        "meetings": len(meetings),
+        "jobs": [{**job, "status_url": f"/api/jobs/{job['job_id']}"} for job in jobs],
+        "status": "accepted"
+    })
 
 # @app.post('/api/schedule_meeting')
 # async def schedule_meeting(patientid: int, meeting_datetime: str):
@@ -313,13 +720,9 @@ Test successful! ✅
 """
         msg.attach(MIMEText(body, 'plain'))
         
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        server.sendmail(EMAIL_ADDRESS, EMAIL_ADDRESS, msg.as_string())
-        server.quit()
+        await mailer.send(msg)
         
-        return JSONResponse(status_code=200, content={
+        return MongoJSONResponse(status_code=200, content={
             "message": "Email test successful!",
             "from_email": EMAIL_ADDRESS,
             "smtp_server": SMTP_SERVER,
@@ -327,7 +730,7 @@ Test successful! ✅
         })
         
     except Exception as e:
-        return JSONResponse(status_code=500, content={
+        return MongoJSONResponse(status_code=500, content={
             "message": "Email test failed",
             "error": str(e),
             "status": "failed"
@@ -337,39 +740,147 @@ Test successful! ✅
 @app.get('/api/health_check')
 async def health_check():
     return ("OK", 200)
+
+@app.get('/api/db/pool_stats')
+async def db_pool_stats():
+    """MongoDB connection pool and DB thread-offload usage"""
+    return pool_stats()
+
+
+@app.get('/api/whatsapp/stats')
+async def whatsapp_stats():
+    """ADA WhatsApp client call counters and latency"""
+    return ada_client.stats()
+
+
+@app.get('/api/email/stats')
+async def email_stats():
+    """SMTP session pool, queue depth and delivery latency"""
+    return mailer.stats()
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    """Per-route latency/status and outbound call metrics in Prometheus text format"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
  
+def records_projection(fields: Optional[str]):
+    """Projection for paged/streamed records (all patient fields by default).
+
+    "medications" is not a patient field: it is rebuilt from the readings
+    collection when listed in fields (see fetch_records_page).
+    """
+    if not fields:
+        return {"_id": 0}
+    projection = {"_id": 0, "patientid": 1}
+    for field in fields.split(","):
+        field = field.strip()
+        if field and field not in ("_id", "medications"):
+            projection[field] = 1
+    return projection
+
+
+def wants_medications(fields: Optional[str]):
+    return bool(fields) and "medications" in (field.strip() for field in fields.split(","))
+
+
+def fetch_records_page(projection: dict, after: Optional[int], limit: int, medications: bool = False):
+    """One keyset page ordered by patientid (served by the patientid index)."""
+    query = {"patientid": {"$gt": after}} if after is not None else {"patientid": {"$ne": None}}
+    records = list(collection.find(query, projection).sort("patientid", 1).limit(limit))
+    if medications and records:
+        attach_medications(records)
+    return records
+
+
+def fetch_all_patient_records():
+    """Every patient with its medications map, reading the readings one batch of patients at a time."""
+    records = list(collection.find({}, {"_id": 0}))
+    for start in range(0, len(records), FETCH_BATCH_SIZE):
+        attach_medications([record for record in records[start:start + FETCH_BATCH_SIZE] if "patientid" in record])
+    return records
+
+
+def fetch_patient_record(patientid: int):
+    record = collection.find_one({"patientid": patientid}, {"_id": 0})
+    if record:
+        record["medications"] = medications_by_patient([patientid])[patientid]
+    return record
+
+
+async def stream_records(projection: dict, after: Optional[int], limit: Optional[int], fmt: str, medications: bool = False):
+    """Yield records batch by batch so only one batch is held in memory."""
+    sent = 0
+    first = True
+    if fmt == "json":
+        yield "["
+    while limit is None or sent < limit:
+        batch_size = FETCH_BATCH_SIZE if limit is None else min(FETCH_BATCH_SIZE, limit - sent)
+        batch = await run_db(fetch_records_page, projection, after, batch_size, medications)
+        if not batch:
+            break
+        if fmt == "json":
+            chunk = b",".join(dumps(record) for record in batch)
+            yield chunk if first else b"," + chunk
+        else:
+            yield b"".join(dumps(record) + b"\n" for record in batch)
+        first = False
+        sent += len(batch)
+        after = batch[-1]["patientid"]
+        if len(batch) < batch_size:
+            break
+    if fmt == "json":
+        yield "]"
+
+
 @app.get('/api/fetch_all_records')
-async def fetch_all_records():
+async def fetch_all_records(
+    stream: Optional[str] = Query(None, description="Stream records in batches: 'ndjson' or 'json'"),
+    after: Optional[int] = Query(None, description="Return records with patientid greater than this cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size (or max records when streaming)"),
+    fields: Optional[str] = Query(None, description="Comma separated fields, e.g. name,mobileno,latest_riskrate (medications is rebuilt from the readings)"),
+):
+    if stream is not None:
+        if stream not in ("ndjson", "json"):
+            raise HTTPException(status_code=400, detail="stream must be 'ndjson' or 'json'")
+        media_type = "application/x-ndjson" if stream == "ndjson" else "application/json"
+        return StreamingResponse(
+            stream_records(records_projection(fields), after, limit, stream, wants_medications(fields)),
+            media_type=media_type
+        )
+
+    if after is not None or limit is not None or fields is not None:
+        try:
+            records = await run_db(
+                fetch_records_page, records_projection(fields), after, limit or FETCH_BATCH_SIZE, wants_medications(fields)
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+        next_after = records[-1]["patientid"] if len(records) == (limit or FETCH_BATCH_SIZE) else None
+        return {"records": records, "next_after": next_after}
+
     try:
-        records = list(collection.find({}, {"_id": 0}))
+        records = await run_db(fetch_all_patient_records)
         if not records:
             raise HTTPException(status_code=404, detail="No records found")
-        
-        for record in records:
-            if 'time' in record and hasattr(record['time'], 'isoformat'):
-                record['time'] = record['time'].isoformat()
-            if 'meeting_details' in record and isinstance(record['meeting_details'], dict):
-                if 'scheduled_at' in record['meeting_details']:
-                    # Handle both string and datetime objects
-                    scheduled_at = record['meeting_details']['scheduled_at']
-                    if hasattr(scheduled_at, 'isoformat'):
-                        record['meeting_details']['scheduled_at'] = scheduled_at.isoformat()
-                
-        return JSONResponse(status_code=200, content=records)
+
+        # Datetimes and other BSON values are encoded by the response class
+        return MongoJSONResponse(status_code=200, content=records)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
  
 @app.get('/api/fetch_patient_details')
-async def fetch_patient_details(patientid: int):
+async def fetch_patient_details(patientid: int, request: Request, response: Response):
+    # Unchanged since the client's copy: answer from the version alone
+    not_modified = await conditional_get(request, response, patientid)
+    if not_modified is not None:
+        return not_modified
     try:
-        patient_record = collection.find_one({"patientid": patientid}, {"_id": 0})
+        patient_record = await run_db(fetch_patient_record, patientid)
         if not patient_record:
             raise HTTPException(status_code=404, detail="Patient not found")
-        
-        if 'time' in patient_record and hasattr(patient_record['time'], 'isoformat'):
-            patient_record['time'] = patient_record['time'].isoformat()
-            
-        return JSONResponse(status_code=200, content=patient_record)
+
+        return MongoJSONResponse(status_code=200, content=patient_record, headers=dict(response.headers))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
@@ -377,26 +888,27 @@ async def fetch_patient_details(patientid: int):
 async def send_plan_via_whatsapp(patientid: int, type: str, background_tasks: BackgroundTasks):
     try:
         current_time = datetime.now()
-        update_result = collection.update_one(
+        update_result = await run_db(
+            collection.update_one,
             {"patientid": patientid},
-            {"$set": {"type": type, "time": current_time}}
+            bump_version({"$set": {"type": type, "time": current_time}})
         )
 
         if update_result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Patient Not Updated")
 
-        patient = collection.find_one({"patientid": patientid}, {"_id": 0})
+        patient = await run_db(collection.find_one, {"patientid": patientid}, {"_id": 0})
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
 
         template_name = get_template_name('Greetings')
-        send_greeting_message(template_name, patient["mobileno"], patient["name"])
+        await send_greeting_message(template_name, patient["mobileno"], patient["name"])
 
         background_tasks.add_task(send_daily_message, patient, type, 1, delay=5)
         for day_num in range(2, 8):
             background_tasks.add_task(send_daily_message, patient, type, day_num)
 
-        return JSONResponse(status_code=200, content={"message": "Plans for all 7 days will be sent daily!"})
+        return MongoJSONResponse(status_code=200, content={"message": "Plans for all 7 days will be sent daily!"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
     
@@ -458,7 +970,7 @@ async def send_plan_via_whatsapp(patientid: int, type: str, background_tasks: Ba
 async def send_patient_summary(patientid: int, type: str, background_tasks: BackgroundTasks):
     try:
         # Fetch patient record
-        patient = collection.find_one({"patientid": patientid}, {"_id": 0})
+        patient = await run_db(collection.find_one, {"patientid": patientid}, {"_id": 0})
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
 
@@ -480,7 +992,7 @@ async def send_patient_summary(patientid: int, type: str, background_tasks: Back
         template_data = [name, weight, bp, heartrate, sugar]
 
         # Send the WhatsApp message
-        response = send_whatsapp_message(template_name, mobile, template_data)
+        response = await send_whatsapp_message(template_name, mobile, template_data)
 
         # Build preview message for API response
         message_text = (
@@ -492,7 +1004,7 @@ async def send_patient_summary(patientid: int, type: str, background_tasks: Back
             f"Fasting Sugar: {sugar}\n"
         )
 
-        return JSONResponse(status_code=200, content={
+        return MongoJSONResponse(status_code=200, content={
             "message": f"Health summary sent to {name} on WhatsApp",
             "patientid": patientid,
             "whatsapp_response": response,
@@ -512,7 +1024,7 @@ async def send_daily_message(patient, type, day_num, delay=86400):
     message = f"{type.capitalize()} plan for {current_day} for {patient['name']}: {plan}"
     print(message)
     template_name = get_template_name(type)
-    response = send_template_message(template_name, patient["mobileno"], patient["name"], plan)
+    response = await send_template_message(template_name, patient["mobileno"], patient["name"], plan)
     print(f"Successfully sent the template '{template_name}' to {patient['mobileno']}.")
 
 if __name__ == "__main__":
@@ -520,7 +1032,7 @@ if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
 
-def send_static_template(template_name: str, mobile_number: str):
+async def send_static_template(template_name: str, mobile_number: str):
     """
     Send a static WhatsApp template that doesn't require parameters
     This function is specifically for templates with pre-defined content
@@ -532,7 +1044,7 @@ def send_static_template(template_name: str, mobile_number: str):
         # The template content is already defined in ADA
         template_data = []  # Empty array for static templates
         
-        response = send_whatsapp_message(template_name, mobile_number, template_data)
+        response = await send_whatsapp_message(template_name, mobile_number, template_data)
         return response
         
     except Exception as e:
@@ -557,9 +1069,9 @@ async def send_summary_template(mobile_number: str):
         template_name = get_template_name('HealthSummary')  # or 'summary' depending on your template mapping
         
         # Send static template using the new function
-        response = send_static_template(template_name, cleaned_mobile)
+        response = await send_static_template(template_name, cleaned_mobile)
         
-        return JSONResponse(status_code=200, content={
+        return MongoJSONResponse(status_code=200, content={
             "message": f"Summary template sent successfully to {mobile_number}",
             "mobile_number": cleaned_mobile,
             "template_name": template_name,
@@ -573,24 +1085,44 @@ async def send_summary_template(mobile_number: str):
         raise HTTPException(status_code=500, detail=f"Failed to send summary template: {str(e)}")
 
 
+def parse_meeting_cursor(value: Optional[str], name: str):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}. Use: YYYY-MM-DDTHH:MM:SS")
+
+
 @app.get('/api/patient/meetings')
-async def get_patient_meetings(patient_id: int):
+async def get_patient_meetings(
+    patient_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    upcoming_after: Optional[str] = None,
+    past_before: Optional[str] = None,
+):
+    """Upcoming (soonest first) and past (latest first) meetings, limit per list.
+
+    Pass next_upcoming_after / next_past_before from a response to get the next page.
+    """
+    after = parse_meeting_cursor(upcoming_after, "upcoming_after")
+    before = parse_meeting_cursor(past_before, "past_before")
     try:
-        patient = collection.find_one({"patientid": patient_id}, {"_id": 0})
-        if not patient:
-            raise HTTPException(status_code=404, detail="Patient not found")
-        patient_appointments = meeting_history_collection.find_one({"patient_id": patient_id})
-        if not patient_appointments:
+        page = await run_db(patient_meetings, patient_id, datetime.now(), limit, after, before)
+        if page is None:
+            # Only the error path needs to know whether the patient exists
+            if not await run_db(collection.count_documents, {"patientid": patient_id}, limit=1):
+                raise HTTPException(status_code=404, detail="Patient not found")
             raise HTTPException(status_code=404, detail="No Appointments Scheduled")
-        
-        else:
-            now = datetime.now()
-            past_appointments = list(filter(lambda x: datetime.fromisoformat(x['meeting_datetime'])< now, patient_appointments['meeting_details']))
-            upcoming_appointments = list(filter(lambda x: datetime.fromisoformat(x['meeting_datetime'])>= now, patient_appointments['meeting_details']))
+        upcoming_appointments, past_appointments = page
 
-        appointments= {"patient_id": patient_id,"upcoming_appointments":[upcoming_appointments], "past_appointments":[past_appointments]}
+        cursors = {}
+        for name, meetings in (("next_upcoming_after", upcoming_appointments), ("next_past_before", past_appointments)):
+            cursors[name] = meetings[-1]["meeting_at"].isoformat() if len(meetings) == limit else None
+
+        appointments= {"patient_id": patient_id,"upcoming_appointments":[upcoming_appointments], "past_appointments":[past_appointments], **cursors}
             
-        return JSONResponse(status_code=200, content=appointments)
+        return MongoJSONResponse(status_code=200, content=appointments)
     except HTTPException:
         raise
     except Exception as e:
@@ -598,11 +1130,11 @@ async def get_patient_meetings(patient_id: int):
 
 # API to Schedule Appointments without therapy and its mode
 @app.post('/api/patient/schedule_appointments')
-async def schedule_appointment(patientid: int, meeting_datetime: str):
-    """Schedule a meeting and send email to patient"""
+async def schedule_appointment(patientid: int, meeting_datetime: str, doctor_id: Optional[str] = None):
+    """Schedule an appointment; the Meet link and email are sent by the outbox worker"""
     try:
         # Fetch patient details
-        patient = collection.find_one({"patientid": patientid}, {"_id": 0})
+        patient = await run_db(collection.find_one, {"patientid": patientid}, {"_id": 0})
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         
@@ -620,55 +1152,13 @@ async def schedule_appointment(patientid: int, meeting_datetime: str):
         if meeting_dt <= datetime.now():
             raise HTTPException(status_code=400, detail="Meeting datetime must be in the future")
         
-        start_dt = datetime.fromisoformat(meeting_datetime)
-        end_dt = start_dt + timedelta(hours=1)
-
-        meet_link = create_google_meet_event(
-            summary=f"Consultation with {patient['name']}",
-            description="Health Consultation via Google Meet",
-            start_time=start_dt.isoformat(),
-            end_time=end_dt.isoformat()
-        )
-
-        # Send email with meeting details
-        email_sent = send_meeting_email(
-            patient['name'], 
-            patient['email'], 
-            meeting_datetime,
-            meet_link
-        )
-        
-        # Store meeting details in database
-        meeting_details = {
-            "meeting_link": meet_link,
-            "meeting_datetime": meeting_datetime,
-            "scheduled_at": datetime.now().isoformat(),
-            "email_sent": email_sent
-        }
+        details = {}
+        if doctor_id is not None:
+            if not await doctor_directory.get(doctor_id):
+                raise HTTPException(status_code=404, detail="Doctor not found")
+            details["doctor_id"] = doctor_id
 
-        track_meeting = {
-            "patient_id": patientid,
-            "patient_email": patient['email'],
-            "meeting_details": [meeting_details]
-        }
-        past_meetings = appointments_collection.find_one({"patient_id": patientid})
-        if past_meetings:
-            update_history = appointments_collection.update_one(
-                {"patient_id": patientid},
-                {"$push": {"meeting_details": meeting_details}}
-            )
-        else:
-            history = appointments_collection.insert_one(track_meeting)           
-        
-        return JSONResponse(status_code=200, content={
-            "message": f"Meeting scheduled successfully for {patient['name']}",
-            "patient_name": patient['name'],
-            "patient_email": patient['email'],
-            "meeting_link": meet_link,
-            "meeting_datetime": meeting_datetime,
-            "email_sent": email_sent,
-            "status": "success"
-        })
+        return await accept_meeting(SOURCE_APPOINTMENTS, patient, meeting_datetime, details)
         
     except HTTPException:
         raise
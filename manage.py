@@ -0,0 +1,152 @@
+"""Maintenance commands for the Patient360 database.
+
+Usage: python manage.py <command> [options]
+"""
+import argparse
+
+from utils.db import ensure_indexes
+
+
+def cmd_ensure_indexes(args):
+    ensure_indexes()
+    print("✅ Indexes created")
+
+
+def cmd_backfill_patient_summary(args):
+    from patient.records import backfill_patient_summaries
+
+    updated = backfill_patient_summaries(batch_size=args.batch_size)
+    print(f"✅ Patient summaries refreshed ({updated} documents changed)")
+
+
+def cmd_rebuild_stats(args):
+    from patient.stats import rebuild_stats
+
+    previous, totals = rebuild_stats()
+    if previous is None:
+        print("✅ Stats document created")
+        return
+    # Report drift between the incremental counters and the recount
+    for key in ("total_patients", "total_appointments", "new_patients_by_year", "risk_summary"):
+        if previous.get(key) != totals[key]:
+            print(f"⚠️ {key}: {previous.get(key)} -> {totals[key]}")
+    print("✅ Stats document rebuilt")
+
+
+def cmd_backfill_appointments(args):
+    from utils.appointments import backfill_appointment_entries
+
+    written = backfill_appointment_entries(batch_size=args.batch_size)
+    print(f"✅ Flattened appointments backfilled ({written} entries written)")
+
+
+def cmd_rebuild_dashboards(args):
+    from patient.dashboard_store import rebuild_dashboards, refresh_dashboard
+
+    if args.patientid is not None:
+        if refresh_dashboard(args.patientid) is None:
+            print(f"❌ Patient {args.patientid} not found")
+            return
+        print(f"✅ Dashboard rebuilt for patient {args.patientid}")
+        return
+    written = rebuild_dashboards(batch_size=args.batch_size)
+    print(f"✅ Dashboards rebuilt ({written} patients)")
+
+
+def cmd_merge_duplicate_history(args):
+    from utils.appointments import merge_duplicate_histories
+
+    merged = merge_duplicate_histories()
+    print(f"✅ Appointment histories merged ({merged} duplicate documents folded in)")
+
+
+def cmd_backfill_meeting_at(args):
+    from utils.appointments import backfill_meeting_at
+
+    updated = backfill_meeting_at()
+    print(f"✅ meeting_at added to stored meetings ({updated} history documents changed)")
+
+
+def cmd_migrate_readings(args):
+    from patient.readings import migrate_embedded_medications
+
+    patients, readings = migrate_embedded_medications(batch_size=args.batch_size, drop_embedded=args.drop_embedded)
+    print(f"✅ Readings migrated ({readings} readings from {patients} patients)")
+    if not args.drop_embedded:
+        print("⚠️ Embedded medications kept; re-run with --drop-embedded once the readings are verified")
+
+
+def cmd_normalize_vitals(args):
+    from patient.readings import normalize_stored_readings
+    from patient.records import backfill_registered_on
+
+    readings = normalize_stored_readings(batch_size=args.batch_size)
+    patients = backfill_registered_on(batch_size=args.batch_size)
+    print(f"✅ Typed fields stored ({readings} readings, {patients} patients changed)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("ensure-indexes", help="Create the indexes used by the API").set_defaults(func=cmd_ensure_indexes)
+
+    backfill = commands.add_parser(
+        "backfill-patient-summary",
+        help="Recompute latest risk/update fields used by patients_list"
+    )
+    backfill.add_argument("--batch-size", type=int, default=500)
+    backfill.set_defaults(func=cmd_backfill_patient_summary)
+
+    commands.add_parser(
+        "rebuild-stats",
+        help="Recount the total_counts stats document and report drift "
+             "(registrations/medications written during the recount are lost; run it when writes are quiet)"
+    ).set_defaults(func=cmd_rebuild_stats)
+
+    appointments = commands.add_parser(
+        "backfill-appointments",
+        help="Copy nested appointments into the flattened appointments collection"
+    )
+    appointments.add_argument("--batch-size", type=int, default=1000)
+    appointments.set_defaults(func=cmd_backfill_appointments)
+
+    dashboards = commands.add_parser(
+        "rebuild-dashboards",
+        help="Recompute the materialized patient dashboards"
+    )
+    dashboards.add_argument("--patientid", type=int, help="Only rebuild this patient")
+    dashboards.add_argument("--batch-size", type=int, default=200)
+    dashboards.set_defaults(func=cmd_rebuild_dashboards)
+
+    commands.add_parser(
+        "merge-duplicate-history",
+        help="Fold duplicate per-patient meeting/appointment history documents (run before ensure-indexes)"
+    ).set_defaults(func=cmd_merge_duplicate_history)
+
+    commands.add_parser(
+        "backfill-meeting-at",
+        help="Add meeting_at datetimes to stored meetings (needed by /api/patient/meetings)"
+    ).set_defaults(func=cmd_backfill_meeting_at)
+
+    readings = commands.add_parser(
+        "migrate-readings",
+        help="Move embedded medications maps into the vitals readings collection (safe to re-run)"
+    )
+    readings.add_argument("--batch-size", type=int, default=200)
+    readings.add_argument("--drop-embedded", action="store_true", help="Unset the medications map once its readings are written")
+    readings.set_defaults(func=cmd_migrate_readings)
+
+    normalize = commands.add_parser(
+        "normalize-vitals",
+        help="Store numeric vitals and datetimes next to the raw strings (resumable; run after migrate-readings)"
+    )
+    normalize.add_argument("--batch-size", type=int, default=500)
+    normalize.set_defaults(func=cmd_normalize_vitals)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import numpy as np
+from calendar import month_name as calendar_month_name
+from datetime import timezone
+
+
+#Define healthy ranges
+HEALTHY_HR = (60, 100)
+HEALTHY_SPO2 = 95
+HEALTHY_BP = (90, 120)
+
+# Standard healthy levels shown next to the patient's actual values
+HEALTHY_LEVELS = {
+    "heartrate": 80,   # midpoint of 60-100
+    "SpO2": 97.5,      # midpoint of 95-100
+    "bp": "120/80"
+}
+
+MONTHS = [calendar_month_name[i] for i in range(1, 13)]
+
+
+# Numeric columns normalized at write time (reading["values"], see records.normalize_reading)
+VITAL_FIELDS = ("heartrate", "SpO2", "Stress", "riskrate", "systolic", "diastolic", "bp")
+
+
+def _epoch(dt):
+    """Epoch seconds of a stored datetime (BSON dates come back naive UTC); NaN if missing."""
+    if dt is None:
+        return np.nan
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _none_if_nan(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+# ---------------- COLUMNAR READINGS ----------------
+
+class ReadingFrame:
+    """Columnar NumPy view of medication readings: one row per reading.
+
+    Build it once per patient (from_readings) and run every aggregate on the
+    arrays instead of re-walking the documents. Rows come from the typed fields
+    stored at write time ("at", "month", "values"); nothing is parsed here.
+    """
+
+    def __init__(self, keys, records):
+        self.keys = list(keys)
+        self.records = list(records)
+        self.time = np.array([_epoch(record.get("at")) for record in self.records], dtype=np.float64)
+        self.month = np.array([record.get("month") or 0 for record in self.records], dtype=np.int64)
+        # None (invalid raw value) becomes NaN
+        self.columns = {
+            field: np.array([(record.get("values") or {}).get(field) for record in self.records], dtype=np.float64)
+            for field in VITAL_FIELDS
+        }
+
+    @classmethod
+    def from_readings(cls, readings: list):
+        """Frame over documents from the readings collection (rows keyed by medication_id)."""
+        return cls([reading.get("medication_id") for reading in readings], readings)
+
+    def __len__(self):
+        return len(self.records)
+
+    def latest_index(self):
+        """Row of the most recent valid reading (first one on ties), or None."""
+        if not len(self) or np.isnan(self.time).all():
+            return None
+        return int(np.argmax(np.where(np.isnan(self.time), -np.inf, self.time)))
+
+    def monthly_means(self, column: str):
+        """Mean of a column per calendar month (12 values, NaN where no data)."""
+        values = self.columns[column]
+        mask = ~np.isnan(values) & (self.month > 0)
+        sums = np.bincount(self.month[mask], weights=values[mask], minlength=13)[1:]
+        counts = np.bincount(self.month[mask], minlength=13)[1:]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / counts
+
+
+# ---------------- VECTORIZED RISK SCORES ----------------
+
+def _range_risk(values, low, high):
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        risk = np.where(values < low, (low - values) / low * 100,
+                        np.where(values > high, (values - high) / high * 100, 0.0))
+    return np.where(np.isnan(values), np.nan, risk)
+
+
+def _risk_result(value, risk):
+    """Arrays keep NaN; scalars keep the original None / 0 / rounded float contract."""
+    if np.ndim(risk):
+        return np.round(risk, 2)
+    if value is None or np.isnan(risk):
+        return None
+    return 0 if risk == 0 else round(float(risk), 2)
+
+
+# Functions to calculate risk percentages (scalars or arrays)
+def calc_hr_risk(hr):
+    if hr is None:
+        return None
+    low, high = HEALTHY_HR
+    return _risk_result(hr, _range_risk(hr, low, high))
+
+def calc_spo2_risk(sp):
+    if sp is None:
+        return None
+    values = np.asarray(sp, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        risk = np.where(values >= HEALTHY_SPO2, 0.0, (HEALTHY_SPO2 - values) / HEALTHY_SPO2 * 100)
+    risk = np.where(np.isnan(values), np.nan, risk)
+    return _risk_result(sp, risk)
+
+def calc_bp_risk(bp):
+    if bp is None:
+        return None
+    low, high = HEALTHY_BP
+    return _risk_result(bp, _range_risk(bp, low, high))
+
+
+# ---------------- DASHBOARD SECTIONS ----------------
+
+def latest_vitals(med: dict):
+    """Vitals shown on the patient dashboard card."""
+    return {
+        "bp": med.get("bp"),
+        "age": med.get("age"),
+        "heartrate": med.get("heartrate"),
+        "SpO2": med.get("SpO2"),
+        "Stress": med.get("Stress"),
+        "Respiratoryrate": med.get("Respiratoryrate"),
+        "riskrate": med.get("riskrate"),
+    }
+
+
+def risk_weightage(frame: ReadingFrame, index: int):
+    """Risk percentages of one reading against the healthy ranges."""
+    return {
+        "heartrate": {
+            "risk_percent": calc_hr_risk(_none_if_nan(frame.columns["heartrate"][index]))
+        },
+        "SpO2": {
+            "risk_percent": calc_spo2_risk(_none_if_nan(frame.columns["SpO2"][index]))
+        },
+        "blood_pressure": {
+            "risk_percent": calc_bp_risk(_none_if_nan(frame.columns["bp"][index]))  # systolic
+        },
+    }
+
+
+def average_actual(frame: ReadingFrame, index: int):
+    """Actual values of one reading next to the standard healthy levels."""
+    return {
+        "actual": {
+            "heartrate": _none_if_nan(frame.columns["heartrate"][index]),
+            "SpO2": _none_if_nan(frame.columns["SpO2"][index]),
+            "bp": frame.records[index].get("bp")  # Keep as string
+        },
+        "average": dict(HEALTHY_LEVELS)
+    }
+
+
+def _rounded(means):
+    return [None if np.isnan(mean) else round(float(mean), 2) for mean in means]
+
+
+def monthly_risk(frame: ReadingFrame):
+    """Average risk rate per calendar month."""
+    return [
+        {"month": month, "average_riskrate": average}
+        for month, average in zip(MONTHS, _rounded(frame.monthly_means("riskrate")))
+    ]
+
+
+def health_trend(frame: ReadingFrame):
+    """Average heartrate, SpO2, stress and blood pressure per calendar month."""
+    fields = ("heartrate", "SpO2", "Stress", "systolic", "diastolic")
+    averages = {field: _rounded(frame.monthly_means(field)) for field in fields}
+    return {
+        month: {field: averages[field][i] for field in fields}
+        for i, month in enumerate(MONTHS)
+    }
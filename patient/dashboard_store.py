@@ -0,0 +1,87 @@
+from datetime import datetime, timezone
+from pymongo import ReplaceOne
+from utils.db import collection, dashboard_collection, readings_collection
+from patient import analytics
+from patient.readings import readings_in_range, VITALS_PROJECTION
+
+DASHBOARD_SOURCE_PROJECTION = {"_id": 0, "patientid": 1, "name": 1, "gender": 1}
+
+
+def build_dashboard(patient: dict, readings: list):
+    """Compute the materialized dashboard document for one patient from its vitals readings."""
+    frame = analytics.ReadingFrame.from_readings(readings)
+    index = frame.latest_index()
+    latest_med = frame.records[index] if index is not None else None
+
+    return {
+        "patientid": patient["patientid"],
+        "name": patient.get("name"),
+        "gender": patient.get("gender"),
+        "medication_count": len(readings),
+        "latest_medication_id": frame.keys[index] if index is not None else None,
+        "latest_time": latest_med.get("at") if latest_med else None,
+        "latest": analytics.latest_vitals(latest_med) if latest_med else None,
+        "risk_weightage": analytics.risk_weightage(frame, index) if latest_med else None,
+        "average_actual": analytics.average_actual(frame, index) if latest_med else None,
+        "monthly_risk": analytics.monthly_risk(frame),
+        "health_trend": analytics.health_trend(frame),
+        # Staleness metadata: writers flip "stale" before recomputing
+        "computed_at": datetime.now(timezone.utc),
+        "stale": False,
+    }
+
+
+def mark_stale(patientid: int):
+    dashboard_collection.update_one(
+        {"patientid": patientid},
+        {"$set": {"stale": True}, "$currentDate": {"stale_since": True}}
+    )
+
+
+def refresh_dashboard(patientid: int):
+    """Recompute and store one patient's dashboard; None if the patient does not exist."""
+    patient = collection.find_one({"patientid": patientid}, DASHBOARD_SOURCE_PROJECTION)
+    if not patient:
+        return None
+    dashboard = build_dashboard(patient, readings_in_range(patientid, projection=VITALS_PROJECTION))
+    dashboard_collection.replace_one({"patientid": patientid}, dashboard, upsert=True)
+    return dashboard
+
+
+def read_dashboard(patientid: int):
+    """Materialized dashboard via one indexed find_one, rebuilt when missing or stale."""
+    dashboard = dashboard_collection.find_one({"patientid": patientid}, {"_id": 0})
+    if dashboard is None or dashboard.get("stale"):
+        dashboard = refresh_dashboard(patientid)
+    return dashboard
+
+
+def _rebuild_batch(patients: list):
+    # One readings query for the whole batch instead of one per patient
+    readings = {patient["patientid"]: [] for patient in patients}
+    cursor = readings_collection.find(
+        {"patientid": {"$in": list(readings)}},
+        {**VITALS_PROJECTION, "patientid": 1}
+    ).sort([("patientid", 1), ("at", 1)])
+    for reading in cursor:
+        readings[reading.pop("patientid")].append(reading)
+    ops = [
+        ReplaceOne({"patientid": patient["patientid"]}, build_dashboard(patient, readings[patient["patientid"]]), upsert=True)
+        for patient in patients
+    ]
+    dashboard_collection.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def rebuild_dashboards(batch_size: int = 200):
+    """Recompute every patient's dashboard in bulk batches."""
+    written = 0
+    batch = []
+    for patient in collection.find({"patientid": {"$ne": None}}, DASHBOARD_SOURCE_PROJECTION):
+        batch.append(patient)
+        if len(batch) >= batch_size:
+            written += _rebuild_batch(batch)
+            batch = []
+    if batch:
+        written += _rebuild_batch(batch)
+    return written
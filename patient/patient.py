@@ -1,110 +1,33 @@
 from fastapi import HTTPException, Query
-from dotenv import load_dotenv
-from pymongo import MongoClient  
-import os 
 from datetime import datetime, timedelta, timezone
-from dateutil import parser
-from dateutil.relativedelta import relativedelta
-from fastapi.responses import JSONResponse
+from typing import Optional
+from pymongo import ASCENDING, DESCENDING
+from utils.serialization import MongoJSONResponse
 from app_instance import app
-
-
-
-
-load_dotenv()
-
-
-MONGODB_CONNECTION_STRING = os.getenv("MONGODB_CONNECTION_STRING")
-DATABASE_NAME = os.getenv("DATABASE_NAME")
-COLLECTION_NAME = os.getenv("COLLECTION_NAME")
-DOCTORS_COLLECTION = os.getenv("DOCTORS_COLLECTION")
-
-client = MongoClient(MONGODB_CONNECTION_STRING)
-db = client[DATABASE_NAME]
-collection = db[COLLECTION_NAME]
-doctors_collection = db[DOCTORS_COLLECTION]
+from utils.db import run_db, collection
+from utils.doctor_directory import doctor_directory
+from utils.appointments import count_meetings_by_doctor, SOURCE_MEDICATIONS
+from patient import stats
 
 
 # API to get total counts
 @app.get("/api/patient/total_counts")
-def total_counts():
+async def total_counts():
     try:
-        # ---------------- TOTAL PATIENTS ----------------
-        total_patients = collection.count_documents({})
-
-        # ---------------- TOTAL APPOINTMENTS ----------------
-        # Count medications inside each patient document
-        total_appointments = 0
-        all_patients = collection.find({}, {"medications": 1, "registered_at": 1})
-
-        # Variables reused for other parts
-        new_patients = 0
-        risk_summary  = {}
-
-        now = datetime.now(timezone.utc)
-        current_year_start = datetime(now.year, 1, 1, tzinfo=timezone.utc)
-        current_year_end = datetime(now.year + 1, 1, 1, tzinfo=timezone.utc)
-
-        for p in all_patients:
-            medications = p.get("medications", {})
-            patient_id = p.get("_id")
-
-            # ---------- TOTAL APPOINTMENTS ----------
-            if isinstance(medications, dict):
-                total_appointments += len(medications)
-
-            # ---------- NEW PATIENTS ----------
-            reg = p.get("registered_at")
-            if reg:
-                try:
-                    dt = parser.parse(reg)
-                    if dt.tzinfo is None:
-                        dt = dt.replace(tzinfo=timezone.utc)
-                    if current_year_start <= dt < current_year_end:
-                        new_patients += 1
-                except:
-                    pass
-
-            # ---------- LATEST RISK VALUE ----------
-            latest_time = None
-            latest_risk = None
-
-            for key, med in medications.items():
-                try:
-                    med_time = parser.parse(med.get("time"))
-                    if med_time.tzinfo is None:
-                        med_time = med_time.replace(tzinfo=timezone.utc)
-
-                    if (latest_time is None) or (med_time > latest_time):
-                        latest_time = med_time
-                        latest_risk = int(med.get("riskrate", 0))
-
-                except:
-                    continue
-
-            if latest_risk is not None:
-                risk_summary [patient_id] = latest_risk
-
-        # ---------------- RISK CATEGORY SUMMARY ----------------
-        low_risk = mid_risk = high_risk = 0
-
-        for risk in risk_summary.values():
-            if risk <= 45:
-                low_risk += 1
-            elif 46 <= risk <= 75:
-                mid_risk += 1
-            else:
-                high_risk += 1
+        # Counters are maintained on every registration/medication write
+        totals = await run_db(stats.read_stats, timeout=300)
+        risk_summary = totals.get("risk_summary", {})
+        current_year = str(datetime.now(timezone.utc).year)
 
         # ---------------- FINAL RESPONSE ----------------
         return {
-            "total_patients": total_patients,
-            "total_appointments": total_appointments,
-            "new_patients": new_patients,
+            "total_patients": totals.get("total_patients", 0),
+            "total_appointments": totals.get("total_appointments", 0),
+            "new_patients": totals.get("new_patients_by_year", {}).get(current_year, 0),
             "risk_summary": {
-                "low_risk": low_risk,
-                "mid_risk": mid_risk,
-                "high_risk": high_risk
+                "low_risk": risk_summary.get("low_risk", 0),
+                "mid_risk": risk_summary.get("mid_risk", 0),
+                "high_risk": risk_summary.get("high_risk", 0)
             }
         }
 
@@ -112,45 +35,167 @@ def total_counts():
         raise HTTPException(500, f"Internal Server Error: {str(e)}")
 
 
-# API to fetch list of patients
-@app.get("/api/patient/patients_list")
-async def patients_list():
-
-    try:
-        patients_details = collection.find({})
-        patients_list = []
+# Risk bands used by the dashboard (same cut-offs as total_counts)
+RISK_BANDS = {
+    "low": {"$lte": 45},
+    "mid": {"$gt": 45, "$lte": 75},
+    "high": {"$gt": 75},
+}
 
-        si_no = 1
+# Sortable fields of patients_list and the patient field backing each one
+PATIENT_SORT_FIELDS = {
+    "patientid": "patientid",
+    "risk_score": "latest_riskrate",
+    "last_updated": "latest_at",
+}
 
-        for patient in patients_details:
 
-            medications = patient.get("medications", {})
+def parse_list_datetime(value: str, name: str):
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(400, f"Invalid {name}. Use ISO format YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def keyset_condition(sort_field: str, direction: int, anchor_value, after: int):
+    """Match the rows that come after (anchor_value, after) in (sort_field, patientid) order."""
+    op = "$gt" if direction == ASCENDING else "$lt"
+    if sort_field == "patientid":
+        return {"patientid": {op: after}}
+    if anchor_value is None:
+        # Missing values sort first ascending and last descending
+        same = {sort_field: None, "patientid": {op: after}}
+        return {"$or": [same, {sort_field: {"$ne": None}}]} if direction == ASCENDING else same
+    clauses = [
+        {sort_field: {op: anchor_value}},
+        {sort_field: anchor_value, "patientid": {op: after}},
+    ]
+    if direction == DESCENDING:
+        # Missing values sort last descending, so they still come after the anchor
+        clauses.append({sort_field: None})
+    return {"$or": clauses}
+
+
+def encode_cursor(sort_field: str, row: dict):
+    """X-Next-After for the last row of a page: "<sort value>|<patientid>" ("<patientid>" when sorting by it).
+
+    The sort value travels with the cursor so the next page does not depend
+    on the anchor patient's current value (it changes with every reading).
+    """
+    if sort_field == "patientid":
+        return str(row["patientid"])
+    value = row.get(sort_field)
+    if value is None:
+        value = ""
+    elif isinstance(value, datetime):
+        # Stored datetimes are UTC (naive when read back)
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        value = value.isoformat()
+    return f"{value}|{row['patientid']}"
+
+
+def parse_cursor(sort_field: str, after: str):
+    """(patientid, anchor) from an after cursor; anchor is None when only a patientid was given."""
+    value, separator, patientid = after.rpartition("|")
+    try:
+        patientid = int(patientid)
+        if not separator or sort_field == "patientid":
+            return patientid, None
+        if value == "":
+            return patientid, {sort_field: None}
+        if sort_field == "latest_at":
+            return patientid, {sort_field: parse_list_datetime(value, "after")}
+        return patientid, {sort_field: float(value)}
+    except ValueError:
+        raise HTTPException(400, "after must be the X-Next-After value of the previous page")
 
-            # If no medications exist
-            if medications:
-                
-                latest_medication = sorted(medications.keys())[-1]
-                last_medication = medications[latest_medication]
 
-                last_updated = last_medication.get("time")
-                risk_score = last_medication.get("riskrate")
-            else:
-                last_updated = None
-                risk_score = None
+# API to fetch list of patients
+@app.get("/api/patient/patients_list")
+async def patients_list(
+    after: Optional[str] = Query(None, description="X-Next-After header of the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    gender: Optional[str] = None,
+    risk_band: Optional[str] = Query(None, description="low, mid or high"),
+    updated_from: Optional[str] = Query(None, description="ISO date/datetime, inclusive"),
+    updated_to: Optional[str] = Query(None, description="ISO date/datetime, exclusive"),
+    sort_by: str = Query("patientid", description="patientid, risk_score or last_updated"),
+    order: str = Query("asc", description="asc or desc"),
+):
+    if sort_by not in PATIENT_SORT_FIELDS:
+        raise HTTPException(400, "sort_by must be one of patientid, risk_score, last_updated")
+    if order not in ("asc", "desc"):
+        raise HTTPException(400, "order must be asc or desc")
+    if risk_band is not None and risk_band not in RISK_BANDS:
+        raise HTTPException(400, "risk_band must be one of low, mid, high")
+
+    sort_field = PATIENT_SORT_FIELDS[sort_by]
+    direction = ASCENDING if order == "asc" else DESCENDING
+
+    # Server-side filters, all served by the patient list indexes
+    conditions = []
+    if gender:
+        conditions.append({"gender": gender})
+    if risk_band:
+        conditions.append({"latest_riskrate": RISK_BANDS[risk_band]})
+    updated_range = {}
+    if updated_from:
+        updated_range["$gte"] = parse_list_datetime(updated_from, "updated_from")
+    if updated_to:
+        updated_range["$lt"] = parse_list_datetime(updated_to, "updated_to")
+    if updated_range:
+        conditions.append({"latest_at": updated_range})
 
-            patients_list.append({
-                "si_no": si_no,
+    try:
+        if after is not None:
+            after_id, anchor = parse_cursor(sort_field, after)
+            if anchor is None and sort_field != "patientid":
+                # A bare patient_id (older clients): read the anchor patient's current value
+                anchor = await run_db(collection.find_one, {"patientid": after_id}, {"_id": 0, sort_field: 1})
+                if anchor is None:
+                    raise HTTPException(400, "after must be the patient_id of a listed patient")
+            anchor_value = anchor.get(sort_field) if anchor else None
+            conditions.append(keyset_condition(sort_field, direction, anchor_value, after_id))
+
+        query = {"$and": conditions} if conditions else {}
+        projection = {"_id": 0, "patientid": 1, "name": 1, "gender": 1, "latest_time": 1, "latest_riskrate": 1, sort_field: 1}
+        sort = [(sort_field, direction)] if sort_field == "patientid" else [(sort_field, direction), ("patientid", direction)]
+
+        def fetch_page():
+            cursor = collection.find(query, projection).sort(sort)
+            if limit:
+                cursor = cursor.limit(limit)
+            return list(cursor)
+
+        patients_details = await run_db(fetch_page)
+
+        # Serial numbers only for the full list: keyset pages would restart them at 1
+        paged = limit is not None or after is not None
+        patients_list = [
+            {
+                **({} if paged else {"si_no": si_no}),
                 "patient_id": str(patient.get("patientid", "")),
                 "name": patient.get("name", ""),
                 "gender": patient.get("gender", ""),
-                "last_updated": last_updated,
-                "risk_score": risk_score
-            })
+                "last_updated": patient.get("latest_time"),
+                "risk_score": patient.get("latest_riskrate")
+            }
+            for si_no, patient in enumerate(patients_details, start=1)
+        ]
 
-            si_no += 1
+        # Cursor for the next page goes in a header so the body keeps its list shape
+        headers = {}
+        if limit and len(patients_details) == limit:
+            headers["X-Next-After"] = encode_cursor(sort_field, patients_details[-1])
 
-        return patients_list
+        return MongoJSONResponse(status_code=200, content=patients_list, headers=headers)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -162,7 +207,8 @@ async def patients_list():
 @app.get("/api/doctors/doctors_list")
 async def doctors_list():
     try:
-        doctors_details = doctors_collection.find({})
+        # Served from the in-process doctor directory
+        doctors_details = await doctor_directory.all()
         doctors_list = []
 
         for doctor in doctors_details:
@@ -181,6 +227,13 @@ async def doctors_list():
         raise HTTPException(status_code=500, detail=str(e))
     
 
+# API to drop cached doctor entries after the doctors collection changes
+@app.post("/api/doctors/cache/invalidate")
+async def invalidate_doctor_cache(doctor_id: Optional[str] = None):
+    doctor_directory.invalidate(doctor_id)
+    return {"message": "Doctor cache invalidated", "doctor_id": doctor_id, "cache": doctor_directory.stats()}
+
+
 @app.get("/api/patient/appointments_by_date")
 async def appointments_by_date(date: str = Query(..., description="Format: YYYY-MM-DD")):
     try:
@@ -190,55 +243,25 @@ async def appointments_by_date(date: str = Query(..., description="Format: YYYY-
         except:
             raise HTTPException(400, "Invalid date format. Use YYYY-MM-DD")
 
-        start = selected_date.isoformat()
-        end = (selected_date + timedelta(days=1)).isoformat()
-
-        #  Fetch ALL patients (only required fields)
-        patients = collection.find({}, {"patientid": 1, "medications": 1})
-
-        doctor_counts = {}  # doctor_id → {name, specialisation, count}
-
-        #  Loop through each patient and manually process medications
-        for p in patients:
-            meds = p.get("medications", {})
-            if not meds:
-                continue
+        start = selected_date
+        end = selected_date + timedelta(days=1)
 
-            # Convert medications object → python dictionary iteration
-            for key, med_data in meds.items():
-                meeting = med_data.get("meeting_details")
-                if not meeting:
-                    continue
+        # Index scan over the flattened appointments, grouped per doctor
+        # (medication meetings only, as before the appointments were flattened)
+        meeting_counts = await run_db(count_meetings_by_doctor, start, end, SOURCE_MEDICATIONS)
 
-                doc_id = meeting.get("doctor_id")
-                meeting_time = meeting.get("meeting_datetime")
+        # One cached/bulk lookup for all doctors instead of one query per meeting
+        doctors = await doctor_directory.get_many(meeting_counts.keys())
 
-                if not doc_id or not meeting_time:
-                    continue
-
-                # Check date range
-                if start <= meeting_time < end:
-                    # Fetch doctor info manually (NO $lookup)
-                    doctor = doctors_collection.find_one(
-                        {"doctor_id": doc_id},
-                        {"_id": 0, "name": 1, "specialisation": 1}
-                    )
-
-                    if not doctor:
-                        continue
-
-                    #  Group and count manually (NO $group)
-                    if doc_id not in doctor_counts:
-                        doctor_counts[doc_id] = {
-                            "doctor_name": doctor["name"],
-                            "specialisation": doctor["specialisation"],
-                            "appointment_count": 1
-                        }
-                    else:
-                        doctor_counts[doc_id]["appointment_count"] += 1
-
-        # Convert dictionary to list
-        result = list(doctor_counts.values())
+        result = [
+            {
+                "doctor_name": doctors[doc_id]["name"],
+                "specialisation": doctors[doc_id]["specialisation"],
+                "appointment_count": count
+            }
+            for doc_id, count in meeting_counts.items()
+            if doctors[doc_id]
+        ]
 
         # Sort alphabetically (NO $sort)
         result.sort(key=lambda x: x["doctor_name"])
@@ -266,57 +289,22 @@ async def monthly_reports():
         else:
             start_of_next_month = datetime(today.year, today.month + 1, 1)
 
-        start = start_of_month.isoformat()
-        end = start_of_next_month.isoformat()
-
-        #  Fetch all patients
-        patients = collection.find({}, {"patientid": 1, "medications": 1})
-
-        # doctor_id → {name, specialisation, count}
-        doctor_summary = {}
-
-        #  Loop through each patient
-        for p in patients:
-            meds = p.get("medications", {})
-            if not meds:
-                continue
-
-            # Convert medications object into loopable items
-            for key, med in meds.items():
-                meeting = med.get("meeting_details")
-                if not meeting:
-                    continue
-
-                doctor_id = meeting.get("doctor_id")
-                meeting_time = meeting.get("meeting_datetime")
-
-                if not doctor_id or not meeting_time:
-                    continue
-
-                # Filter meetings falling in this month
-                if not (start <= meeting_time < end):
-                    continue
-
-                #  Fetch doctor info (replaces $lookup)
-                doctor = doctors_collection.find_one(
-                    {"doctor_id": doctor_id},
-                    {"_id": 0, "name": 1, "specialisation": 1}
-                )
-                if not doctor:
-                    continue
-
-                #  Count appointments (replaces $group)
-                if doctor_id not in doctor_summary:
-                    doctor_summary[doctor_id] = {
-                        "doctor_name": doctor["name"],
-                        "specialisation": doctor["specialisation"],
-                        "appointment_count": 1
-                    }
-                else:
-                    doctor_summary[doctor_id]["appointment_count"] += 1
-
-        #  Convert dictionary → list
-        results = list(doctor_summary.values())
+        # Index scan over the flattened appointments, grouped per doctor (replaces $group);
+        # medication meetings only, as before the appointments were flattened
+        meeting_counts = await run_db(count_meetings_by_doctor, start_of_month, start_of_next_month, SOURCE_MEDICATIONS)
+
+        #  Fetch doctor info in one cached/bulk lookup (replaces $lookup)
+        doctors = await doctor_directory.get_many(meeting_counts.keys())
+
+        results = [
+            {
+                "doctor_name": doctors[doctor_id]["name"],
+                "specialisation": doctors[doctor_id]["specialisation"],
+                "appointment_count": count
+            }
+            for doctor_id, count in meeting_counts.items()
+            if doctors[doctor_id]
+        ]
 
         #  Sort by appointment count (replaces $sort)
         results.sort(key=lambda x: x["appointment_count"], reverse=True)
@@ -1,30 +1,19 @@
-from fastapi import HTTPException
-from dotenv import load_dotenv
-import os
-from pymongo import MongoClient
-from datetime import datetime, timezone
-from calendar import month_name as calendar_month_name
-import calendar
+from fastapi import HTTPException, Request, Response, Query
+from typing import Optional
 from app_instance import app
-
-
-
-
-load_dotenv()
-
-MONGODB_CONNECTION_STRING = os.getenv("MONGODB_CONNECTION_STRING")
-DATABASE_NAME = os.getenv("DATABASE_NAME")
-COLLECTION_NAME = os.getenv("COLLECTION_NAME")
-
-
-client = MongoClient(MONGODB_CONNECTION_STRING)
-db = client[DATABASE_NAME]
-collection = db[COLLECTION_NAME]
+from utils.db import run_db, collection
+from patient import analytics
+from patient.dashboard_store import read_dashboard
+from patient.records import conditional_get, parse_time
+from patient.readings import (
+    latest_readings, readings_in_range, aggregate_readings,
+    VITALS_PROJECTION, PLAN_PROJECTION, EPISODE_PROJECTION, AGGREGATE_UNITS,
+)
 
 
 # API for patient dashboard
 @app.get("/api/patient/dashboard/{patientid}")
-async def get_patient_dashboard(patientid: str):
+async def get_patient_dashboard(patientid: str, request: Request, response: Response):
     try:
         # Convert patientid to int
         try:
@@ -32,370 +21,112 @@ async def get_patient_dashboard(patientid: str):
         except:
             raise HTTPException(status_code=400, detail="patientid must be a number")
 
-        # Fetch patient basic info
-        patient = collection.find_one(
-            {"patientid": patient_id},
-            {"_id": 0, "patientid": 1, "name": 1, "gender": 1, "medications": 1}
-        )
+        not_modified = await conditional_get(request, response, patient_id)
+        if not_modified is not None:
+            return not_modified
 
-        if not patient:
-            raise HTTPException(status_code=404, detail="Patient not found")
+        # Materialized dashboard (one indexed find_one)
+        dashboard = await run_db(read_dashboard, patient_id)
 
-        medications = patient.get("medications", {})
+        if not dashboard:
+            raise HTTPException(status_code=404, detail="Patient not found")
 
-        if not medications:
+        if not dashboard.get("medication_count"):
             raise HTTPException(status_code=404, detail="No medication records found")
 
-        # Initialize with offset-aware datetime
-        latest_med = None
-        latest_time = datetime.min.replace(tzinfo=timezone.utc)
-
-        
-        for med in medications.values():
-            time_str = med.get("time")
-            if not time_str:
-                continue
-
-            # Convert to timezone-aware UTC datetime
-            try:
-                dt = datetime.fromisoformat(
-                    time_str.replace("Z", "+00:00")
-                ).astimezone(timezone.utc)
-            except:
-                continue
-
-      
-            if dt > latest_time:
-                latest_time = dt
-                latest_med = med
-
-        if not latest_med:
+        if not dashboard.get("latest"):
             raise HTTPException(status_code=404, detail="No valid medication timestamps")
 
         # Prepare final dashboard response
         dashboard_data = {
-            "patientid": patient["patientid"],
-            "name": patient["name"],
-            "gender": patient.get("gender"),
-            "bp": latest_med.get("bp"),
-            "age": latest_med.get("age"),
-            "heartrate": latest_med.get("heartrate"),
-            "SpO2": latest_med.get("SpO2"),
-            "Stress": latest_med.get("Stress"),
-            "Respiratoryrate": latest_med.get("Respiratoryrate"),
-            "riskrate": latest_med.get("riskrate"),
+            "patientid": dashboard["patientid"],
+            "name": dashboard["name"],
+            "gender": dashboard.get("gender"),
+            **dashboard["latest"],
         }
 
         return dashboard_data
 
+    except HTTPException:
+        raise
     except Exception as e:
         print("ERROR:", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-
-
-def month_name(month_number: int):
-    return calendar.month_name[month_number]
-
-# API for patient dashboard risk rates by month
-@app.get("/api/patient/patient_dashboard_risk/{patientid}")
-def get_dashboard_patient_risk(patientid: str):
-
-    # Convert patientid
+async def get_stored_dashboard(patientid: str, require_latest: bool = False):
+    """Load the materialized dashboard or raise the matching HTTP error."""
     try:
         patient_id = int(patientid)
     except:
         raise HTTPException(status_code=400, detail="patientid must be a number")
 
-    # Fetch patient document
-    patient = collection.find_one({"patientid": patient_id})
-    if not patient:
+    dashboard = await run_db(read_dashboard, patient_id)
+    if not dashboard:
         raise HTTPException(status_code=404, detail="Patient not found")
 
-    # Initialize month buckets
-    month_risks = {calendar_month_name[i]: [] for i in range(1, 13)}
-
-    # Extract medications
-    medications = patient.get("medications", {})
-
-    for med in medications.values():
-        risk = med.get("riskrate")
-        time_str = med.get("time")
-
-        if risk is not None and time_str:
-            # Convert time
-            dt = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
-            month = calendar_month_name[dt.month]
-
-            month_risks[month].append(risk)
+    if require_latest:
+        if not dashboard.get("medication_count"):
+            raise HTTPException(status_code=404, detail="No medications found for this patient")
+        if not dashboard.get("latest"):
+            raise HTTPException(status_code=404, detail="No valid medication timestamps")
+    return dashboard
 
-    # Compute averages
-    avg_monthly_risk = [
-        {
-            "month": month,
-            "average_riskrate": round(sum(risks) / len(risks), 2) if risks else None
-        }
-        for month, risks in month_risks.items()
-    ]
 
-    return avg_monthly_risk
+# API for patient dashboard risk rates by month
+@app.get("/api/patient/patient_dashboard_risk/{patientid}")
+async def get_dashboard_patient_risk(patientid: str):
+    dashboard = await get_stored_dashboard(patientid)
+    return dashboard["monthly_risk"]
 
 
 # API for patient health trend
 @app.get("/api/patient/patient_health_trend/{patientid}")
-def get_patient_health_trend(patientid: str):
-    # Convert patientid to int
+async def get_patient_health_trend(patientid: str, request: Request, response: Response):
     try:
         patient_id = int(patientid)
     except:
         raise HTTPException(status_code=400, detail="patientid must be a number")
 
-    # Fetch patient record
-    patient_records = collection.find_one({"patientid": patient_id})
-    if not patient_records:
-        raise HTTPException(status_code=404, detail="Patient not found")
-
-    # Initialize months
-    monthly_data = {
-      calendar_month_name[i]: {"heartrate": None, "SpO2": None, "Stress": None, "systolic": None, "diastolic": None}
-      for i in range(1, 13)
-}
-
-
-    # Iterate medications
-    medications = patient_records.get("medications", {})
-    for med in medications.values():
-        # Convert medication timestamp
-        time_str = med.get("time")
-        if not time_str:
-            continue
-        dt = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
-        month = calendar_month_name[dt.month]
-
-        # Extract values
-        hr = med.get("heartrate")
-        sp = med.get("SpO2")
-        stress = med.get("Stress")
-        bp = med.get("bp")
-        systolic = diastolic = None
-        if bp and "/" in bp:
-            try:
-                systolic, diastolic = map(int, bp.split("/"))
-            except:
-                systolic, diastolic = None, None
-
-        
-        if monthly_data[month]["heartrate"] is None:
-            monthly_data[month]["heartrate_list"] = []
-            monthly_data[month]["SpO2_list"] = []
-            monthly_data[month]["Stress_list"] = []
-            monthly_data[month]["systolic_list"] = []
-            monthly_data[month]["diastolic_list"] = []
-
-        # Append values
-        if hr is not None:
-            monthly_data[month]["heartrate_list"].append(float(str(hr).replace("bpm","").strip()))
-        if sp is not None:
-            monthly_data[month]["SpO2_list"].append(float(str(sp).replace("%","").strip()))
-        if stress is not None:
-            monthly_data[month]["Stress_list"].append(float(str(stress).strip()))
-        if systolic is not None:
-            monthly_data[month]["systolic_list"].append(systolic)
-        if diastolic is not None:
-            monthly_data[month]["diastolic_list"].append(diastolic)
-
-    # Compute averages
-    for month, data in monthly_data.items():
-        for key, lst_key in [("heartrate", "heartrate_list"), ("SpO2", "SpO2_list"),
-                             ("Stress", "Stress_list"), ("systolic", "systolic_list"), ("diastolic", "diastolic_list")]:
-            if lst_key in data and data[lst_key]:
-                monthly_data[month][key] = round(sum(data[lst_key])/len(data[lst_key]), 2)
-            else:
-                monthly_data[month][key] = None
-            # Remove temporary lists
-            if lst_key in data:
-                del data[lst_key]
-
-    return monthly_data
+    not_modified = await conditional_get(request, response, patient_id)
+    if not_modified is not None:
+        return not_modified
+    dashboard = await get_stored_dashboard(patientid)
+    return dashboard["health_trend"]
 
 
 # API for patient average actual vs healthy levels
 @app.get("/api/patient/average_actual/{patientid}")
-def get_patient_average_actual(patientid: str):
-    try:
-        patientid_int = int(patientid)
-    except:
-        raise HTTPException(status_code=400, detail="patientid must be a number")
-
-    # Fetch patient document
-    patient = collection.find_one({"patientid": patientid_int})
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-
-    # Get latest medication
-    medications = patient.get("medications", {})
-    if not medications:
-        raise HTTPException(status_code=404, detail="No medications found for this patient")
-
-    latest_med_key = sorted(medications.keys())[-1]
-    latest_med = medications[latest_med_key]
-
-    # Helper to convert values
-    def to_float(value):
-        if value is None:
-            return None
-        try:
-            clean = str(value).replace("%", "").replace("bpm", "").strip()
-            if "/" in clean:  # For BP, take systolic only
-                clean = clean.split("/")[0]
-            return float(clean)
-        except:
-            return None
-
-    # Actual patient values from latest medication
-    actual_hr = to_float(latest_med.get("heartrate"))
-    actual_spo2 = to_float(latest_med.get("SpO2"))
-    actual_bp = latest_med.get("bp")  # Keep as string
-
-    # Define standard healthy levels
-    healthy = {
-        "heartrate": 80,   # midpoint of 60-100
-        "SpO2": 97.5,      # midpoint of 95-100
-        "bp": "120/80"
-    }
-
-    return {
-        "actual": {
-            "heartrate": actual_hr,
-            "SpO2": actual_spo2,
-            "bp": actual_bp
-        },
-        "average": {
-            "heartrate": healthy["heartrate"],
-            "SpO2": healthy["SpO2"],
-            "bp": healthy["bp"]
-        }
-       
-    }
-
-
-#Define healthy ranges
-HEALTHY_HR = (60, 100)
-HEALTHY_SPO2 = 95
-HEALTHY_BP = (90, 120)
-
-
-# Functions to calculate risk percentages
-def calc_hr_risk(hr):
-    if hr is None:
-        return None
-    low, high = HEALTHY_HR
-    if low <= hr <= high:
-        return 0
-    if hr < low:
-        return round(((low - hr) / low) * 100, 2)
-    return round(((hr - high) / high) * 100, 2)
-
-def calc_spo2_risk(sp):
-    if sp is None:
-        return None
-    if sp >= HEALTHY_SPO2:
-        return 0
-    return round(((HEALTHY_SPO2 - sp) / HEALTHY_SPO2) * 100, 2)
-
-def calc_bp_risk(bp):
-    if bp is None:
-        return None
-    low, high = HEALTHY_BP
-    if low <= bp <= high:
-        return 0
-    if bp < low:
-        return round(((low - bp) / low) * 100, 2)
-    return round(((bp - high) / high) * 100, 2)
+async def get_patient_average_actual(patientid: str):
+    dashboard = await get_stored_dashboard(patientid, require_latest=True)
+    return dashboard["average_actual"]
 
 
 # API for patient risk scores weightage
 @app.get("/api/patient/risk_scores_weightage/{patientid}")
 async def get_risk_score_weightage(patientid: str):
-    # Convert patientid to int
-    try:
-        patient_id = int(patientid)
-    except:
-        raise HTTPException(status_code=400, detail="patientid must be a number")
+    dashboard = await get_stored_dashboard(patientid, require_latest=True)
+    return dashboard["risk_weightage"]
 
-    # Fetch patient
-    patient = collection.find_one({"patientid": patient_id})
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
 
-    # Get medications
-    medications = patient.get("medications", {})
-    if not medications:
+def require_medications(readings: list):
+    if not readings:
         raise HTTPException(status_code=404, detail="No medications found for this patient")
+    return readings
 
-    # Find latest medication (based on time)
-    latest_med = None
-    latest_time = None
-
-    for med in medications.values():
-        time_str = med.get("time")
-        if not time_str:
-            continue
-        dt = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
-        if latest_time is None or dt > latest_time:
-            latest_time = dt
-            latest_med = med
-
-    if not latest_med:
-        raise HTTPException(status_code=404, detail="No valid medication timestamps")
-
-    # Helper to convert values
-    def to_float(v):
-        if v is None:
-            return None
-        try:
-            v = str(v).replace("%", "").replace("bpm", "").strip()
-            if "/" in v:
-                v = v.split("/")[0]  # systolic only
-            return float(v)
-        except:
-            return None
 
-    hr_value = to_float(latest_med.get("heartrate"))
-    spo2_value = to_float(latest_med.get("SpO2"))
-    bp_value = to_float(latest_med.get("bp"))  # systolic
+async def load_readings(patientid: int, fn, *args, **kwargs):
+    """Run a readings query; 404 when the patient itself does not exist."""
+    readings = await run_db(fn, patientid, *args, **kwargs)
+    # Only the empty case needs to know whether the patient exists
+    if not readings and not await run_db(collection.count_documents, {"patientid": patientid}, limit=1):
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return readings
 
-    return {
-        "heartrate": {
-            "risk_percent": calc_hr_risk(hr_value)
-        },
-        "SpO2": {
-            "risk_percent": calc_spo2_risk(spo2_value)
-        },
-        "blood_pressure": {
-            "risk_percent": calc_bp_risk(bp_value)
-        },
-     
-    }
 
-
-# API for patient recommendations
-@app.get("/api/patient/recommendations/{patientid}")
-def get_recommendations(patientid: int):
-    # Fetch patient
-    patient = collection.find_one({"patientid": patientid}, {"_id": 0, "medications": 1})
-    
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-    
-    medications = patient.get("medications", {})
-    if not medications:
-        raise HTTPException(status_code=404, detail="No medications found for this patient")
-    
-    # Get latest medication (based on key order)
-    latest_med_key = sorted(medications.keys())[-1]
-    latest_med = medications[latest_med_key]
+def recommendations_section(readings: list):
+    """Plans of the latest reading (readings are ordered oldest first)."""
+    latest_med = require_medications(readings)[-1]
 
     return {
         "Diet_PLAN": latest_med.get("Diet_PLAN"),
@@ -404,21 +135,13 @@ def get_recommendations(patientid: int):
     }
 
 
-@app.get("/api/patient/episodes/{patientid}")
-def get_previous_episodes(patientid: int):
-
-    patient = collection.find_one({"patientid": patientid}, {"_id": 0, "medications": 1})
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-
-    medications = patient.get("medications", {})
-    if not medications:
-        raise HTTPException(status_code=404, detail="No medications found for this patient")
+def episodes_section(readings: list):
+    medications = require_medications(readings)
 
     episodes = []
 
-    # FIXED: unpack key, value
-    for key, med in medications.items():
+    # Readings arrive oldest first (by their stored datetime); episodes are newest first
+    for med in reversed(medications):
         episode = {
             "heartrate": med.get("heartrate"),
             "SpO2": med.get("SpO2"),
@@ -430,9 +153,6 @@ def get_previous_episodes(patientid: int):
         }
         episodes.append(episode)
 
-    # Sort by time desc
-    episodes.sort(key=lambda x: x["time"], reverse=True)
-
     # Add serial numbers
     for index, episode in enumerate(episodes, start=1):
         episode["sno"] = index
@@ -440,6 +160,50 @@ def get_previous_episodes(patientid: int):
     return episodes
 
 
+def prescription_section(readings: list):
+    medications = require_medications(readings)
+
+    # Build prescription tracking structure
+    prescription_tracking = {}
+
+    for med_value in medications:
+        med_key = med_value["medication_id"]
+        diet = med_value.get("Diet_PLAN", {})
+        exercise = med_value.get("Exercise_PLAN", {})
+        routine = med_value.get("Routine_PLAN", {})
+
+        med_plan = {}
+        for day in range(1, 8):
+            key = f"DAY{day}"
+            med_plan[key] = {
+                "Diet": diet.get(key),
+                "Exercise": exercise.get(key),
+                "Routine": routine.get(key)
+            }
+
+        prescription_tracking[med_key] = med_plan
+
+    return prescription_tracking
+
+
+# API for patient recommendations
+@app.get("/api/patient/recommendations/{patientid}")
+async def get_recommendations(patientid: int):
+    # Only the latest reading, and only its plans
+    readings = await load_readings(patientid, latest_readings, 1, PLAN_PROJECTION)
+    return recommendations_section(readings)
+
+
+@app.get("/api/patient/episodes/{patientid}")
+async def get_previous_episodes(patientid: int, request: Request, response: Response):
+    not_modified = await conditional_get(request, response, patientid)
+    if not_modified is not None:
+        return not_modified
+
+    readings = await load_readings(patientid, readings_in_range, projection=EPISODE_PROJECTION)
+    return episodes_section(readings)
+
+
 # API for prescription tracking
 @app.get("/api/patient/{patientid}/prescription_tracking")
 async def prescription_tracking(patientid: str):
@@ -447,38 +211,154 @@ async def prescription_tracking(patientid: str):
         # Convert patientid to int for correct MongoDB match
         patient_id_int = int(patientid)
 
-        # Fetch patient document from MongoDB
-        patient = collection.find_one({"patientid": patient_id_int})
-        if not patient:
-            raise HTTPException(status_code=404, detail="Patient not found")
+        readings = await load_readings(patient_id_int, readings_in_range, projection=PLAN_PROJECTION)
+        return prescription_section(readings)
 
-        # Get all medications
-        medications = patient.get("medications", {})
-        if not medications:
-            raise HTTPException(status_code=404, detail="No medications found for this patient")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def parse_reading_bound(value: Optional[str], name: str):
+    if value is None:
+        return None
+    dt = parse_time(value)
+    if dt is None:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO 8601 datetime")
+    return dt
+
+
+# API for raw vitals readings: latest N, or a time range when start/end are given
+@app.get("/api/patient/{patientid}/readings")
+async def get_patient_readings(
+    patientid: int,
+    start: Optional[str] = Query(None, description="Readings at or after this time (ISO 8601)"),
+    end: Optional[str] = Query(None, description="Readings before this time (ISO 8601)"),
+    limit: int = Query(50, ge=1, le=1000),
+    plans: bool = Query(False, description="Include Diet/Exercise/Routine plans"),
+):
+    start_dt, end_dt = parse_reading_bound(start, "start"), parse_reading_bound(end, "end")
+    projection = None if plans else {**VITALS_PROJECTION, **EPISODE_PROJECTION}
+    if start_dt is None and end_dt is None:
+        readings = await load_readings(patientid, latest_readings, limit, projection)
+    else:
+        readings = await load_readings(patientid, readings_in_range, start_dt, end_dt, projection, limit)
+    return {"patientid": patientid, "readings": readings}
+
+
+# API for vitals averages per day/week/month/year, aggregated by the database
+@app.get("/api/patient/{patientid}/readings/summary")
+async def get_patient_readings_summary(
+    patientid: int,
+    unit: str = Query("month"),
+    start: Optional[str] = Query(None),
+    end: Optional[str] = Query(None),
+):
+    if unit not in AGGREGATE_UNITS:
+        raise HTTPException(status_code=400, detail=f"unit must be one of {', '.join(AGGREGATE_UNITS)}")
+    start_dt, end_dt = parse_reading_bound(start, "start"), parse_reading_bound(end, "end")
+    buckets = await load_readings(patientid, aggregate_readings, start_dt, end_dt, unit)
+    return {"patientid": patientid, "unit": unit, "buckets": buckets}
+
+
+# Sections of the patient page served by the overview endpoint
+OVERVIEW_SECTIONS = (
+    "dashboard",
+    "patient_dashboard_risk",
+    "patient_health_trend",
+    "average_actual",
+    "risk_scores_weightage",
+    "recommendations",
+    "episodes",
+    "prescription_tracking",
+)
+
+# Sections computed from the vitals frame
+VITALS_SECTIONS = {"dashboard", "patient_dashboard_risk", "patient_health_trend", "average_actual", "risk_scores_weightage"}
+
+
+# Sections that need the (large) plan fields of each reading
+PLAN_SECTIONS = {"recommendations", "prescription_tracking"}
+
+
+def build_overview(patient: dict, readings: list, include):
+    """Compute the requested sections from one patient document and one vitals frame."""
+    frame = index = None
+    if VITALS_SECTIONS.intersection(include):
+        frame = analytics.ReadingFrame.from_readings(readings)
+        index = frame.latest_index()
+
+    def latest_required(no_medications_detail):
+        if not readings:
+            raise HTTPException(status_code=404, detail=no_medications_detail)
+        if index is None:
+            raise HTTPException(status_code=404, detail="No valid medication timestamps")
 
-       # Build prescription tracking structure
-        prescription_tracking = {}
+    def dashboard():
+        latest_required("No medication records found")
+        return {
+            "patientid": patient["patientid"],
+            "name": patient.get("name"),
+            "gender": patient.get("gender"),
+            **analytics.latest_vitals(frame.records[index]),
+        }
 
-        for med_key, med_value in medications.items():
-            diet = med_value.get("Diet_PLAN", {})
-            exercise = med_value.get("Exercise_PLAN", {})
-            routine = med_value.get("Routine_PLAN", {})
+    def average_actual():
+        latest_required("No medications found for this patient")
+        return analytics.average_actual(frame, index)
+
+    def risk_scores_weightage():
+        latest_required("No medications found for this patient")
+        return analytics.risk_weightage(frame, index)
+
+    builders = {
+        "dashboard": dashboard,
+        "patient_dashboard_risk": lambda: analytics.monthly_risk(frame),
+        "patient_health_trend": lambda: analytics.health_trend(frame),
+        "average_actual": average_actual,
+        "risk_scores_weightage": risk_scores_weightage,
+        "recommendations": lambda: recommendations_section(readings),
+        "episodes": lambda: episodes_section(readings),
+        "prescription_tracking": lambda: prescription_section(readings),
+    }
+
+    overview = {"patientid": patient["patientid"]}
+    errors = {}
+    for section in include:
+        try:
+            overview[section] = builders[section]()
+        except HTTPException as e:
+            # Same error the standalone endpoint would return, without failing the page
+            overview[section] = None
+            errors[section] = e.detail
+    if errors:
+        overview["errors"] = errors
+    return overview
+
+
+# API for the whole patient page in one request
+@app.get("/api/patient/{patientid}/overview")
+async def get_patient_overview(patientid: str, include: Optional[str] = None):
+    try:
+        patient_id = int(patientid)
+    except:
+        raise HTTPException(status_code=400, detail="patientid must be a number")
 
-            med_plan = {}
-            for day in range(1, 8):
-                key = f"DAY{day}"
-                med_plan[key] = {
-                    "Diet": diet.get(key),
-                    "Exercise": exercise.get(key),
-                    "Routine": routine.get(key)
-                }
+    sections = OVERVIEW_SECTIONS
+    if include:
+        sections = [section.strip() for section in include.split(",") if section.strip()]
+        unknown = [section for section in sections if section not in OVERVIEW_SECTIONS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}. Valid: {', '.join(OVERVIEW_SECTIONS)}")
 
-            prescription_tracking[med_key] = med_plan
+    patient = await run_db(collection.find_one, {"patientid": patient_id}, {"_id": 0, "patientid": 1, "name": 1, "gender": 1})
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
 
-        return prescription_tracking
+    # One readings query for the whole page; plans only when a section shows them
+    projection = None if PLAN_SECTIONS.intersection(sections) else {**VITALS_PROJECTION, **EPISODE_PROJECTION}
 
+    try:
+        readings = await run_db(readings_in_range, patient_id, projection=projection)
+        return build_overview(patient, readings, sections)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
-
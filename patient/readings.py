@@ -0,0 +1,218 @@
+from datetime import datetime
+from typing import Optional
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, UpdateOne
+from utils.db import collection, readings_collection
+from patient.records import normalize_reading, NORMALIZATION_VERSION
+
+# Vitals only: what the dashboard, charts and risk scores need (typed values plus the raw card fields)
+VITALS_PROJECTION = {
+    "_id": 0, "medication_id": 1, "time": 1, "at": 1, "month": 1, "values": 1,
+    "heartrate": 1, "SpO2": 1, "bp": 1, "Stress": 1, "riskrate": 1, "age": 1, "Respiratoryrate": 1,
+}
+PLAN_PROJECTION = {"_id": 0, "medication_id": 1, "time": 1, "at": 1, "Diet_PLAN": 1, "Exercise_PLAN": 1, "Routine_PLAN": 1}
+EPISODE_PROJECTION = {
+    "_id": 0, "medication_id": 1, "time": 1, "at": 1,
+    "heartrate": 1, "SpO2": 1, "Respiratoryrate": 1, "bp": 1, "riskrate": 1, "type": 1,
+}
+FULL_PROJECTION = {"_id": 0, "patientid": 0}
+# The medication record as it was sent (typed fields dropped), for the legacy medications map
+RECORD_PROJECTION = {"_id": 0, "at": 0, "month": 0, "values": 0, "normalized": 0}
+# The raw fields normalize_reading reads
+RAW_VITALS_PROJECTION = {"time": 1, "heartrate": 1, "SpO2": 1, "Stress": 1, "riskrate": 1, "bp": 1}
+
+# Bucket sizes accepted by aggregate_readings ($dateTrunc units)
+AGGREGATE_UNITS = ("day", "week", "month", "year")
+
+
+# ---------------- DOCUMENTS ----------------
+
+def reading_document(patientid: int, medication_id: str, record: dict):
+    """One reading: the medication record as sent plus its normalized typed fields.
+
+    The raw fields are kept unchanged so responses keep their shape; readers
+    use "at", "month" and "values" (see normalize_reading) instead of parsing them.
+    """
+    return {
+        **record,
+        **normalize_reading(record),
+        "patientid": patientid,
+        "medication_id": medication_id,
+    }
+
+
+def save_reading(reading: dict, session=None):
+    """Store (or overwrite) one reading_document; returns True when it is new."""
+    result = readings_collection.replace_one(
+        {"patientid": reading["patientid"], "medication_id": reading["medication_id"]},
+        reading,
+        upsert=True,
+        session=session
+    )
+    return result.upserted_id is not None
+
+
+def save_readings(patientid: int, medications: dict, session=None):
+    """Store a {medication_id: record} map in one bulk write (idempotent)."""
+    ops = [
+        ReplaceOne(
+            {"patientid": patientid, "medication_id": medication_id},
+            reading_document(patientid, medication_id, record),
+            upsert=True
+        )
+        for medication_id, record in (medications or {}).items()
+    ]
+    if ops:
+        readings_collection.bulk_write(ops, ordered=False, session=session)
+    return len(ops)
+
+
+# ---------------- QUERIES ----------------
+
+def _range_query(patientid: int, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    query = {"patientid": patientid}
+    if start is not None or end is not None:
+        query["at"] = {}
+        if start is not None:
+            query["at"]["$gte"] = start
+        if end is not None:
+            query["at"]["$lt"] = end
+    return query
+
+
+def latest_readings(patientid: int, n: int = 1, projection: Optional[dict] = None):
+    """The n most recent readings, newest first (readings without a valid time come last)."""
+    cursor = readings_collection.find({"patientid": patientid}, projection or FULL_PROJECTION)
+    return list(cursor.sort("at", DESCENDING).limit(n))
+
+
+def readings_in_range(patientid: int, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      projection: Optional[dict] = None, limit: int = 0):
+    """Readings with start <= at < end (all readings when both are None), oldest first."""
+    cursor = readings_collection.find(_range_query(patientid, start, end), projection or FULL_PROJECTION)
+    return list(cursor.sort("at", ASCENDING).limit(limit))
+
+
+def medications_by_patient(patientids: list):
+    """Legacy {patientid: {medication_id: record}} maps, oldest record first, in one query."""
+    medications = {patientid: {} for patientid in patientids}
+    cursor = readings_collection.find({"patientid": {"$in": list(patientids)}}, RECORD_PROJECTION)
+    for record in cursor.sort([("patientid", ASCENDING), ("at", ASCENDING)]):
+        patientid = record.pop("patientid")
+        medications[patientid][record.pop("medication_id")] = record
+    return medications
+
+
+def attach_medications(records: list):
+    """Set the "medications" map on patient records (as stored before readings were split out)."""
+    medications = medications_by_patient([record["patientid"] for record in records])
+    for record in records:
+        record["medications"] = medications.get(record["patientid"], {})
+    return records
+
+
+def count_readings(patientid: Optional[int] = None):
+    return readings_collection.count_documents({} if patientid is None else {"patientid": patientid})
+
+
+def aggregate_readings(patientid: int, start: Optional[datetime] = None, end: Optional[datetime] = None, unit: str = "month"):
+    """Per-bucket reading count and vitals averages, computed by the server over the (patientid, at) index."""
+    query = _range_query(patientid, start, end)
+    query.setdefault("at", {})["$ne"] = None
+    pipeline = [
+        {"$match": query},
+        {"$group": {
+            "_id": {"$dateTrunc": {"date": "$at", "unit": unit}},
+            "readings": {"$sum": 1},
+            "heartrate": {"$avg": "$values.heartrate"},
+            "SpO2": {"$avg": "$values.SpO2"},
+            "Stress": {"$avg": "$values.Stress"},
+            "systolic": {"$avg": "$values.systolic"},
+            "diastolic": {"$avg": "$values.diastolic"},
+            "riskrate": {"$avg": "$values.riskrate"},
+            "riskrate_max": {"$max": "$values.riskrate"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+    buckets = []
+    for row in readings_collection.aggregate(pipeline):
+        bucket = {"start": row.pop("_id"), "readings": row.pop("readings")}
+        bucket.update({key: round(value, 2) if value is not None else None for key, value in row.items()})
+        buckets.append(bucket)
+    return buckets
+
+
+def latest_per_patient(fields: tuple, patientids: Optional[list] = None):
+    """Yield each patient's most recent timed reading, reduced to the given fields.
+
+    Pass patientids to limit the aggregation to one batch of patients.
+    """
+    match = {"at": {"$ne": None}}
+    if patientids is not None:
+        match["patientid"] = {"$in": patientids}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"patientid": 1, "at": 1}},
+        {"$group": {"_id": "$patientid", **{field: {"$last": f"${field}"} for field in fields}}},
+    ]
+    for row in readings_collection.aggregate(pipeline, allowDiskUse=True):
+        row["patientid"] = row.pop("_id")
+        yield row
+
+
+# ---------------- MIGRATION ----------------
+
+def normalize_stored_readings(batch_size: int = 500):
+    """Add the typed fields to readings stored before (or by an older) normalize_reading.
+
+    Resumable: each batch is marked with NORMALIZATION_VERSION, so an interrupted
+    run continues with the readings that are still unmarked.
+    """
+    updated = 0
+    query = {"normalized": {"$ne": NORMALIZATION_VERSION}}
+    while True:
+        batch = list(readings_collection.find(query, RAW_VITALS_PROJECTION).sort("_id", ASCENDING).limit(batch_size))
+        if not batch:
+            return updated
+        ops = [UpdateOne({"_id": reading["_id"]}, {"$set": normalize_reading(reading)}) for reading in batch]
+        updated += readings_collection.bulk_write(ops, ordered=False).modified_count
+        if len(batch) < batch_size:
+            return updated
+
+
+def migrate_embedded_medications(batch_size: int = 200, drop_embedded: bool = False):
+    """Copy every patient's embedded medications map into the readings collection.
+
+    Readings are upserted on (patientid, medication_id), so the migration can be
+    stopped and re-run. With drop_embedded the map is unset from each patient once
+    its readings are written; re-runs then only visit patients not yet migrated.
+    Returns (patients, readings) processed.
+    """
+    patients = readings = 0
+    ops, migrated = [], []
+
+    def flush():
+        nonlocal ops, migrated
+        if ops:
+            readings_collection.bulk_write(ops, ordered=False)
+        if drop_embedded and migrated:
+            collection.bulk_write(
+                [UpdateOne({"patientid": patientid}, {"$unset": {"medications": ""}}) for patientid in migrated],
+                ordered=False
+            )
+        ops, migrated = [], []
+
+    query = {"patientid": {"$ne": None}, "medications": {"$exists": True}}
+    for patient in collection.find(query, {"_id": 0, "patientid": 1, "medications": 1}):
+        for medication_id, record in (patient.get("medications") or {}).items():
+            ops.append(ReplaceOne(
+                {"patientid": patient["patientid"], "medication_id": medication_id},
+                reading_document(patient["patientid"], medication_id, record),
+                upsert=True
+            ))
+        migrated.append(patient["patientid"])
+        patients += 1
+        readings += len(patient.get("medications") or {})
+        if len(ops) >= batch_size:
+            flush()
+    flush()
+    return patients, readings
@@ -0,0 +1,352 @@
+from fastapi import HTTPException, Body, Request, Response
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from dateutil import parser
+from pymongo import UpdateOne, ReturnDocument
+from app_instance import app
+from utils.db import run_db, collection
+from patient import stats
+from utils.appointments import appointment_entry, record_entry, SOURCE_MEDICATIONS
+
+
+# ---------------- HELPERS ----------------
+
+def parse_datetime(value):
+    """Parse a timestamp as written (its own offset, naive when it has none)."""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            try:
+                return parser.parse(value)
+            except (ValueError, OverflowError):
+                return None
+    return None
+
+
+def parse_time(value):
+    """Parse a medication/registration timestamp into an aware UTC datetime."""
+    dt = parse_datetime(value)
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def to_number(value):
+    """Risk rates arrive as ints, floats or strings; keep them sortable."""
+    try:
+        number = float(str(value).replace("%", "").strip())
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+# ---------------- NORMALIZATION (once, at write time) ----------------
+
+# Bumped when normalize_reading changes; stored readings below it are re-normalized
+NORMALIZATION_VERSION = 1
+
+
+def parse_vital(value, strip=("bpm", "%")):
+    """Readings like "72 bpm", "98%", "41" or 41 -> float; None when missing or invalid."""
+    if value is None:
+        return None
+    text = str(value)
+    for token in strip:
+        text = text.replace(token, "")
+    try:
+        number = float(text.strip())
+    except ValueError:
+        return None
+    return None if number != number else number
+
+
+def parse_bp(value):
+    """"120/80" -> (systolic, diastolic, first number); a plain "120" only sets the first."""
+    if value is None:
+        return None, None, None
+    first, slash, second = str(value).partition("/")
+    first = parse_vital(first, ())
+    systolic, diastolic = first, parse_vital(second, ())
+    if not slash or systolic is None or diastolic is None:
+        systolic = diastolic = None
+    return systolic, diastolic, first
+
+
+def normalize_reading(record: dict):
+    """Typed fields stored next to the raw values of one medication record.
+
+    at: UTC datetime of "time"; month: calendar month as written (the charts
+    group by it); values: numeric vitals, None where the raw value is invalid.
+    """
+    written = parse_datetime(record.get("time"))
+    systolic, diastolic, bp = parse_bp(record.get("bp"))
+    return {
+        "at": parse_time(written),
+        "month": written.month if written is not None else None,
+        "values": {
+            "heartrate": parse_vital(record.get("heartrate")),
+            "SpO2": parse_vital(record.get("SpO2")),
+            "Stress": parse_vital(record.get("Stress"), ()),
+            "riskrate": parse_vital(record.get("riskrate")),
+            "systolic": systolic,
+            "diastolic": diastolic,
+            # Risk weightage uses the systolic part (or a plain number) of bp
+            "bp": bp,
+        },
+        "normalized": NORMALIZATION_VERSION,
+    }
+
+
+def latest_medication(medications: dict):
+    """Return (key, medication, time) of the most recent medication record."""
+    latest_key = latest_med = latest_time = None
+    for key, med in (medications or {}).items():
+        dt = parse_time(med.get("time"))
+        if dt is None:
+            continue
+        if latest_time is None or dt > latest_time:
+            latest_key, latest_med, latest_time = key, med, dt
+    return latest_key, latest_med, latest_time
+
+
+def summary_fields(reading: Optional[dict]):
+    """Denormalized fields kept on the patient document for list queries (from a normalized reading)."""
+    if reading is None or reading.get("at") is None:
+        return {"latest_riskrate": None, "latest_time": None, "latest_at": None}
+    return {
+        "latest_riskrate": to_number(reading["values"].get("riskrate")),
+        "latest_time": reading.get("time"),
+        "latest_at": reading["at"],
+    }
+
+
+# ---------------- VERSIONING ----------------
+
+def bump_version(update: dict):
+    """Add the version/updated_at bump to a patient update so cached reads see the change."""
+    update = dict(update)
+    update["$inc"] = {**update.get("$inc", {}), "version": 1}
+    update["$currentDate"] = {**update.get("$currentDate", {}), "updated_at": True}
+    return update
+
+
+def read_version(patientid: int):
+    """(version, updated_at) of one patient from a projected find_one, or None if it does not exist."""
+    patient = collection.find_one({"patientid": patientid}, {"_id": 0, "version": 1, "updated_at": 1})
+    if patient is None:
+        return None
+    updated_at = patient.get("updated_at")
+    if isinstance(updated_at, datetime) and updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    # Documents written before versioning count as version 0
+    return patient.get("version", 0), updated_at
+
+
+def _not_modified(request: Request, etag: str, updated_at: Optional[datetime]):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match wins over If-Modified-Since
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and updated_at is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return updated_at.replace(microsecond=0) <= since
+    return False
+
+
+async def conditional_get(request: Request, response: Response, patientid: int):
+    """Set ETag/Last-Modified from the patient's version; returns a 304 response when the client copy is current.
+
+    The version is read before the payload, so a write racing the read can only
+    pair new data with the old tag (the next poll then gets a 200), never the reverse.
+    """
+    version = await run_db(read_version, patientid)
+    if version is None:
+        return None
+    version, updated_at = version
+    headers = {"ETag": f'"{patientid}-{version}"', "Cache-Control": "private, no-cache"}
+    if updated_at is not None:
+        headers["Last-Modified"] = format_datetime(updated_at.astimezone(timezone.utc), usegmt=True)
+
+    if _not_modified(request, headers["ETag"], updated_at):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+SUMMARY_READING_FIELDS = ("time", "values", "at")
+
+
+def refresh_patient_summary(patientid: int):
+    """Recompute the summary fields of one patient from its latest reading."""
+    from patient.readings import latest_readings
+
+    latest = latest_readings(patientid, 1, {"_id": 0, **{field: 1 for field in SUMMARY_READING_FIELDS}})
+    fields = summary_fields(latest[0] if latest else None)
+    result = collection.update_one({"patientid": patientid}, bump_version({"$set": fields}))
+    return fields if result.matched_count else None
+
+
+def _summary_ops(patients: list):
+    from patient.readings import latest_per_patient
+
+    latest = {row["patientid"]: row for row in latest_per_patient(SUMMARY_READING_FIELDS, [p["patientid"] for p in patients])}
+    ops = []
+    for patient in patients:
+        ops.append(UpdateOne({"_id": patient["_id"]}, bump_version({"$set": summary_fields(latest.get(patient["patientid"]))})))
+    return ops
+
+
+def backfill_patient_summaries(batch_size: int = 500):
+    """Recompute summary fields for every patient, one latest-reading aggregation per batch."""
+    updated = 0
+    batch = []
+    for patient in collection.find({}, {"patientid": 1}):
+        batch.append(patient)
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(_summary_ops(batch), ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(_summary_ops(batch), ordered=False).modified_count
+    return updated
+
+
+def backfill_registered_on(batch_size: int = 500):
+    """Store registered_on (BSON datetime) next to the registered_at string; safe to re-run."""
+    updated = 0
+    ops = []
+    query = {"registered_at": {"$exists": True}, "registered_on": {"$exists": False}}
+    for patient in collection.find(query, {"registered_at": 1}):
+        ops.append(UpdateOne({"_id": patient["_id"]}, {"$set": {"registered_on": parse_time(patient["registered_at"])}}))
+        if len(ops) >= batch_size:
+            updated += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += collection.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+
+def register_patient(patient: dict):
+    """Insert a new patient; returns False when the patientid already exists."""
+    from patient.dashboard_store import refresh_dashboard
+    from patient.readings import save_readings
+
+    patient.setdefault("registered_at", datetime.now().isoformat())
+    # Readings live in their own collection, not on the patient document
+    medications = patient.pop("medications", None) or {}
+    _, med, _ = latest_medication(medications)
+    patient.update(summary_fields({**med, **normalize_reading(med)} if med else None))
+    patient["registered_on"] = parse_time(patient["registered_at"])
+    patient.update(version=1, updated_at=datetime.now(timezone.utc))
+    fields = {key: value for key, value in patient.items() if key not in ("_id", "patientid")}
+    result = collection.update_one(
+        {"patientid": patient["patientid"]},
+        {"$setOnInsert": fields},
+        upsert=True
+    )
+    if result.upserted_id is None:
+        return False
+    save_readings(patient["patientid"], medications)
+
+    for key, med in medications.items():
+        if med.get("meeting_details"):
+            record_entry(appointment_entry(SOURCE_MEDICATIONS, patient["patientid"], med["meeting_details"], key))
+
+    stats.patient_registered(patient["registered_on"], len(medications), patient["latest_riskrate"])
+
+    refresh_dashboard(patient["patientid"])
+    return True
+
+
+def add_medication(patientid: int, medication_id: str, record: dict):
+    """Store a medication record and move the latest-reading fields forward."""
+    from patient.dashboard_store import mark_stale, refresh_dashboard
+    from patient.readings import reading_document, save_reading
+
+    if collection.find_one({"patientid": patientid}, {"_id": 1}) is None:
+        return False
+
+    # The stored dashboard is flagged first so readers never trust it mid-update
+    mark_stale(patientid)
+    reading = reading_document(patientid, medication_id, record)
+    is_new = save_reading(reading)
+
+    # The version moves after the reading is stored, so a cached copy can never
+    # carry the new ETag with the old readings
+    previous = None
+    previous_risk = new_risk = None
+    dt = reading["at"]
+    if dt is not None:
+        # Only overwrite the summary when this record is the newest one
+        fields = summary_fields(reading)
+        previous = collection.find_one_and_update(
+            {"patientid": patientid, "$or": [{"latest_at": None}, {"latest_at": {"$lte": dt}}]},
+            bump_version({"$set": fields}),
+            projection={"_id": 0, "latest_riskrate": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous is not None:
+            previous_risk, new_risk = previous.get("latest_riskrate"), fields["latest_riskrate"]
+    if previous is None:
+        collection.update_one({"patientid": patientid}, bump_version({}))
+
+    if record.get("meeting_details"):
+        record_entry(appointment_entry(SOURCE_MEDICATIONS, patientid, record["meeting_details"], medication_id))
+
+    stats.medication_added(is_new, previous_risk, new_risk)
+
+    refresh_dashboard(patientid)
+    return True
+
+
+# ---------------- WRITE ENDPOINTS ----------------
+
+# API to register a patient
+@app.post("/api/patient/register")
+async def register(patient: dict = Body(...)):
+    if not isinstance(patient.get("patientid"), int):
+        raise HTTPException(status_code=400, detail="patientid must be a number")
+
+    try:
+        created = await run_db(register_patient, patient)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+    if not created:
+        raise HTTPException(status_code=409, detail="Patient already exists")
+    return {"message": "Patient registered", "patientid": patient["patientid"]}
+
+
+# API to add a medication (episode) record to a patient
+@app.post("/api/patient/{patientid}/medications")
+async def add_medication_record(patientid: int, record: dict = Body(...), medication_id: Optional[str] = None):
+    if not record.get("time"):
+        record["time"] = datetime.now(timezone.utc).isoformat()
+    if parse_time(record["time"]) is None:
+        raise HTTPException(status_code=400, detail="Invalid time format. Use ISO 8601")
+
+    if medication_id is None:
+        medication_id = parse_time(record["time"]).strftime("%Y%m%d%H%M%S%f")
+    if "." in medication_id or medication_id.startswith("$"):
+        raise HTTPException(status_code=400, detail="medication_id must not contain '.' or start with '$'")
+
+    try:
+        added = await run_db(add_medication, patientid, medication_id, record)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+    if not added:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return {"message": "Medication record added", "patientid": patientid, "medication_id": medication_id}
@@ -0,0 +1,120 @@
+import numpy as np
+from datetime import datetime, timezone
+from utils.db import collection, stats_collection
+from patient.analytics import ReadingFrame
+
+# Single document holding the dashboard counters
+STATS_ID = "totals"
+
+
+def risk_band(risk):
+    """Bucket a risk rate the way the dashboard does (None when unknown)."""
+    if risk is None:
+        return None
+    if risk <= 45:
+        return "low_risk"
+    if risk <= 75:
+        return "mid_risk"
+    return "high_risk"
+
+
+def _inc(increments: dict):
+    # No upsert: until the first rebuild there is nothing to increment, and
+    # read_stats builds the document from a full count on first use
+    increments = {key: value for key, value in increments.items() if value}
+    if not increments:
+        return
+    stats_collection.update_one(
+        {"_id": STATS_ID},
+        {"$inc": increments, "$currentDate": {"updated_at": True}}
+    )
+
+
+def patient_registered(registered_at, medication_count: int, latest_risk):
+    """Count a newly registered patient."""
+    increments = {"total_patients": 1, "total_appointments": medication_count}
+    if registered_at is not None:
+        increments[f"new_patients_by_year.{registered_at.year}"] = 1
+    band = risk_band(latest_risk)
+    if band:
+        increments[f"risk_summary.{band}"] = 1
+    _inc(increments)
+
+
+def medication_added(is_new: bool, previous_risk, new_risk):
+    """Count a medication record and move the patient between risk bands.
+
+    previous_risk/new_risk are the latest risk before and after the write,
+    both None when the record did not change the patient's latest reading.
+    """
+    increments = {"total_appointments": 1 if is_new else 0}
+    old_band, new_band = risk_band(previous_risk), risk_band(new_risk)
+    if old_band != new_band:
+        if old_band:
+            increments[f"risk_summary.{old_band}"] = -1
+        if new_band:
+            increments[f"risk_summary.{new_band}"] = 1
+    _inc(increments)
+
+
+def _count_risk_bands(latest, risk_summary):
+    """Vectorized band counts over a batch of latest readings (one per patient)."""
+    risks = ReadingFrame.from_readings(latest).columns["riskrate"]
+    risks = risks[~np.isnan(risks)]
+    risk_summary["low_risk"] += int(np.count_nonzero(risks <= 45))
+    risk_summary["mid_risk"] += int(np.count_nonzero((risks > 45) & (risks <= 75)))
+    risk_summary["high_risk"] += int(np.count_nonzero(risks > 75))
+
+
+def compute_stats(batch_size: int = 1000):
+    """Recount everything from the patients and readings collections (full scans)."""
+    from patient.readings import count_readings, latest_per_patient
+
+    totals = {
+        "total_patients": 0,
+        "total_appointments": 0,
+        "new_patients_by_year": {},
+        "risk_summary": {"low_risk": 0, "mid_risk": 0, "high_risk": 0},
+    }
+
+    for patient in collection.find({}, {"_id": 0, "registered_on": 1}):
+        totals["total_patients"] += 1
+        registered_at = patient.get("registered_on")
+        if registered_at is not None:
+            year = str(registered_at.year)
+            totals["new_patients_by_year"][year] = totals["new_patients_by_year"].get(year, 0) + 1
+
+    # Every stored reading is one medication record
+    totals["total_appointments"] = count_readings()
+
+    batch = []
+    for latest in latest_per_patient(("at", "values")):
+        batch.append(latest)
+        if len(batch) >= batch_size:
+            _count_risk_bands(batch, totals["risk_summary"])
+            batch = []
+    if batch:
+        _count_risk_bands(batch, totals["risk_summary"])
+
+    return totals
+
+
+def rebuild_stats():
+    """Replace the stats document with a fresh count; returns (old, new).
+
+    Increments applied while compute_stats is scanning are overwritten by the
+    replace, so run it when writes are quiet (or re-run it afterwards).
+    """
+    totals = compute_stats()
+    totals["rebuilt_at"] = datetime.now(timezone.utc)
+    totals["updated_at"] = totals["rebuilt_at"]
+    previous = stats_collection.find_one_and_replace({"_id": STATS_ID}, totals, upsert=True)
+    return previous, totals
+
+
+def read_stats():
+    """Current counters, rebuilding them once if the document does not exist yet."""
+    totals = stats_collection.find_one({"_id": STATS_ID})
+    if totals is None:
+        _, totals = rebuild_stats()
+    return totals
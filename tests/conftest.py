@@ -0,0 +1,14 @@
+import os
+import sys
+
+# Modules read their collection names at import time; nothing here talks to MongoDB
+os.environ.setdefault("MONGODB_CONNECTION_STRING", "mongodb://localhost:27017")
+os.environ.setdefault("DATABASE_NAME", "patient360_test")
+os.environ.setdefault("COLLECTION_NAME", "patients")
+os.environ.setdefault("HISTORY_COLLECTION", "meeting_history")
+os.environ.setdefault("APPOINTMENTS_COLLECTION", "appointments")
+os.environ.setdefault("DOCTORS_COLLECTION", "doctors")
+os.environ.setdefault("DASHBOARD_COLLECTION", "patient_dashboards")
+os.environ.setdefault("OUTBOX_WORKERS", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
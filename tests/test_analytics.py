@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from patient.analytics import ReadingFrame, calc_bp_risk, calc_hr_risk, calc_spo2_risk, health_trend, monthly_risk
+
+
+# Values returned by the scalar implementations the vectorized ones replaced
+@pytest.mark.parametrize("calc, value, expected", [
+    (calc_hr_risk, 72, 0),
+    (calc_hr_risk, 60, 0),
+    (calc_hr_risk, 100, 0),
+    (calc_hr_risk, 50, 16.67),
+    (calc_hr_risk, 130, 30.0),
+    (calc_hr_risk, 0, 100.0),
+    (calc_spo2_risk, 98, 0),
+    (calc_spo2_risk, 95, 0),
+    (calc_spo2_risk, 90, 5.26),
+    (calc_bp_risk, 120, 0),
+    (calc_bp_risk, 85, 5.56),
+    (calc_bp_risk, 150, 25.0),
+])
+def test_scalar_risk_matches_baseline(calc, value, expected):
+    risk = calc(value)
+    assert risk == expected
+    # In range is the int 0, out of range a float rounded to 2 places
+    assert type(risk) is (int if expected == 0 else float)
+
+
+@pytest.mark.parametrize("calc", [calc_hr_risk, calc_spo2_risk, calc_bp_risk])
+def test_missing_value(calc):
+    assert calc(None) is None
+    assert calc(float("nan")) is None
+
+
+def test_array_risk_matches_scalars():
+    heartrates = [72, 50, 130, float("nan"), 0]
+    risks = calc_hr_risk(np.array(heartrates))
+    np.testing.assert_array_equal(risks, [0, 16.67, 30.0, np.nan, 100.0])
+    for value, risk in zip(heartrates[:3], risks[:3]):
+        assert calc_hr_risk(value) == risk
+
+
+def reading(medication_id, at, month, riskrate=None, heartrate=None):
+    return {"medication_id": medication_id, "at": at, "month": month, "values": {"riskrate": riskrate, "heartrate": heartrate}}
+
+
+def test_latest_index_first_wins_on_ties():
+    same_time = datetime(2026, 3, 1, 10)
+    frame = ReadingFrame.from_readings([
+        reading("a", datetime(2026, 1, 1), 1),
+        reading("b", same_time, 3),
+        reading("c", None, None),
+        reading("d", same_time.replace(tzinfo=timezone.utc), 3),
+    ])
+    assert frame.latest_index() == 1
+    assert frame.keys[frame.latest_index()] == "b"
+
+
+def test_latest_index_without_valid_times():
+    assert ReadingFrame.from_readings([]).latest_index() is None
+    assert ReadingFrame.from_readings([reading("a", None, None)]).latest_index() is None
+
+
+def test_monthly_means():
+    frame = ReadingFrame.from_readings([
+        reading("a", datetime(2026, 1, 5), 1, riskrate=40, heartrate=70),
+        reading("b", datetime(2026, 1, 20), 1, riskrate=45, heartrate=None),
+        reading("c", datetime(2026, 3, 2), 3, riskrate=None, heartrate=90),
+        reading("d", None, None, riskrate=99, heartrate=99),
+    ])
+
+    means = frame.monthly_means("riskrate")
+    assert means[0] == 42.5
+    # No data (or only missing values) in the month
+    assert np.isnan(means[1]) and np.isnan(means[2])
+    assert np.isnan(means[3:]).all()
+
+    risk = monthly_risk(frame)
+    assert risk[0] == {"month": "January", "average_riskrate": 42.5}
+    assert risk[2] == {"month": "March", "average_riskrate": None}
+
+    trend = health_trend(frame)
+    assert trend["January"]["heartrate"] == 70.0
+    assert trend["March"]["heartrate"] == 90.0
+    assert trend["February"] == {"heartrate": None, "SpO2": None, "Stress": None, "systolic": None, "diastolic": None}
+
+
+def test_monthly_means_rounding():
+    frame = ReadingFrame.from_readings([reading(str(i), datetime(2026, 2, i + 1), 2, riskrate=value) for i, value in enumerate((10, 10, 11))])
+    assert monthly_risk(frame)[1]["average_riskrate"] == 10.33
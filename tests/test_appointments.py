@@ -0,0 +1,111 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from utils import appointments
+from utils.appointments import (
+    APPOINTMENT_DURATION, SOURCE_MEETING_HISTORY, appointment_entry, find_conflicts, history_push, parse_meeting_datetime,
+    _overlaps,
+)
+
+
+class StoredEntries:
+    """Stands in for appointment_entries_collection.find."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.queries = []
+
+    def find(self, query, projection=None, session=None):
+        self.queries.append(query)
+        return list(self.entries)
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    def install(*entries):
+        collection = StoredEntries(entries)
+        monkeypatch.setattr(appointments, "appointment_entries_collection", collection)
+        return collection
+    return install
+
+
+def entry(patient_id, start, doctor_id=None):
+    return appointment_entry(SOURCE_MEETING_HISTORY, patient_id, {"meeting_datetime": start, "doctor_id": doctor_id})
+
+
+def test_meeting_datetimes_are_ist_wall_time():
+    assert parse_meeting_datetime("2026-11-02T10:00:00") == datetime(2026, 11, 2, 10, 0)
+    assert parse_meeting_datetime("2026-11-02T04:30:00Z") == datetime(2026, 11, 2, 10, 0)
+    assert parse_meeting_datetime("2026-11-02T10:00:00+05:30") == datetime(2026, 11, 2, 10, 0)
+    assert parse_meeting_datetime(datetime(2026, 11, 2, 4, 30, tzinfo=timezone.utc)) == datetime(2026, 11, 2, 10, 0)
+    assert parse_meeting_datetime("next tuesday") is None
+    assert parse_meeting_datetime(None) is None
+
+
+def test_overlap_edges_of_the_one_hour_window():
+    booked = entry(1, "2026-11-02T10:00:00")
+    assert _overlaps(entry(1, "2026-11-02T10:59:59"), booked)
+    assert _overlaps(entry(1, "2026-11-02T09:00:01"), booked)
+    # Back to back appointments share an edge but do not overlap
+    assert not _overlaps(entry(1, "2026-11-02T11:00:00"), booked)
+    assert not _overlaps(entry(1, "2026-11-02T09:00:00"), booked)
+
+
+def test_overlap_needs_the_same_patient_or_doctor():
+    booked = entry(1, "2026-11-02T10:00:00", "D1")
+    assert _overlaps(entry(2, "2026-11-02T10:30:00", "D1"), booked)
+    assert not _overlaps(entry(2, "2026-11-02T10:30:00", "D2"), booked)
+    # Two meetings without a doctor only clash for the same patient
+    assert not _overlaps(entry(2, "2026-11-02T10:30:00"), entry(1, "2026-11-02T10:00:00"))
+
+
+def test_find_conflicts_against_stored_entries(stored):
+    collection = stored(entry(1, "2026-11-02T10:00:00", "D1"), entry(3, "2026-11-02T12:00:00", "D1"))
+    requested = [entry(2, "2026-11-02T10:30:00", "D1"), entry(2, "2026-11-02T11:30:00", "D2")]
+
+    conflicts = find_conflicts(requested)
+
+    assert conflicts == [{
+        "requested": {"patient_id": 2, "doctor_id": "D1", "meeting_datetime": "2026-11-02T10:30:00", "source": SOURCE_MEETING_HISTORY},
+        "conflicts_with": {"patient_id": 1, "doctor_id": "D1", "meeting_datetime": "2026-11-02T10:00:00", "source": SOURCE_MEETING_HISTORY},
+    }]
+    # One patient and one doctor range per requested entry, excluding the entries themselves
+    query = collection.queries[0]
+    assert len(query["$or"]) == 4
+    assert query["$or"][0] == {
+        "patient_id": 2,
+        "start": {"$gt": datetime(2026, 11, 2, 10, 30) - APPOINTMENT_DURATION, "$lt": datetime(2026, 11, 2, 11, 30)},
+    }
+    assert query["_id"] == {"$nin": [requested[0]["_id"], requested[1]["_id"]]}
+
+
+def test_find_conflicts_within_the_same_request(stored):
+    stored()
+    requested = [entry(1, "2026-11-02T10:00:00"), entry(1, "2026-11-02T10:59:00"), entry(1, "2026-11-02T12:00:00")]
+
+    conflicts = find_conflicts(requested)
+
+    assert [(c["requested"]["meeting_datetime"], c["conflicts_with"]["meeting_datetime"]) for c in conflicts] == [
+        ("2026-11-02T10:59:00", "2026-11-02T10:00:00"),
+    ]
+
+
+def test_find_conflicts_without_entries_skips_the_query(stored):
+    collection = stored()
+    assert find_conflicts([]) == []
+    assert collection.queries == []
+
+
+def test_history_push_upserts_one_document_per_patient():
+    meetings = [{"meeting_datetime": "2026-11-02T10:00:00"}, {"meeting_datetime": "bad"}]
+
+    op = history_push(7, "p@example.com", meetings)
+
+    assert op._filter == {"patient_id": 7}
+    assert op._upsert is True
+    assert op._doc["$setOnInsert"] == {"patient_email": "p@example.com"}
+    pushed = op._doc["$push"]["meeting_details"]["$each"]
+    assert [meeting["meeting_at"] for meeting in pushed] == [datetime(2026, 11, 2, 10, 0), None]
+    # The caller's meetings are not modified
+    assert "meeting_at" not in meetings[0]
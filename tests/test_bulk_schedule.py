@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+from main import expand_recurrence, validate_schedule_rows
+
+
+def rule(**overrides):
+    return {"patientid": 1, "meeting_datetime": "2026-11-02T10:00:00", "therapy": "Nutrition", "therapy_mode": "online", **overrides}
+
+
+def test_weekly_by_count():
+    rows = expand_recurrence(rule(count=3))
+    assert [row["meeting_datetime"] for row in rows] == ["2026-11-02T10:00:00", "2026-11-09T10:00:00", "2026-11-16T10:00:00"]
+    assert rows[0] == {"patientid": 1, "meeting_datetime": "2026-11-02T10:00:00", "therapy": "Nutrition", "therapy_mode": "online", "doctor_id": None}
+
+
+def test_until_is_inclusive_and_interval_applies():
+    rows = expand_recurrence(rule(frequency="Daily", interval=2, until="2026-11-06T10:00:00"))
+    assert [row["meeting_datetime"] for row in rows] == ["2026-11-02T10:00:00", "2026-11-04T10:00:00", "2026-11-06T10:00:00"]
+
+
+def test_one_row_per_patient_and_occurrence():
+    rows = expand_recurrence(rule(frequency="monthly", count=2, patientids=[1, 2], doctor_id="D1"))
+    assert [(row["patientid"], row["meeting_datetime"]) for row in rows] == [
+        (1, "2026-11-02T10:00:00"), (2, "2026-11-02T10:00:00"), (1, "2026-12-02T10:00:00"), (2, "2026-12-02T10:00:00"),
+    ]
+    assert {row["doctor_id"] for row in rows} == {"D1"}
+
+
+def test_oversized_rules_stop_one_past_the_limit(monkeypatch):
+    monkeypatch.setattr(main, "BULK_SCHEDULE_MAX_MEETINGS", 4)
+    assert len(expand_recurrence(rule(frequency="daily", count=1000, patientids=[1, 2]))) == 6
+
+
+@pytest.mark.parametrize("recurrence, message", [
+    (rule(frequency="hourly", count=2), "frequency"),
+    (rule(), "count or until"),
+])
+def test_invalid_rules(recurrence, message):
+    with pytest.raises(ValueError, match=message):
+        expand_recurrence(recurrence)
+
+
+def future(hours=24):
+    return (datetime.now() + timedelta(hours=hours)).replace(microsecond=0).isoformat()
+
+
+PATIENTS = {
+    1: {"patientid": 1, "email": "one@example.com"},
+    2: {"patientid": 2, "email": ""},
+}
+DOCTORS = {"D1": {"doctor_id": "D1"}}
+
+
+def test_validate_schedule_rows():
+    when = future()
+    rows = [
+        {"patientid": 1, "meeting_datetime": when, "therapy": "Nutrition", "therapy_mode": "Online", "doctor_id": "D1"},
+        {"patientid": 9, "meeting_datetime": when, "therapy": "Nutrition", "therapy_mode": "online"},
+        {"patientid": 2, "meeting_datetime": when, "therapy": "Nutrition", "therapy_mode": "online"},
+        {"patientid": 1, "meeting_datetime": when, "therapy": "Nutrition", "therapy_mode": "phone"},
+        {"patientid": 1, "meeting_datetime": when, "therapy": "Yoga", "therapy_mode": "online"},
+        {"patientid": 1, "meeting_datetime": "tomorrow", "therapy": "Nutrition", "therapy_mode": "online"},
+        {"patientid": 1, "meeting_datetime": "2020-01-01T10:00:00", "therapy": "Nutrition", "therapy_mode": "online"},
+        {"patientid": 1, "meeting_datetime": future(48), "therapy": "Nutrition", "therapy_mode": "online", "doctor_id": "D9"},
+        {"patientid": 1, "meeting_datetime": when, "therapy": "Psychology", "therapy_mode": "offline"},
+    ]
+
+    meetings, errors = validate_schedule_rows(rows, PATIENTS, DOCTORS)
+
+    assert meetings == [
+        {"patientid": 1, "meeting_datetime": when, "therapy": "Nutrition", "therapy_mode": "Online", "doctor_id": "D1"},
+    ]
+    assert [(error["row"], error["error"]) for error in errors] == [
+        (1, "Patient not found"),
+        (2, "Patient email not found in database"),
+        (3, "Invalid mode of appointment"),
+        (4, "Selected therapy unavailable for online appointments"),
+        (5, "Invalid datetime format. Use: YYYY-MM-DDTHH:MM:SS"),
+        (6, "Meeting datetime must be in the future"),
+        (7, "Doctor not found"),
+        (8, "Duplicate meeting for this patient and time"),
+    ]
@@ -0,0 +1,12 @@
+from utils.metrics import LatencyWindow
+
+
+def test_latency_window_summary():
+    window = LatencyWindow(size=4)
+    assert window.summary() == {"window": 0, "avg": None, "p50": None, "p95": None, "max": None}
+
+    for milliseconds in (50, 10.123, 40, 20, 30):
+        window.add(milliseconds)
+
+    # The oldest value (50) dropped out of the window
+    assert window.summary() == {"window": 4, "avg": 25.03, "p50": 30, "p95": 40, "max": 40}
@@ -0,0 +1,114 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from pymongo import ASCENDING, DESCENDING
+
+from patient.patient import encode_cursor, keyset_condition, parse_cursor
+
+
+def test_patientid_order():
+    assert keyset_condition("patientid", ASCENDING, None, 10) == {"patientid": {"$gt": 10}}
+    assert keyset_condition("patientid", DESCENDING, None, 10) == {"patientid": {"$lt": 10}}
+
+
+def test_value_anchor():
+    assert keyset_condition("latest_riskrate", ASCENDING, 50, 7) == {"$or": [
+        {"latest_riskrate": {"$gt": 50}},
+        {"latest_riskrate": 50, "patientid": {"$gt": 7}},
+    ]}
+    assert keyset_condition("latest_riskrate", DESCENDING, 50, 7) == {"$or": [
+        {"latest_riskrate": {"$lt": 50}},
+        {"latest_riskrate": 50, "patientid": {"$lt": 7}},
+        {"latest_riskrate": None},
+    ]}
+
+
+def test_missing_anchor():
+    assert keyset_condition("latest_at", ASCENDING, None, 7) == {"$or": [
+        {"latest_at": None, "patientid": {"$gt": 7}},
+        {"latest_at": {"$ne": None}},
+    ]}
+    assert keyset_condition("latest_at", DESCENDING, None, 7) == {"latest_at": None, "patientid": {"$lt": 7}}
+
+
+@pytest.mark.parametrize("sort_field, row, cursor, anchor", [
+    ("patientid", {"patientid": 12}, "12", None),
+    ("latest_riskrate", {"patientid": 12, "latest_riskrate": 47}, "47|12", {"latest_riskrate": 47}),
+    ("latest_riskrate", {"patientid": 12, "latest_riskrate": 47.25}, "47.25|12", {"latest_riskrate": 47.25}),
+    ("latest_riskrate", {"patientid": 12}, "|12", {"latest_riskrate": None}),
+    ("latest_at", {"patientid": 12, "latest_at": datetime(2026, 3, 1, 10, 30)}, "2026-03-01T10:30:00|12",
+     {"latest_at": datetime(2026, 3, 1, 10, 30, tzinfo=timezone.utc)}),
+])
+def test_cursor_round_trip(sort_field, row, cursor, anchor):
+    assert encode_cursor(sort_field, row) == cursor
+    assert parse_cursor(sort_field, cursor) == (12, anchor)
+
+
+def test_bare_patientid_cursor():
+    # Older clients send the last patient_id only; the route then reads the anchor itself
+    assert parse_cursor("latest_riskrate", "12") == (12, None)
+
+
+@pytest.mark.parametrize("cursor", ["abc", "47|x", "soon|12"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException):
+        parse_cursor("latest_at" if cursor == "soon|12" else "latest_riskrate", cursor)
+
+
+# ---------------- PAGING ----------------
+
+def matches(row, condition):
+    """The subset of MongoDB matching keyset_condition produces (None matches a missing field)."""
+    if "$or" in condition:
+        return any(matches(row, clause) for clause in condition["$or"])
+    for field, expected in condition.items():
+        value = row.get(field)
+        if not isinstance(expected, dict):
+            if value != expected:
+                return False
+            continue
+        for op, operand in expected.items():
+            if op == "$ne":
+                ok = value != operand
+            else:
+                # Range operators never match missing values
+                ok = value is not None and (value > operand if op == "$gt" else value < operand)
+            if not ok:
+                return False
+    return True
+
+
+def sort_key(row):
+    # MongoDB sorts missing values before numbers
+    value = row.get("latest_riskrate")
+    return (value is not None, value if value is not None else 0, row["patientid"])
+
+
+ROWS = [
+    {"patientid": 1, "latest_riskrate": 50},
+    {"patientid": 2},
+    {"patientid": 3, "latest_riskrate": 20},
+    {"patientid": 4, "latest_riskrate": 50},
+    {"patientid": 5},
+    {"patientid": 6, "latest_riskrate": 90},
+    {"patientid": 7, "latest_riskrate": 50},
+]
+
+
+@pytest.mark.parametrize("direction", [ASCENDING, DESCENDING])
+def test_pages_cover_every_row_once(direction):
+    ordered = sorted(ROWS, key=sort_key, reverse=direction == DESCENDING)
+    seen, cursor = [], None
+    while True:
+        rows = ordered
+        if cursor is not None:
+            after, anchor = parse_cursor("latest_riskrate", cursor)
+            condition = keyset_condition("latest_riskrate", direction, anchor["latest_riskrate"], after)
+            rows = [row for row in ordered if matches(row, condition)]
+        page = rows[:2]
+        if not page:
+            break
+        seen.extend(row["patientid"] for row in page)
+        cursor = encode_cursor("latest_riskrate", page[-1])
+    assert seen == [row["patientid"] for row in ordered]
@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from patient.records import NORMALIZATION_VERSION, normalize_reading, parse_bp, parse_time
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("120/80", (120.0, 80.0, 120.0)),
+    (" 135 / 85 ", (135.0, 85.0, 135.0)),
+    ("120", (None, None, 120.0)),
+    (118, (None, None, 118.0)),
+    ("120/", (None, None, 120.0)),
+    ("abc/80", (None, None, None)),
+    ("", (None, None, None)),
+    (None, (None, None, None)),
+])
+def test_parse_bp(value, expected):
+    assert parse_bp(value) == expected
+
+
+def test_parse_time_returns_aware_utc():
+    assert parse_time("2026-03-01T10:00:00Z") == datetime(2026, 3, 1, 10, tzinfo=timezone.utc)
+    assert parse_time("2026-03-01T10:00:00+05:30") == datetime(2026, 3, 1, 4, 30, tzinfo=timezone.utc)
+    # Naive timestamps are taken as UTC
+    assert parse_time("2026-03-01 10:00:00") == datetime(2026, 3, 1, 10, tzinfo=timezone.utc)
+    assert parse_time(datetime(2026, 3, 1, 10)) == datetime(2026, 3, 1, 10, tzinfo=timezone.utc)
+    # Formats fromisoformat rejects go through dateutil
+    assert parse_time("March 1 2026 10:00") == datetime(2026, 3, 1, 10, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("value", [None, "", "not a date", 12])
+def test_parse_time_invalid(value):
+    assert parse_time(value) is None
+
+
+def test_normalize_reading():
+    record = {
+        "time": "2026-03-31T23:30:00-02:00",
+        "heartrate": "72 bpm",
+        "SpO2": "98%",
+        "Stress": 0,
+        "riskrate": "41",
+        "bp": "120/80",
+    }
+
+    assert normalize_reading(record) == {
+        "at": datetime(2026, 4, 1, 1, 30, tzinfo=timezone.utc),
+        # The month as written, not the UTC one
+        "month": 3,
+        "values": {
+            "heartrate": 72.0, "SpO2": 98.0, "Stress": 0.0, "riskrate": 41.0,
+            "systolic": 120.0, "diastolic": 80.0, "bp": 120.0,
+        },
+        "normalized": NORMALIZATION_VERSION,
+    }
+
+
+def test_normalize_reading_keeps_invalid_values_as_none():
+    normalized = normalize_reading({"time": "soon", "heartrate": "fast", "SpO2": None, "Stress": "5%", "riskrate": "nan", "bp": "90"})
+
+    assert normalized["at"] is None
+    assert normalized["month"] is None
+    assert normalized["values"] == {
+        "heartrate": None, "SpO2": None, "Stress": None, "riskrate": None,
+        "systolic": None, "diastolic": None, "bp": 90.0,
+    }
@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from functions import whatsapp_campaign
+from functions.whatsapp_campaign import STAGES, new_campaign, progress, stage_delay, stage_job
+
+
+def test_stages_and_schedule(monkeypatch):
+    monkeypatch.setattr(whatsapp_campaign, "CAMPAIGN_FIRST_DELAY", 5)
+    monkeypatch.setattr(whatsapp_campaign, "CAMPAIGN_DAY_INTERVAL", 86400)
+    assert STAGES == ("greeting", "DAY1", "DAY2", "DAY3", "DAY4", "DAY5", "DAY6", "DAY7")
+    assert [stage_delay(stage) for stage in STAGES[1:3]] == [5, 86400]
+
+    run_at = datetime(2026, 11, 2, 10)
+    job = stage_job("c1", "DAY3", run_at)
+    assert job["_id"] == "campaign:c1:DAY3"
+    assert job["payload"] == {"campaign_id": "c1", "stage": "DAY3"}
+    assert job["next_attempt_at"] == run_at
+
+
+def test_progress(monkeypatch):
+    monkeypatch.setattr(whatsapp_campaign.time, "time", lambda: 110.0)
+    campaign = new_campaign("Diet", [3, 1, 2], skipped=[4])
+    campaign["stages"] = {
+        "greeting": {"total": 3, "sent": 2, "failed": 1, "started": 100.0, "finished": 102.0},
+        "DAY1": {"total": 3, "sent": 1, "failed": 0, "started": 108.0, "finished": None},
+    }
+
+    status = progress(campaign)
+
+    assert campaign["patientids"] == [1, 2, 3]
+    assert status["patients"] == 3 and status["skipped"] == [4]
+    assert (status["sent"], status["failed"]) == (3, 1)
+    assert status["stages"]["greeting"] == {
+        "total": 3, "sent": 2, "failed": 1, "pending": 0, "elapsed_s": 2.0, "messages_per_sec": 1.5, "finished": True,
+    }
+    assert status["stages"]["DAY1"]["pending"] == 2
+    assert status["stages"]["DAY1"]["elapsed_s"] == 2.0
+    assert status["stages"]["DAY1"]["finished"] is False
@@ -0,0 +1,341 @@
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, UpdateOne
+from utils.db import (
+    meeting_history_collection,
+    appointments_collection,
+    appointment_entries_collection,
+    booking_locks_collection,
+    readings_collection,
+)
+
+# Every appointment is booked for one hour
+APPOINTMENT_DURATION = timedelta(hours=1)
+
+# Where an appointment was originally recorded
+SOURCE_MEDICATIONS = "medications"
+SOURCE_MEETING_HISTORY = "meeting_history"
+SOURCE_APPOINTMENTS = "appointments"
+
+# Nested history collection (one document per patient) behind each bookable source
+HISTORY_COLLECTIONS = {
+    SOURCE_MEETING_HISTORY: meeting_history_collection,
+    SOURCE_APPOINTMENTS: appointments_collection,
+}
+
+# meeting_datetime values are Indian Standard Time wall-clock times (no DST)
+MEETING_UTC_OFFSET = timedelta(hours=5, minutes=30)
+MEETING_TIMEZONE = timezone(MEETING_UTC_OFFSET, "IST")
+# Trailing offset of a meeting_datetime string, for the server-side backfill
+OFFSET_PATTERN = r"(Z|[+-][0-9]{2}:?[0-9]{2})$"
+
+CONFLICT_PROJECTION = {"patient_id": 1, "doctor_id": 1, "start": 1, "end": 1, "meeting_datetime": 1, "source": 1}
+
+
+def parse_meeting_datetime(value):
+    """meeting_datetime as a naive IST wall-clock time (how clients send it).
+
+    Values carrying an offset (or Z) are converted to IST first, so every
+    stored start/meeting_at uses the same convention.
+    """
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, str) and value:
+        try:
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    else:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(MEETING_TIMEZONE).replace(tzinfo=None)
+    return dt
+
+
+def appointment_entry(source: str, patient_id, meeting: dict, key=None):
+    """Build the flattened document for one nested meeting (None if it has no valid time).
+
+    key identifies the meeting inside its source: the medication key for
+    medications, otherwise the scheduled_at timestamp of the meeting.
+    """
+    start = parse_meeting_datetime(meeting.get("meeting_datetime"))
+    if start is None:
+        return None
+    if key is None:
+        key = f"{meeting.get('meeting_datetime')}:{meeting.get('scheduled_at')}"
+    return {
+        "_id": f"{source}:{patient_id}:{key}",
+        "patient_id": patient_id,
+        "doctor_id": meeting.get("doctor_id"),
+        "start": start,
+        "end": start + APPOINTMENT_DURATION,
+        "therapy": meeting.get("therapy"),
+        "mode": meeting.get("therapy_mode") or meeting.get("mode"),
+        "meeting_link": meeting.get("meeting_link"),
+        "meeting_datetime": meeting.get("meeting_datetime"),
+        "source": source,
+    }
+
+
+def record_entry(entry, session=None):
+    """Upsert one flattened appointment (idempotent on its _id)."""
+    if entry is None:
+        return
+    appointment_entries_collection.replace_one({"_id": entry["_id"]}, entry, upsert=True, session=session)
+
+
+# ---------------- BOOKING ----------------
+
+class AppointmentConflict(Exception):
+    """A booking overlaps another appointment of the same patient or doctor."""
+
+    def __init__(self, conflicts):
+        super().__init__(f"{len(conflicts)} conflicting appointment(s)")
+        self.conflicts = conflicts
+
+
+def _overlaps(a, b):
+    if a["start"] >= b["end"] or b["start"] >= a["end"]:
+        return False
+    return a["patient_id"] == b["patient_id"] or (
+        a.get("doctor_id") is not None and a.get("doctor_id") == b.get("doctor_id")
+    )
+
+
+def _describe(entry):
+    return {
+        "patient_id": entry.get("patient_id"),
+        "doctor_id": entry.get("doctor_id"),
+        "meeting_datetime": entry.get("meeting_datetime"),
+        "source": entry.get("source"),
+    }
+
+
+def find_conflicts(entries: list, session=None):
+    """Overlaps between new flattened entries and stored (or each other's) appointments.
+
+    Every appointment lasts APPOINTMENT_DURATION, so anything overlapping
+    [start, end) starts inside (start - duration, end): one $or query of tight
+    ranges on the (patient_id, start) and (doctor_id, start) indexes.
+    """
+    clauses = []
+    for entry in entries:
+        window = {"$gt": entry["start"] - APPOINTMENT_DURATION, "$lt": entry["end"]}
+        clauses.append({"patient_id": entry["patient_id"], "start": window})
+        if entry.get("doctor_id") is not None:
+            clauses.append({"doctor_id": entry["doctor_id"], "start": window})
+    if not clauses:
+        return []
+
+    stored = list(appointment_entries_collection.find(
+        {"$or": clauses, "_id": {"$nin": [entry["_id"] for entry in entries]}},
+        CONFLICT_PROJECTION,
+        session=session
+    ))
+    conflicts = []
+    for i, entry in enumerate(entries):
+        others = stored + entries[:i]
+        for other in others:
+            if _overlaps(entry, other):
+                conflicts.append({"requested": _describe(entry), "conflicts_with": _describe(other)})
+    return conflicts
+
+
+def lock_calendars(entries: list, session=None):
+    """Bump one lock document per patient and doctor being booked.
+
+    Two transactions booking the same calendar then write the same document,
+    so one hits a write conflict and is retried, re-running its overlap check.
+    Standalone servers have no transactions and skip this.
+    """
+    if session is None:
+        return
+    keys = set()
+    for entry in entries:
+        keys.add(f"patient:{entry['patient_id']}")
+        if entry.get("doctor_id") is not None:
+            keys.add(f"doctor:{entry['doctor_id']}")
+    booking_locks_collection.bulk_write(
+        [UpdateOne({"_id": key}, {"$inc": {"seq": 1}}, upsert=True) for key in sorted(keys)],
+        session=session
+    )
+
+
+def history_push(patient_id, patient_email, meetings: list):
+    """Upsert appending meetings to a patient's history document (unique on patient_id).
+
+    Each stored meeting also gets meeting_at, its meeting_datetime as a real
+    datetime, so upcoming/past can be filtered and sorted by the server.
+    """
+    stored = [{**meeting, "meeting_at": parse_meeting_datetime(meeting.get("meeting_datetime"))} for meeting in meetings]
+    return UpdateOne(
+        {"patient_id": patient_id},
+        {
+            "$push": {"meeting_details": {"$each": stored}},
+            "$setOnInsert": {"patient_email": patient_email},
+        },
+        upsert=True
+    )
+
+
+def check_bookings(entries: list, session=None):
+    """Lock the calendars involved and raise AppointmentConflict on any overlap."""
+    lock_calendars(entries, session)
+    conflicts = find_conflicts(entries, session)
+    if conflicts:
+        raise AppointmentConflict(conflicts)
+
+
+def book_meetings(source: str, patient_id, patient_email, meetings: list, session=None):
+    """Store new meetings of one patient after the overlap check; returns their flattened entries."""
+    entries = [appointment_entry(source, patient_id, meeting) for meeting in meetings]
+    check_bookings(entries, session)
+    HISTORY_COLLECTIONS[source].bulk_write([history_push(patient_id, patient_email, meetings)], session=session)
+    appointment_entries_collection.bulk_write(
+        [ReplaceOne({"_id": entry["_id"]}, entry, upsert=True) for entry in entries],
+        session=session
+    )
+    return entries
+
+
+def _meetings_page(cond, order: int, limit: int):
+    return [
+        {"$project": {"_id": 0, "meeting": {"$filter": {"input": "$meeting_details", "as": "m", "cond": cond}}}},
+        {"$unwind": "$meeting"},
+        {"$replaceRoot": {"newRoot": "$meeting"}},
+        {"$sort": {"meeting_at": order}},
+        {"$limit": limit},
+    ]
+
+
+def patient_meetings(patient_id, now: datetime, limit: int, after: datetime = None, before: datetime = None):
+    """One page of upcoming (soonest first) and past (latest first) meetings, or None without history.
+
+    Filtering, sorting and limiting run in a single aggregation over the
+    patient's history document; after/before continue from a previous page.
+    """
+    upcoming_from = max(now, after) if after else now
+    upcoming_op = "$gt" if after and after >= now else "$gte"
+    past_until = min(now, before) if before else now
+    pipeline = [
+        {"$match": {"patient_id": patient_id}},
+        {"$facet": {
+            "upcoming": _meetings_page({upcoming_op: ["$$m.meeting_at", upcoming_from]}, ASCENDING, limit),
+            "past": _meetings_page({"$and": [
+                # null sorts below every date: keep meetings without meeting_at out of past
+                {"$gte": ["$$m.meeting_at", datetime.min]},
+                {"$lt": ["$$m.meeting_at", past_until]},
+            ]}, DESCENDING, limit),
+            "found": [{"$project": {"_id": 1}}],
+        }},
+    ]
+    result = next(meeting_history_collection.aggregate(pipeline), None)
+    if not result or not result["found"]:
+        return None
+    return result["upcoming"], result["past"]
+
+
+def _meeting_at_expression(meeting_datetime: str):
+    """parse_meeting_datetime as an aggregation expression.
+
+    $dateFromString keeps naive strings as written and converts offsets to
+    UTC; strings that had an offset are then shifted to IST wall time.
+    """
+    has_offset = {"$cond": [
+        {"$eq": [{"$type": meeting_datetime}, "string"]},
+        {"$regexMatch": {"input": meeting_datetime, "regex": OFFSET_PATTERN}},
+        False,
+    ]}
+    return {"$let": {
+        "vars": {"parsed": {"$dateFromString": {"dateString": meeting_datetime, "onError": None, "onNull": None}}},
+        "in": {"$cond": [
+            has_offset,
+            {"$dateAdd": {"startDate": "$$parsed", "unit": "minute", "amount": MEETING_UTC_OFFSET // timedelta(minutes=1)}},
+            "$$parsed",
+        ]},
+    }}
+
+
+def backfill_meeting_at():
+    """Add meeting_at to stored meetings that predate it (server-side, safe to re-run)."""
+    updated = 0
+    for history_collection in HISTORY_COLLECTIONS.values():
+        result = history_collection.update_many(
+            {"meeting_details": {"$elemMatch": {"meeting_at": {"$exists": False}}}},
+            [{"$set": {"meeting_details": {"$map": {
+                "input": "$meeting_details",
+                "in": {"$mergeObjects": ["$$this", {"meeting_at": {"$ifNull": [
+                    "$$this.meeting_at",
+                    _meeting_at_expression("$$this.meeting_datetime"),
+                ]}}]},
+            }}}}]
+        )
+        updated += result.modified_count
+    return updated
+
+
+def merge_duplicate_histories():
+    """Fold duplicate per-patient history documents into one, so patient_id can be unique."""
+    merged = 0
+    for history_collection in HISTORY_COLLECTIONS.values():
+        pipeline = [
+            {"$group": {"_id": "$patient_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ]
+        for group in list(history_collection.aggregate(pipeline)):
+            docs = list(history_collection.find({"_id": {"$in": group["ids"]}}).sort("_id", 1))
+            keep, duplicates = docs[0], docs[1:]
+            meetings = [meeting for doc in duplicates for meeting in doc.get("meeting_details") or []]
+            history_collection.update_one({"_id": keep["_id"]}, {"$push": {"meeting_details": {"$each": meetings}}})
+            history_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in duplicates]}})
+            merged += len(duplicates)
+    return merged
+
+
+def count_meetings_by_doctor(start: datetime, end: datetime, source: str = None):
+    """doctor_id -> number of appointments starting in [start, end), via the (doctor_id, start) index.
+
+    Pass source to only count appointments recorded there (e.g. SOURCE_MEDICATIONS).
+    """
+    match = {"doctor_id": {"$ne": None}, "start": {"$gte": start, "$lt": end}}
+    if source is not None:
+        match["source"] = source
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": "$doctor_id", "count": {"$sum": 1}}},
+    ]
+    return {row["_id"]: row["count"] for row in appointment_entries_collection.aggregate(pipeline)}
+
+
+def _source_entries():
+    """Yield flattened entries for every appointment already stored in nested form."""
+    readings = readings_collection.find(
+        {"meeting_details": {"$exists": True}},
+        {"_id": 0, "patientid": 1, "medication_id": 1, "meeting_details": 1}
+    )
+    for reading in readings:
+        if reading.get("meeting_details"):
+            yield appointment_entry(SOURCE_MEDICATIONS, reading["patientid"], reading["meeting_details"], reading["medication_id"])
+
+    for source, source_collection in ((SOURCE_MEETING_HISTORY, meeting_history_collection),
+                                      (SOURCE_APPOINTMENTS, appointments_collection)):
+        for history in source_collection.find({}, {"_id": 0, "patient_id": 1, "meeting_details": 1}):
+            for meeting in history.get("meeting_details") or []:
+                yield appointment_entry(source, history.get("patient_id"), meeting)
+
+
+def backfill_appointment_entries(batch_size: int = 1000):
+    """Copy existing nested appointments into the flattened collection (safe to re-run)."""
+    written = 0
+    ops = []
+    for entry in _source_entries():
+        if entry is None:
+            continue
+        ops.append(ReplaceOne({"_id": entry["_id"]}, entry, upsert=True))
+        if len(ops) >= batch_size:
+            result = appointment_entries_collection.bulk_write(ops, ordered=False)
+            written += result.upserted_count + result.modified_count
+            ops = []
+    if ops:
+        result = appointment_entries_collection.bulk_write(ops, ordered=False)
+        written += result.upserted_count + result.modified_count
+    return written
@@ -0,0 +1,249 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pymongo
+from dotenv import load_dotenv
+from pymongo import ASCENDING, MongoClient, monitoring
+from pymongo.errors import OperationFailure
+
+from utils.query_stats import query_listener
+
+load_dotenv()
+
+MONGODB_CONNECTION_STRING = os.getenv("MONGODB_CONNECTION_STRING")
+DATABASE_NAME = os.getenv("DATABASE_NAME")
+COLLECTION_NAME = os.getenv("COLLECTION_NAME")
+HISTORY_COLLECTION = os.getenv("HISTORY_COLLECTION")
+APPOINTMENTS_COLLECTION = os.getenv("APPOINTMENTS_COLLECTION")
+DOCTORS_COLLECTION = os.getenv("DOCTORS_COLLECTION")
+DASHBOARD_COLLECTION = os.getenv("DASHBOARD_COLLECTION")
+STATS_COLLECTION = os.getenv("STATS_COLLECTION", "patient_stats")
+APPOINTMENT_ENTRIES_COLLECTION = os.getenv("APPOINTMENT_ENTRIES_COLLECTION", "appointment_entries")
+OUTBOX_COLLECTION = os.getenv("OUTBOX_COLLECTION", "outbox_jobs")
+BOOKING_LOCKS_COLLECTION = os.getenv("BOOKING_LOCKS_COLLECTION", "booking_locks")
+READINGS_COLLECTION = os.getenv("READINGS_COLLECTION", "vitals_readings")
+CAMPAIGNS_COLLECTION = os.getenv("CAMPAIGNS_COLLECTION", "whatsapp_campaigns")
+
+# Pool and timeout settings (one pool shared by every router)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+DB_CALL_TIMEOUT = float(os.getenv("DB_CALL_TIMEOUT", "10"))
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters fed by pymongo's CMAP events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections_open = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.total_checkouts = 0
+        self.checkout_failures = 0
+
+    def _add(self, field, amount=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+            if self.checked_out > self.max_checked_out:
+                self.max_checked_out = self.checked_out
+
+    def connection_created(self, event):
+        self._add("connections_open")
+
+    def connection_closed(self, event):
+        self._add("connections_open", -1)
+
+    def connection_checked_out(self, event):
+        self._add("checked_out")
+        self._add("total_checkouts")
+
+    def connection_checked_in(self, event):
+        self._add("checked_out", -1)
+
+    def connection_check_out_failed(self, event):
+        self._add("checkout_failures")
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "connections_open": self.connections_open,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "total_checkouts": self.total_checkouts,
+                "checkout_failures": self.checkout_failures,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+# Initialize the single MongoDB client used by the whole app
+client = MongoClient(
+    MONGODB_CONNECTION_STRING,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    event_listeners=[pool_metrics, query_listener],
+)
+db = client[DATABASE_NAME]
+collection = db[COLLECTION_NAME]
+meeting_history_collection = db[HISTORY_COLLECTION]
+appointments_collection = db[APPOINTMENTS_COLLECTION]
+doctors_collection = db[DOCTORS_COLLECTION]
+dashboard_collection = db[DASHBOARD_COLLECTION]
+stats_collection = db[STATS_COLLECTION]
+# One document per appointment, flattened from the three nested sources
+appointment_entries_collection = db[APPOINTMENT_ENTRIES_COLLECTION]
+# Side-effect jobs (calendar invites, emails) written together with the data they belong to
+outbox_collection = db[OUTBOX_COLLECTION]
+# One tiny document per patient/doctor calendar, bumped by every booking transaction
+booking_locks_collection = db[BOOKING_LOCKS_COLLECTION]
+# One document per vitals reading (medication record), keyed by patient and time
+readings_collection = db[READINGS_COLLECTION]
+# WhatsApp plan campaigns: cohort, stage counters and status (stages run as outbox jobs)
+campaigns_collection = db[CAMPAIGNS_COLLECTION]
+
+
+# Blocking pymongo calls run here so they never stall the event loop.
+# One worker per pooled connection: extra calls queue instead of piling up threads.
+_executor = ThreadPoolExecutor(max_workers=MONGO_MAX_POOL_SIZE, thread_name_prefix="mongo")
+_call_stats = {"in_flight": 0, "completed": 0, "failed": 0, "timed_out": 0, "total_ms": 0.0}
+_call_stats_lock = threading.Lock()
+
+
+def _track(field, amount=1):
+    with _call_stats_lock:
+        _call_stats[field] += amount
+
+
+def _run_with_timeout(fn, args, kwargs, timeout):
+    # pymongo.timeout applies to every operation started inside this block,
+    # so the server aborts the query instead of leaving the thread busy.
+    with pymongo.timeout(timeout):
+        return fn(*args, **kwargs)
+
+
+async def run_db(fn, *args, timeout=None, **kwargs):
+    """Run a blocking pymongo call on the DB thread pool and await its result.
+
+    Pass the bound method and its arguments, e.g.
+    ``await run_db(collection.find_one, {"patientid": 1})``. Cursors must be
+    consumed inside the call, e.g. ``await run_db(lambda: list(collection.find()))``.
+    """
+    timeout = DB_CALL_TIMEOUT if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    _track("in_flight")
+    try:
+        # Run in a copy of the caller's context so commands are counted against its request
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(_executor, context.run, _run_with_timeout, fn, args, kwargs, timeout)
+        # Small grace period so pymongo's own timeout error wins when it fires
+        result = await asyncio.wait_for(future, timeout + 1)
+        _track("completed")
+        return result
+    except asyncio.TimeoutError:
+        _track("timed_out")
+        raise
+    except pymongo.errors.PyMongoError as e:
+        _track("timed_out" if e.timeout else "failed")
+        raise
+    except Exception:
+        _track("failed")
+        raise
+    finally:
+        _track("in_flight", -1)
+        _track("total_ms", (time.perf_counter() - started) * 1000)
+
+
+def run_transaction(fn):
+    """Run fn(session) as one multi-document transaction and return its result.
+
+    Standalone servers do not support transactions; fn then runs once with
+    session=None, so callers should write their outbox job last.
+    """
+    with client.start_session() as session:
+        try:
+            return session.with_transaction(fn)
+        except OperationFailure as e:
+            # IllegalOperation: not a replica set member or mongos
+            if e.code != 20:
+                raise
+    return fn(None)
+
+
+def ensure_indexes():
+    """Create the indexes the read paths rely on (no-op when they exist)."""
+    collection.create_index([("patientid", ASCENDING)])
+    # patients_list filters and keyset sorts
+    collection.create_index([("gender", ASCENDING), ("patientid", ASCENDING)])
+    collection.create_index([("latest_riskrate", ASCENDING), ("patientid", ASCENDING)])
+    collection.create_index([("latest_at", ASCENDING), ("patientid", ASCENDING)])
+    # Materialized dashboards are read by patientid
+    dashboard_collection.create_index([("patientid", ASCENDING)], unique=True)
+    # Date-range reports over flattened appointments
+    appointment_entries_collection.create_index([("doctor_id", ASCENDING), ("start", ASCENDING)])
+    appointment_entries_collection.create_index([("start", ASCENDING)])
+    appointment_entries_collection.create_index([("patient_id", ASCENDING), ("start", ASCENDING)])
+    # Outbox workers claim due jobs and jobs whose lease expired
+    outbox_collection.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+    outbox_collection.create_index([("status", ASCENDING), ("lease_until", ASCENDING)])
+    # Latest-N and range reads per patient; one reading per medication id
+    readings_collection.create_index([("patientid", ASCENDING), ("at", ASCENDING)])
+    readings_collection.create_index([("patientid", ASCENDING), ("medication_id", ASCENDING)], unique=True)
+    # Campaign list order; finished campaigns expire at expires_at
+    campaigns_collection.create_index([("created_at", ASCENDING)])
+    campaigns_collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    # One history document per patient (bookings upsert on patient_id).
+    # Created last: fails until `manage.py merge-duplicate-history` has run on old data.
+    meeting_history_collection.create_index([("patient_id", ASCENDING)], unique=True)
+    appointments_collection.create_index([("patient_id", ASCENDING)], unique=True)
+
+
+def pool_stats():
+    """Snapshot of connection pool and DB thread-offload usage."""
+    with _call_stats_lock:
+        calls = dict(_call_stats)
+    finished = calls["completed"] + calls["failed"] + calls["timed_out"]
+    calls["avg_ms"] = round(calls.pop("total_ms") / finished, 2) if finished else None
+    return {
+        "pool": {
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            **pool_metrics.snapshot(),
+        },
+        "calls": {
+            "workers": MONGO_MAX_POOL_SIZE,
+            "queued": _executor._work_queue.qsize(),
+            "default_timeout_s": DB_CALL_TIMEOUT,
+            **calls,
+        },
+    }
+
+
+def close_db():
+    """Stop the DB worker threads and close the shared client."""
+    _executor.shutdown(wait=False)
+    client.close()
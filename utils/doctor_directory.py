@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+
+from utils.db import run_db, doctors_collection
+
+# How long cached doctor entries stay valid (seconds)
+DOCTOR_CACHE_TTL = float(os.getenv("DOCTOR_CACHE_TTL", "300"))
+
+DOCTOR_PROJECTION = {"_id": 0, "doctor_id": 1, "name": 1, "specialisation": 1}
+
+
+class DoctorDirectory:
+    """In-process doctor cache with TTL, explicit invalidation and bulk prefetch."""
+
+    def __init__(self, ttl: float = DOCTOR_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}      # doctor_id -> (expires_at, doctor or None)
+        self._all = None        # full directory listing, in collection order
+        self._all_expires = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, doctor_ids):
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for doctor_id in doctor_ids:
+                entry = self._entries.get(doctor_id)
+                if entry and entry[0] > now:
+                    found[doctor_id] = entry[1]
+                else:
+                    missing.append(doctor_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def _store(self, doctor_ids, doctors):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for doctor_id in doctor_ids:
+                # Unknown ids are cached as None so they are not re-queried
+                self._entries[doctor_id] = (expires, doctors.get(doctor_id))
+
+    def _fetch(self, doctor_ids):
+        docs = doctors_collection.find({"doctor_id": {"$in": list(doctor_ids)}}, DOCTOR_PROJECTION)
+        return {doc["doctor_id"]: doc for doc in docs}
+
+    async def get_many(self, doctor_ids):
+        """Map doctor_id -> doctor for every id (None when unknown), one $in query for misses."""
+        doctor_ids = list(dict.fromkeys(doctor_ids))
+        found, missing = self._cached(doctor_ids)
+        if missing:
+            fetched = await run_db(self._fetch, missing)
+            self._store(missing, fetched)
+            for doctor_id in missing:
+                found[doctor_id] = fetched.get(doctor_id)
+        return found
+
+    async def get(self, doctor_id):
+        return (await self.get_many([doctor_id]))[doctor_id]
+
+    async def all(self):
+        """Whole directory, loaded with a single query per TTL window."""
+        with self._lock:
+            if self._all is not None and self._all_expires > time.monotonic():
+                self.hits += 1
+                return self._all
+            self.misses += 1
+        doctors = await run_db(lambda: list(doctors_collection.find({}, DOCTOR_PROJECTION)))
+        by_id = {doc["doctor_id"]: doc for doc in doctors if doc.get("doctor_id") is not None}
+        self._store(by_id.keys(), by_id)
+        with self._lock:
+            self._all = doctors
+            self._all_expires = time.monotonic() + self.ttl
+        return doctors
+
+    def invalidate(self, doctor_id=None):
+        """Drop one doctor (or everything) so the next lookup hits the database."""
+        with self._lock:
+            if doctor_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(doctor_id, None)
+            self._all = None
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "ttl_s": self.ttl}
+
+
+doctor_directory = DoctorDirectory()
@@ -1,35 +1,96 @@
 import os
 import datetime
+import threading
+
+import httplib2
+from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from utils.metrics import instrument
 
 # Scopes for accessing calendar events and creating meet links
 SCOPES = ['https://www.googleapis.com/auth/calendar.events']
+TOKEN_PATH = 'token.json'
 
-def get_calendar_service():
-    """Authorize and return the Google Calendar service."""
-    creds = None
-    token_path = 'token.json'
+# Refresh the access token this long before it expires
+CALENDAR_REFRESH_MARGIN = int(os.getenv("CALENDAR_REFRESH_MARGIN", "300"))
+CALENDAR_TIMEOUT = float(os.getenv("CALENDAR_TIMEOUT", "30"))
+CALENDAR_NUM_RETRIES = int(os.getenv("CALENDAR_NUM_RETRIES", "2"))
+# Google batch requests accept at most 50 calls each
+CALENDAR_BATCH_SIZE = min(int(os.getenv("CALENDAR_BATCH_SIZE", "50")), 50)
+
+_lock = threading.Lock()
+_creds = None
+_service = None
+# httplib2 connections are not thread-safe: one authorized Http per thread
+_local = threading.local()
 
+
+def _load_credentials():
     # Load token if it exists
-    if os.path.exists(token_path):
-        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-    else:
-        # First-time login: trigger browser-based OAuth flow
-        flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-        creds = flow.run_local_server(port=8000, redirect_uri_trailing_slash=False)
-        with open(token_path, 'w') as token:
-            token.write(creds.to_json())
+    if os.path.exists(TOKEN_PATH):
+        return Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
+    # First-time login: trigger browser-based OAuth flow
+    flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+    creds = flow.run_local_server(port=8000, redirect_uri_trailing_slash=False)
+    with open(TOKEN_PATH, 'w') as token:
+        token.write(creds.to_json())
+    return creds
 
-    service = build('calendar', 'v3', credentials=creds)
-    return service
 
+def _needs_refresh(creds):
+    if not creds.valid:
+        return True
+    if creds.expiry is None:
+        return False
+    margin = datetime.timedelta(seconds=CALENDAR_REFRESH_MARGIN)
+    return creds.expiry - margin <= datetime.datetime.utcnow()
 
-def create_google_meet_event(summary, description, start_time, end_time, timezone='Asia/Kolkata'):
-    """Create a Google Calendar event with a Google Meet link."""
-    service = get_calendar_service()
 
+def get_credentials():
+    """Cached OAuth credentials, refreshed (and saved) shortly before they expire."""
+    global _creds
+    with _lock:
+        if _creds is None:
+            _creds = _load_credentials()
+        if _creds.refresh_token and _needs_refresh(_creds):
+            _creds.refresh(Request())
+            with open(TOKEN_PATH, 'w') as token:
+                token.write(_creds.to_json())
+            print("✅ Google Calendar credentials refreshed")
+        return _creds
+
+
+def get_calendar_service():
+    """Authorize and return the Google Calendar service (built once per process)."""
+    global _service
+    creds = get_credentials()
+    with _lock:
+        if _service is None:
+            # The bundled discovery document avoids a network fetch
+            _service = build('calendar', 'v3', credentials=creds, static_discovery=True)
+        return _service
+
+
+def _thread_http():
+    http = getattr(_local, "http", None)
+    if http is None:
+        http = AuthorizedHttp(get_credentials(), http=httplib2.Http(timeout=CALENDAR_TIMEOUT))
+        _local.http = http
+    return http
+
+
+def _execute(request):
+    """Run a built API request on this thread's connection with fresh credentials."""
+    get_credentials()
+    return request.execute(http=_thread_http(), num_retries=CALENDAR_NUM_RETRIES)
+
+
+def _event_body(summary, description, start_time, end_time, timezone='Asia/Kolkata', event_id=None):
     event = {
         'summary': summary,
         'description': description,
@@ -43,18 +104,88 @@ def create_google_meet_event(summary, description, start_time, end_time, timezon
         },
         'conferenceData': {
             'createRequest': {
-                'requestId': f"meet-{datetime.datetime.utcnow().timestamp()}",
+                'requestId': f"meet-{event_id or datetime.datetime.utcnow().timestamp()}",
                 'conferenceSolutionKey': {
                     'type': 'hangoutsMeet'
                 }
             }
         }
     }
+    if event_id:
+        event['id'] = event_id
+    return event
+
 
-    event_result = service.events().insert(
-        calendarId='primary',
-        body=event,
-        conferenceDataVersion=1
-    ).execute()
+@instrument("google_calendar")
+def create_google_meet_event(summary, description, start_time, end_time, timezone='Asia/Kolkata', event_id=None):
+    """Create a Google Calendar event with a Google Meet link.
+
+    Pass a stable event_id (base32hex, e.g. a uuid hex) to make retries safe:
+    if the event already exists its Meet link is returned instead.
+    """
+    service = get_calendar_service()
+    event = _event_body(summary, description, start_time, end_time, timezone, event_id)
+
+    try:
+        event_result = _execute(service.events().insert(
+            calendarId='primary',
+            body=event,
+            conferenceDataVersion=1
+        ))
+    except HttpError as e:
+        # 409: an earlier attempt already created this event
+        if not event_id or e.resp.status != 409:
+            raise
+        event_result = _execute(service.events().get(calendarId='primary', eventId=event_id))
 
     return event_result.get('hangoutLink')
+
+
+@instrument("google_calendar")
+def create_google_meet_events(events):
+    """Create many Meet events with batch HTTP requests (up to 50 events per request).
+
+    events is a list of create_google_meet_event keyword dicts. Returns one
+    entry per event, in order: the Meet link, or the exception for that event.
+    """
+    service = get_calendar_service()
+    results = [None] * len(events)
+    # Indexes of the current batch whose event already exists (HTTP 409)
+    duplicates = []
+
+    def callback(request_id, response, exception):
+        index = int(request_id)
+        if exception is None:
+            results[index] = response.get('hangoutLink')
+        elif isinstance(exception, HttpError) and exception.resp.status == 409 and events[index].get('event_id'):
+            results[index] = exception
+            duplicates.append(index)
+        else:
+            results[index] = exception
+
+    for start in range(0, len(events), CALENDAR_BATCH_SIZE):
+        duplicates.clear()
+        batch = service.new_batch_http_request(callback=callback)
+        for index in range(start, min(start + CALENDAR_BATCH_SIZE, len(events))):
+            batch.add(
+                service.events().insert(
+                    calendarId='primary',
+                    body=_event_body(**events[index]),
+                    conferenceDataVersion=1
+                ),
+                request_id=str(index)
+            )
+        get_credentials()
+        batch.execute(http=_thread_http())
+
+        # Events created by an earlier attempt: read back their Meet links
+        for index in duplicates:
+            try:
+                results[index] = _execute(
+                    service.events().get(calendarId='primary', eventId=events[index]['event_id'])
+                ).get('hangoutLink')
+            except Exception as e:
+                results[index] = e
+
+    return results
+
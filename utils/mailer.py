@@ -0,0 +1,188 @@
+import asyncio
+import os
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import Future
+
+from dotenv import load_dotenv
+
+from utils.metrics import LatencyWindow
+
+load_dotenv()
+
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
+EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+
+# Authenticated SMTP sessions kept open (one per sender thread)
+MAILER_SESSIONS = int(os.getenv("MAILER_SESSIONS", "2"))
+# Messages sent back-to-back over one session before picking up the queue again
+MAILER_BATCH_SIZE = int(os.getenv("MAILER_BATCH_SIZE", "20"))
+MAILER_TIMEOUT = float(os.getenv("MAILER_TIMEOUT", "30"))
+# Sessions idle longer than this are checked with NOOP before reuse
+MAILER_IDLE_CHECK = float(os.getenv("MAILER_IDLE_CHECK", "60"))
+
+
+def _is_connection_error(e):
+    """Server hung up or the socket broke (as opposed to the server rejecting one message)."""
+    if isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    return isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+
+
+class _Session:
+    """One persistent, logged-in SMTP connection owned by a single sender thread."""
+
+    def __init__(self, mailer):
+        self.mailer = mailer
+        self.smtp = None
+        self.last_used = 0.0
+
+    def connect(self):
+        self.close()
+        smtp = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=MAILER_TIMEOUT)
+        smtp.starttls()
+        smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+        self.mailer._count("connects")
+
+    def ensure(self):
+        if self.smtp is None:
+            self.connect()
+        elif time.monotonic() - self.last_used > MAILER_IDLE_CHECK:
+            try:
+                healthy = self.smtp.noop()[0] == 250
+            except Exception:
+                healthy = False
+            if not healthy:
+                self.mailer._count("reconnects")
+                self.connect()
+
+    def send(self, from_addr, to_addrs, text):
+        self.ensure()
+        try:
+            self.smtp.sendmail(from_addr, to_addrs, text)
+        except Exception as e:
+            if not _is_connection_error(e):
+                raise
+            # Reconnect and retry the message once
+            self.mailer._count("reconnects")
+            self.connect()
+            self.smtp.sendmail(from_addr, to_addrs, text)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+
+class Mailer:
+    """Queue of outgoing emails delivered by a small pool of persistent SMTP sessions."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._latencies = LatencyWindow()
+        self._counts = {"sent": 0, "failed": 0, "batches": 0, "connects": 0, "reconnects": 0}
+        self._last_error = None
+
+    def _count(self, field, amount=1):
+        with self._lock:
+            self._counts[field] += amount
+
+    def _start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(MAILER_SESSIONS):
+                thread = threading.Thread(target=self._sender, name=f"mailer-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _next_batch(self):
+        """Block for one message, then take whatever else is already queued (up to the batch size)."""
+        batch = [self._queue.get()]
+        while len(batch) < MAILER_BATCH_SIZE and batch[-1] is not None:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _sender(self):
+        session = _Session(self)
+        while True:
+            batch = self._next_batch()
+            self._count("batches")
+            for item in batch:
+                if item is None:
+                    session.close()
+                    return
+                msg, future, queued_at = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    session.send(msg['From'], [msg['To']], msg.as_string())
+                except Exception as e:
+                    # Drop a broken session so the next message reconnects
+                    if _is_connection_error(e) or isinstance(e, smtplib.SMTPAuthenticationError):
+                        session.close()
+                    self._finish("failed", queued_at, f"{msg['To']}: {str(e)}")
+                    future.set_exception(e)
+                else:
+                    self._finish("sent", queued_at)
+                    future.set_result(True)
+
+    def _finish(self, outcome, queued_at, error=None):
+        with self._lock:
+            self._counts[outcome] += 1
+            self._latencies.add((time.monotonic() - queued_at) * 1000)
+            if error is not None:
+                self._last_error = error
+
+    def submit(self, msg):
+        """Queue a MIME message; returns a Future resolved once it was handed to the SMTP server."""
+        self._start()
+        future = Future()
+        self._queue.put((msg, future, time.monotonic()))
+        return future
+
+    async def send(self, msg):
+        """Queue a MIME message and await its delivery without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(msg))
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            last_error = self._last_error
+
+        return {
+            "queue_depth": self._queue.qsize(),
+            "sessions": len(self._threads),
+            "batch_size": MAILER_BATCH_SIZE,
+            **counts,
+            # Time from submit to the SMTP server accepting the message
+            "latency_ms": self._latencies.summary(),
+            "last_error": last_error,
+        }
+
+    def close(self):
+        """Let queued mail drain, then quit every session."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=MAILER_TIMEOUT)
+        self._threads = []
+
+
+mailer = Mailer()
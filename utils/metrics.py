@@ -0,0 +1,278 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Histogram upper bounds in seconds (the +Inf bucket is implicit)
+LATENCY_BUCKETS = tuple(
+    float(bound) for bound in os.getenv("METRICS_LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30").split(",")
+)
+
+# Route label for requests that matched no route (keeps label cardinality bounded)
+UNMATCHED_ROUTE = "unmatched"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class Histogram:
+    """Bucketed observations per label set; cumulative counts are built at scrape time."""
+
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values = {}
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for label_values, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        # Scrape-time gauges: fn() -> iterable of (label values, value)
+        self._gauges = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, description, labels, fn):
+        """Register a gauge whose samples are computed by fn when /metrics is scraped."""
+        self._gauges.append((name, description, labels, fn))
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for name, description, labels, fn in self._gauges:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} gauge")
+            for label_values, value in sorted(fn()):
+                lines.append(f"{name}{_labels(labels, label_values)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time from request start to the end of the response body", ("method", "route")
+)
+requests_total = registry.counter("http_requests_total", "Finished requests by status code", ("method", "route", "status"))
+outbound_duration = registry.histogram(
+    "outbound_call_duration_seconds", "Latency of calls to ADA, SMTP and Google Calendar", ("service", "call")
+)
+outbound_total = registry.counter("outbound_calls_total", "Outbound calls by outcome (ok or error)", ("service", "call", "outcome"))
+
+
+# ---------------- HTTP MIDDLEWARE ----------------
+
+# id(scope) -> scope of every request being handled; the route is read from it at scrape time
+_active = {}
+
+
+def route_label(scope):
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+def _in_progress():
+    counts = {}
+    for scope in list(_active.values()):
+        # Not routed yet: the router has not matched it (or it is still in the middleware stack)
+        key = (scope["method"], route_label(scope) if "route" in scope else "routing")
+        counts[key] = counts.get(key, 0) + 1
+    return counts.items()
+
+
+registry.gauge("http_requests_in_progress", "Requests currently being handled", ("method", "route"), _in_progress)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route latency, status codes and in-flight requests.
+
+    Routes are labelled with their path template (e.g. /api/patient/dashboard/{patientid}),
+    which FastAPI stores in the scope once the request is routed.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        _active[id(scope)] = scope
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _active.pop(id(scope), None)
+            route = route_label(scope)
+            request_duration.observe(time.perf_counter() - started, scope["method"], route)
+            requests_total.inc(scope["method"], route, str(status))
+
+
+# ---------------- ROLLING LATENCY ----------------
+
+# Latency percentiles are computed over this many recent calls
+LATENCY_WINDOW = 1000
+
+
+class LatencyWindow:
+    """Latencies (ms) of the last LATENCY_WINDOW calls, summarized for the clients' stats endpoints."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=size)
+
+    def add(self, milliseconds: float):
+        with self._lock:
+            self._latencies.append(milliseconds)
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return {"window": 0, "avg": None, "p50": None, "p95": None, "max": None}
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))], 2)
+
+        return {
+            "window": len(latencies),
+            "avg": round(sum(latencies) / len(latencies), 2),
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "max": round(latencies[-1], 2),
+        }
+
+
+# ---------------- OUTBOUND CALLS ----------------
+
+def instrument(service: str, call: str = None, ok=None):
+    """Decorator timing a (sync or async) outbound call.
+
+    ok(result) decides whether a returned value counts as a success (for
+    functions that report failure by returning False/None); exceptions are
+    always errors and are re-raised.
+    """
+    def decorator(fn):
+        name = call or fn.__name__
+
+        def record(started, success):
+            outbound_duration.observe(time.perf_counter() - started, service, name)
+            outbound_total.inc(service, name, "ok" if success else "error")
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except BaseException:
+                    record(started, False)
+                    raise
+                record(started, ok is None or ok(result))
+                return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                record(started, False)
+                raise
+            record(started, ok is None or ok(result))
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,245 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from utils.db import run_db, outbox_collection
+
+load_dotenv()
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "30"))
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+# job kind -> handler(job) returning a result dict (blocking, or a coroutine function)
+_handlers = {}
+_workers = []
+_wakeup = None
+
+
+def register_handler(kind: str):
+    """Decorator registering the function that processes jobs of one kind."""
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+# ---------------- JOB DOCUMENTS ----------------
+
+def new_job(kind: str, payload: dict, job_id: str = None, run_at: datetime = None):
+    """Build a pending job document; its _id doubles as the public job id.
+
+    Pass run_at to delay the first attempt, and a deterministic job_id to
+    enqueue it with enqueue_once.
+    """
+    now = _now()
+    return {
+        "_id": job_id or uuid.uuid4().hex,
+        "kind": kind,
+        "payload": payload,
+        "status": STATUS_PENDING,
+        "attempts": 0,
+        "steps": {},
+        "result": None,
+        "last_error": None,
+        "next_attempt_at": run_at or now,
+        "lease_until": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def enqueue(job: dict, session=None):
+    """Store a job, inside the caller's transaction when a session is given."""
+    outbox_collection.insert_one(job, session=session)
+    return job["_id"]
+
+
+def enqueue_once(job: dict):
+    """Store a job unless one with its _id exists already; returns True when stored."""
+    try:
+        outbox_collection.insert_one(job)
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def enqueue_many(jobs: list, session=None):
+    if jobs:
+        outbox_collection.insert_many(jobs, ordered=False, session=session)
+    return [job["_id"] for job in jobs]
+
+
+def notify():
+    """Wake idle workers after a job was committed."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def claim_job():
+    """Atomically lease the next due job (or one whose worker died), or return None."""
+    now = _now()
+    return outbox_collection.find_one_and_update(
+        {"$or": [
+            {"status": STATUS_PENDING, "next_attempt_at": {"$lte": now}},
+            {"status": STATUS_RUNNING, "lease_until": {"$lt": now}},
+        ]},
+        {
+            "$set": {
+                "status": STATUS_RUNNING,
+                "lease_until": _lease_until(now),
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("next_attempt_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+class LeaseLost(RuntimeError):
+    """The job's lease expired and another worker claimed it; stop working on it."""
+
+
+def _lease_until(now):
+    return now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+
+
+def _update_leased(job: dict, fields: dict):
+    # Matching on attempts ignores a worker whose lease was taken over
+    now = _now()
+    result = outbox_collection.update_one(
+        {"_id": job["_id"], "attempts": job["attempts"]},
+        {"$set": {**fields, "lease_until": _lease_until(now), "updated_at": now}}
+    )
+    if result.matched_count == 0:
+        raise LeaseLost(f"Outbox job {job['_id']} was claimed by another worker")
+
+
+def renew_lease(job: dict):
+    """Extend the job's lease by OUTBOX_LEASE_SECONDS (call between long steps)."""
+    _update_leased(job, {})
+
+
+def save_step(job: dict, name: str, value):
+    """Record a finished step so a retried job skips it, and renew the lease."""
+    _update_leased(job, {f"steps.{name}": value})
+
+
+def _complete(job: dict, result):
+    # Matching on attempts ignores a worker whose lease was taken over
+    outbox_collection.update_one(
+        {"_id": job["_id"], "attempts": job["attempts"]},
+        {"$set": {
+            "status": STATUS_SUCCEEDED,
+            "result": result,
+            "last_error": None,
+            "lease_until": None,
+            "updated_at": _now(),
+        }}
+    )
+
+
+def _fail(job: dict, error: str, retry: bool = True):
+    """Schedule a retry with exponential backoff, or give up after the last attempt."""
+    now = _now()
+    fields = {"last_error": error, "lease_until": None, "updated_at": now}
+    if retry and job["attempts"] < OUTBOX_MAX_ATTEMPTS:
+        delay = OUTBOX_RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1)
+        fields.update(status=STATUS_PENDING, next_attempt_at=now + timedelta(seconds=delay))
+    else:
+        fields["status"] = STATUS_FAILED
+    outbox_collection.update_one({"_id": job["_id"], "attempts": job["attempts"]}, {"$set": fields})
+    return fields["status"]
+
+
+def get_job(job_id: str):
+    """Public status of a job, or None if it does not exist."""
+    job = outbox_collection.find_one({"_id": job_id}, {"payload": 0, "lease_until": 0})
+    if not job:
+        return None
+    job["job_id"] = job.pop("_id")
+    job["max_attempts"] = OUTBOX_MAX_ATTEMPTS
+    return job
+
+
+# ---------------- WORKERS ----------------
+
+async def process_job(job: dict):
+    handler = _handlers.get(job["kind"])
+    if handler is None:
+        await run_db(_fail, job, f"No handler registered for job kind '{job['kind']}'", retry=False)
+        print(f"❌ Outbox job {job['_id']} has unknown kind {job['kind']}")
+        return
+
+    try:
+        if asyncio.iscoroutinefunction(handler):
+            result = await handler(job)
+        else:
+            # Handlers make blocking third-party calls; keep them off the DB thread pool
+            result = await asyncio.get_running_loop().run_in_executor(None, handler, job)
+    except LeaseLost as e:
+        print(f"⚠️ {str(e)}; attempt {job['attempts']} stopped")
+        return
+    except Exception as e:
+        status = await run_db(_fail, job, str(e))
+        icon = "❌" if status == STATUS_FAILED else "⚠️"
+        print(f"{icon} Outbox job {job['_id']} ({job['kind']}) attempt {job['attempts']} failed: {str(e)}")
+        return
+
+    await run_db(_complete, job, result)
+    print(f"✅ Outbox job {job['_id']} ({job['kind']}) completed")
+
+
+async def _wait_for_work():
+    try:
+        await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_INTERVAL)
+    except asyncio.TimeoutError:
+        pass
+    _wakeup.clear()
+
+
+async def _worker_loop():
+    while True:
+        try:
+            job = await run_db(claim_job)
+            if job is None:
+                await _wait_for_work()
+                continue
+            await process_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Outbox worker error: {str(e)}")
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+def start_workers():
+    """Start the outbox workers on the running event loop (OUTBOX_WORKERS=0 disables them)."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    for _ in range(OUTBOX_WORKERS):
+        _workers.append(asyncio.create_task(_worker_loop()))
+
+
+async def stop_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
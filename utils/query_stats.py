@@ -0,0 +1,164 @@
+import contextvars
+import os
+import threading
+
+import bson
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+from utils.metrics import registry, route_label
+
+load_dotenv()
+
+# Requests issuing more MongoDB commands than this are logged (likely N+1 loops)
+DB_QUERY_BUDGET = int(os.getenv("DB_QUERY_BUDGET", "25"))
+# Adds X-DB-* response headers and counts reply bytes (re-encodes every reply: keep it off in production)
+DB_QUERY_DEBUG = os.getenv("DB_QUERY_DEBUG", "false").lower() in ("1", "true", "yes")
+
+# Driver handshakes and session bookkeeping are not queries issued by a handler
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart", "saslContinue", "buildInfo"}
+
+
+class QueryStats:
+    """MongoDB commands issued while handling one request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.documents = 0
+        self.bytes = 0
+        self.duration_us = 0
+        # (command, collection) -> count, to point at the loop behind an N+1
+        self.by_target = {}
+
+    def add(self, command: str, target, duration_us: int, documents: int = 0, size: int = 0):
+        with self._lock:
+            self.queries += 1
+            self.documents += documents
+            self.bytes += size
+            self.duration_us += duration_us
+            key = (command, target)
+            self.by_target[key] = self.by_target.get(key, 0) + 1
+
+    def headers(self):
+        return [
+            (b"x-db-queries", str(self.queries).encode()),
+            (b"x-db-documents", str(self.documents).encode()),
+            (b"x-db-bytes", str(self.bytes).encode()),
+            (b"x-db-time-ms", f"{self.duration_us / 1000:.2f}".encode()),
+        ]
+
+    def top_targets(self, n=3):
+        with self._lock:
+            targets = sorted(self.by_target.items(), key=lambda item: item[1], reverse=True)[:n]
+        return ", ".join(f"{command} {target} x{count}" for (command, target), count in targets)
+
+
+# Stats of the request being handled; run_db copies the context into its worker thread
+_current = contextvars.ContextVar("query_stats", default=None)
+
+
+def _returned_documents(reply: dict):
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    if reply.get("value") is not None:
+        # findAndModify
+        return 1
+    return 0
+
+
+class _Targets(threading.local):
+    """Per-thread request_id -> collection map between started and succeeded events."""
+
+    def __init__(self):
+        self.pending = {}
+
+
+_targets = _Targets()
+
+
+def _target(event):
+    # getMore names its collection separately; other commands name it as their value
+    if event.command_name == "getMore":
+        return event.command.get("collection")
+    return event.command.get(event.command_name)
+
+
+class QueryListener(monitoring.CommandListener):
+    """Attribute every command to the request (if any) whose context issued it."""
+
+    def started(self, event):
+        # The command's target is only in the started event; keep it for the reply
+        stats = _current.get()
+        if stats is not None and event.command_name not in IGNORED_COMMANDS:
+            _targets.pending[event.request_id] = _target(event)
+
+    def succeeded(self, event):
+        stats = _current.get()
+        if stats is None or event.command_name in IGNORED_COMMANDS:
+            return
+        reply = event.reply
+        stats.add(
+            event.command_name,
+            _targets.pending.pop(event.request_id, None),
+            event.duration_micros,
+            _returned_documents(reply),
+            len(bson.encode(reply)) if DB_QUERY_DEBUG else 0,
+        )
+
+    def failed(self, event):
+        stats = _current.get()
+        if stats is None or event.command_name in IGNORED_COMMANDS:
+            return
+        stats.add(event.command_name, _targets.pending.pop(event.request_id, None), event.duration_micros)
+
+
+query_listener = QueryListener()
+
+
+# ---------------- MIDDLEWARE ----------------
+
+queries_per_request = registry.histogram(
+    "db_queries_per_request", "MongoDB commands issued per request", ("method", "route"),
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+requests_over_budget = registry.counter(
+    "db_requests_over_query_budget_total", "Requests issuing more than DB_QUERY_BUDGET commands", ("method", "route")
+)
+
+
+class QueryStatsMiddleware:
+    """Pure ASGI middleware collecting per-request MongoDB command stats.
+
+    Requests over DB_QUERY_BUDGET are logged with their most repeated
+    commands; with DB_QUERY_DEBUG the totals are also sent as X-DB-* headers
+    (as counted when the response starts, so streamed bodies are not included).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_wrapper(message):
+            if DB_QUERY_DEBUG and message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + stats.headers()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = route_label(scope)
+            queries_per_request.observe(stats.queries, scope["method"], route)
+            if stats.queries > DB_QUERY_BUDGET:
+                requests_over_budget.inc(scope["method"], route)
+                print(f"⚠️ {scope['method']} {scope['path']} issued {stats.queries} MongoDB queries "
+                      f"(budget {DB_QUERY_BUDGET}): {stats.top_targets()}")
@@ -0,0 +1,49 @@
+from decimal import Decimal
+
+import orjson
+from bson import ObjectId, Decimal128
+from bson.timestamp import Timestamp
+from fastapi.encoders import ENCODERS_BY_TYPE
+from fastapi.responses import JSONResponse
+
+# datetime, date, UUID, dataclasses and numpy values are encoded by orjson itself
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _decimal(value: Decimal):
+    # Same shape as FastAPI's encoder: whole numbers stay ints
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def bson_default(value):
+    """Encode the BSON types orjson does not know about."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return _decimal(value.to_decimal())
+    if isinstance(value, Decimal):
+        return _decimal(value)
+    if isinstance(value, Timestamp):
+        return value.as_datetime().isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def dumps(content) -> bytes:
+    """Serialize Mongo documents (ObjectId, datetimes, Decimal128, ...) to JSON bytes."""
+    return orjson.dumps(content, default=bson_default, option=ORJSON_OPTIONS)
+
+
+class MongoJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, accepting raw Mongo documents."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+# Dicts returned from handlers pass through FastAPI's jsonable_encoder before the
+# response class; teach it the BSON types so they no longer fail there either
+ENCODERS_BY_TYPE[ObjectId] = str
+ENCODERS_BY_TYPE[Decimal128] = lambda value: _decimal(value.to_decimal())
+ENCODERS_BY_TYPE[Timestamp] = lambda value: value.as_datetime().isoformat()